@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+import uuid
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_catalogue(num_files, names, seed=42):
+    # files with one to three replicas on three grid rses, like generate_grid_data;
+    # only uses the api that the catalogue had before the compact representation
+    from gacs import grid
+    from gacs.common import utils
+
+    rng = random.Random(seed)
+    rucio = grid.Rucio()
+    rses = [grid.Site('SITE{}'.format(i), []).create_rse('RSE{}'.format(i)) for i in range(3)]
+    for rse_obj in rses:
+        rucio.add_rse(rse_obj)
+    for _ in range(num_files):
+        if names == 'uuid':
+            name = str(uuid.uuid4())
+        else:
+            name = utils.next_id()
+        size = rng.randint(2**28, 2**31)
+        file_obj = rucio.create_file(name, size, rng.randint(0, 7 * 24 * 3600))
+        for rse_obj in rng.sample(rses, rng.choice([1, 1, 2, 2, 3])):
+            rucio.create_replica(file_obj, rse_obj)
+            rse_obj.increase_replica(file_obj, 0, size)
+    return rucio
+
+
+def measure_bytes_per_file(num_files, names):
+    from gacs.common import utils
+
+    utils.setup_utils()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rucio = build_catalogue(num_files, names)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(rucio.file_list) == num_files
+    return (after - before) / num_files
+
+
+def measure_revision(revision, num_files, names):
+    # measures the gacs package of a git revision in a fresh interpreter, e.g.
+    # the baseline representation before the File and Replica slots
+    with tempfile.TemporaryDirectory() as package_dir:
+        archive = subprocess.run(['git', 'archive', revision, 'gacs'], cwd=REPO_DIR, stdout=subprocess.PIPE, check=True)
+        subprocess.run(['tar', '-x', '-C', package_dir], input=archive.stdout, check=True)
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '-n', str(num_files), '--names', names,
+                                 '--package-dir', package_dir], stdout=subprocess.PIPE, check=True)
+    return float(output.stdout.split()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measures the memory used per file of the Rucio catalogue.')
+    parser.add_argument('-n', '--num-files', type=int, default=100000)
+    parser.add_argument('--names', choices=['int', 'uuid'], default='int', help='file names as interned integer ids or uuid4 strings')
+    parser.add_argument('--revision', help='measure the gacs package of this git revision instead of the working tree')
+    parser.add_argument('--package-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.revision:
+        bytes_per_file = measure_revision(args.revision, args.num_files, args.names)
+        print('{:,d} files: {:,.0f} bytes per file ({} names, {})'.format(args.num_files, bytes_per_file, args.names, args.revision))
+        return
+    sys.path.insert(0, args.package_dir or REPO_DIR)
+    bytes_per_file = measure_bytes_per_file(args.num_files, args.names)
+    if args.package_dir:
+        # read by measure_revision()
+        print(bytes_per_file)
+        return
+    print('{:,d} files: {:,.0f} bytes per file ({} names)'.format(args.num_files, bytes_per_file, args.names))
+
+
+if __name__ == '__main__':
+    main()
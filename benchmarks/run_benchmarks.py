@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import bench_memory
+import sim as cloudsim
+from gacs import abstractions, grid
+from gacs.clouds import gcp
+from gacs.common import monitoring, utils
+
+
+DAY = 24 * 3600
+
+
+def make_grid_rucio(num_files, num_rses=3, seed=42):
+    # complete files with random die times within 10 days on num_rses grid rses
+    utils.setup_utils()
+    monitoring.init()
+    rng = np.random.default_rng(seed)
+    rucio = grid.Rucio()
+    for idx in range(num_rses):
+        rucio.add_rse(grid.Site('SITE{}'.format(idx), []).create_rse('RSE{}'.format(idx)))
+    sizes = rng.integers(2**28, 2**31, num_files)
+    die_times = rng.integers(0, 10 * DAY, num_files)
+    replica_masks = rng.random((num_files, num_rses)) < 0.5
+    replica_masks[np.arange(num_files), rng.integers(0, num_rses, num_files)] = True
+    rucio.create_files_bulk(sizes, die_times, replica_masks)
+    return rucio
+
+
+def make_transfers(num_transfers, num_links=8):
+    # num_transfers begun transfers of large files from one grid rse over one linkselector
+    rucio = make_grid_rucio(num_transfers, num_rses=1)
+    src_rse = rucio.rse_list[0]
+    dst_rse = grid.Site('DST', []).create_rse('DST_RSE')
+    rucio.add_rse(dst_rse)
+    linkselector = src_rse.site_obj.create_linkselector(dst_rse.site_obj)
+    for _ in range(num_links):
+        linkselector.create_link(2**30)
+    transfers = []
+    for file_obj in rucio.file_list:
+        transfer = rucio.create_transfer(file_obj, src_rse, dst_rse)
+        transfer.begin(1)
+        transfers.append(transfer)
+    return transfers
+
+
+def setup_reaper(num_files):
+    return make_grid_rucio(num_files)
+
+
+def run_reaper(rucio):
+    # deletes the files that died within the first day (about 10%)
+    rucio.run_reaper(DAY)
+
+
+def setup_transfer_update(num_transfers):
+    return make_transfers(num_transfers)
+
+
+def run_transfer_update(transfers):
+    for transfer in transfers:
+        transfer.update(11)
+
+
+def setup_transfer_table_update(num_transfers):
+    table = abstractions.TransferTable()
+    for transfer in make_transfers(num_transfers):
+        table.add(transfer)
+    return table
+
+
+def run_transfer_table_update(table):
+    table.update(11)
+
+
+SELECT_LINK_OPS = 100000
+
+
+def setup_select_link(num_links):
+    utils.setup_utils()
+    linkselector = abstractions.LinkSelector(None, None)
+    for idx in range(num_links):
+        linkselector.create_link(2**27 + idx * 2**20)
+    return linkselector
+
+
+def run_select_link(linkselector):
+    # a transfer starting and a random one ending, like in steady state
+    links = [linkselector.alloc_link() for _ in range(len(linkselector.link_list))]
+    for _ in range(SELECT_LINK_OPS):
+        links.append(linkselector.alloc_link())
+        linkselector.free_link(links.pop(0))
+
+
+def setup_storage_billing(num_events):
+    utils.setup_utils()
+    monitoring.init()
+    region = gcp.Region('region', 'Region', ['region'], 0.02, 'SKU')
+    bucket = region.create_rse('bucket', gcp.Bucket.TYPE_REGIONAL)
+    return bucket, num_events
+
+
+def run_storage_billing(state):
+    bucket, num_events = state
+    for event_nr in range(num_events):
+        bucket.increase_storage(event_nr * 0.5, 2**20)
+    bucket.process_storage_billing(num_events * 0.5)
+
+
+def setup_generate_grid_data(num_calls):
+    cloud_sim = cloudsim.create_simulator(log_level=logging.WARNING)
+    cloud_sim.init_simulation()
+    return cloud_sim, num_calls
+
+
+def run_generate_grid_data(state):
+    # hourly calls like the data generation process
+    cloud_sim, num_calls = state
+    for hour in range(num_calls):
+        cloud_sim.generate_grid_data(hour * 3600)
+
+
+def setup_end_to_end(sim_days):
+    cloud_sim = cloudsim.create_simulator({'SIM_DURATION': int(sim_days * DAY) + 1, 'SEED': 42}, log_level=logging.WARNING)
+    cloud_sim.init_simulation()
+    return cloud_sim
+
+
+def run_end_to_end(cloud_sim):
+    cloud_sim.simulate()
+
+
+# name, parameter name, parameter values (default, quick, large), setup, run, max repeat
+BENCHMARKS = [
+    ('reaper', 'num_files', ([10**4, 10**5, 10**6], [10**4, 10**5], [10**7]), setup_reaper, run_reaper, 5),
+    ('transfer_update', 'num_transfers', ([10**3, 10**4, 10**5], [10**3, 10**4], []), setup_transfer_update, run_transfer_update, 5),
+    ('transfer_table_update', 'num_transfers', ([10**3, 10**4, 10**5], [10**3, 10**4], []), setup_transfer_table_update, run_transfer_table_update, 5),
+    ('select_link', 'num_links', ([1, 4, 16, 64, 256], [1, 16, 256], []), setup_select_link, run_select_link, 5),
+    ('storage_billing', 'num_events', ([10**6], [10**5], []), setup_storage_billing, run_storage_billing, 5),
+    ('generate_grid_data', 'num_calls', ([24], [24], []), setup_generate_grid_data, run_generate_grid_data, 5),
+    ('end_to_end', 'sim_days', ([7], [1], []), setup_end_to_end, run_end_to_end, 1),
+]
+
+
+# sharded runs of the synthetic workload, messages take effect after one transfer generation interval
+SHARDING_OVERRIDES = {'SEED': 42, 'SHARD_LOOKAHEAD': 30}
+# shard counts (default, quick, large) and simulated days (default, quick)
+SHARDING_SHARDS = ([2, 3, 6], [2, 3], [9, 18])
+SHARDING_DAYS = (1, 0.25)
+
+
+def measure_sharding(num_shards_list, sim_days):
+    # The wall time of a single process run, including its setup, is compared
+    # with the wall time of the sharded runs, which includes starting the
+    # workers and the communication. The critical path is reported too: the
+    # cpu seconds of the slowest shard of every synchronization round, summed.
+    # It leaves out the communication and is the lower bound of the wall time
+    # on one core per shard, also on a machine with fewer cores.
+    overrides = dict(SHARDING_OVERRIDES, SIM_DURATION=int(sim_days * DAY) + 1)
+    wall_time = time.perf_counter()
+    cpu_time = time.process_time()
+    cloud_sim = cloudsim.create_simulator(overrides, log_level=logging.WARNING)
+    cloud_sim.init_simulation()
+    cloud_sim.simulate()
+    cpu_time = time.process_time() - cpu_time
+    single_wall_time = time.perf_counter() - wall_time
+    result = make_result('sharding', {'num_shards': 1, 'sim_days': sim_days}, 's', [single_wall_time])
+    result['cpu_time'] = cpu_time
+    results = [result]
+    print('{:<22} {:<24} wall {:10.4f}s  cpu {:10.4f}s'.format('sharding', 'num_shards=1', single_wall_time, cpu_time))
+    for num_shards in num_shards_list:
+        wall_time = time.perf_counter()
+        stats = cloudsim.run_sharded_simulation(num_shards, overrides, logging.WARNING)['sharding']
+        wall_time = time.perf_counter() - wall_time
+        result = make_result('sharding', {'num_shards': num_shards, 'sim_days': sim_days}, 's', [wall_time])
+        result['speedup'] = single_wall_time / wall_time
+        result['critical_path'] = stats['critical_path']
+        result['critical_path_speedup'] = cpu_time / stats['critical_path']
+        result['num_rounds'] = stats['num_rounds']
+        results.append(result)
+        print('{:<22} {:<24} wall {:10.4f}s  speedup {:5.2f}x  critical path {:10.4f}s ({:5.2f}x)  rounds {}'.format(
+            'sharding', 'num_shards={}'.format(num_shards), wall_time, result['speedup'], stats['critical_path'],
+            result['critical_path_speedup'], stats['num_rounds']))
+    return results
+
+
+def measure(setup, run, param, repeat):
+    # wall times of repeat runs; the setup is not timed
+    times = []
+    for _ in range(repeat):
+        state = setup(param)
+        t1 = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - t1)
+    return times
+
+
+def make_result(name, params, unit, values):
+    return {'name': name,
+            'params': params,
+            'unit': unit,
+            'values': values,
+            'min': min(values),
+            'median': statistics.median(values),
+            'mean': statistics.mean(values)}
+
+
+def get_metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform()}
+
+
+def run_benchmarks(selected=None, quick=False, large=False, repeat=5):
+    results = []
+    for name, param_name, (default_values, quick_values, large_values), setup, run, max_repeat in BENCHMARKS:
+        if selected and name not in selected:
+            continue
+        values = quick_values if quick else default_values
+        if large:
+            values = values + large_values
+        for value in values:
+            times = measure(setup, run, value, min(repeat, max_repeat))
+            result = make_result(name, {param_name: value}, 's', times)
+            results.append(result)
+            print('{:<22} {:<24} min {:10.4f}s  median {:10.4f}s'.format(name, '{}={}'.format(param_name, value),
+                                                                      result['min'], result['median']))
+
+    if not selected or 'memory' in selected:
+        num_files = 10**4 if quick else 10**5
+        bytes_per_file = bench_memory.measure_bytes_per_file(num_files, 'int')
+        results.append(make_result('memory', {'num_files': num_files}, 'bytes/file', [bytes_per_file]))
+        print('{:<22} {:<24} {:,.0f} bytes per file'.format('memory', 'num_files={}'.format(num_files), bytes_per_file))
+
+    if not selected or 'sharding' in selected:
+        num_shards_list = SHARDING_SHARDS[1] if quick else SHARDING_SHARDS[0]
+        if large:
+            num_shards_list = num_shards_list + SHARDING_SHARDS[2]
+        results.extend(measure_sharding(num_shards_list, SHARDING_DAYS[1] if quick else SHARDING_DAYS[0]))
+    return results
+
+
+def get_key(result):
+    return result['name'], json.dumps(result['params'], sort_keys=True)
+
+
+def compare(results, baseline, threshold):
+    # results whose minimum grew by more than threshold relative to the baseline
+    baseline_by_key = {get_key(result): result for result in baseline['benchmarks']}
+    regressions = []
+    for result in results:
+        old = baseline_by_key.get(get_key(result))
+        if old is None or old['min'] <= 0:
+            continue
+        ratio = result['min'] / old['min']
+        marker = ''
+        if ratio > 1 + threshold:
+            regressions.append(result)
+            marker = '  REGRESSION'
+        print('{:<22} {:<24} {:6.2f}x{}'.format(result['name'], json.dumps(result['params']), ratio, marker))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times the simulator hot paths and writes the results as json.')
+    parser.add_argument('-b', '--bench', action='append', help='only run the given benchmark (repeatable): {}'.format(
+        ', '.join([bench[0] for bench in BENCHMARKS] + ['memory', 'sharding'])))
+    parser.add_argument('--quick', action='store_true', help='smaller sizes and a 1 day end-to-end run')
+    parser.add_argument('--large', action='store_true', help='add the largest sizes (10^7 files need several GiB)')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='runs per benchmark, the minimum is compared')
+    parser.add_argument('-o', '--output', default='benchmarks.json', help='json file the results are written to')
+    parser.add_argument('--compare', help='json file of a previous run to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown reported as regression')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.bench, args.quick, args.large, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump({'metadata': get_metadata(), 'benchmarks': results}, f, indent=2)
+    print('Wrote {}'.format(args.output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
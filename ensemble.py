@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+import argparse
+import json
+import math
+import os
+import statistics
+
+from concurrent.futures import ProcessPoolExecutor
+
+import sweep
+
+
+VARIANCE_REDUCTIONS = ('none', 'crn', 'antithetic')
+
+
+def t_quantile(p, df):
+    # quantile of the student t distribution; exact for df <= 2, otherwise
+    # the Cornish-Fisher expansion around the normal quantile (error < 0.2%)
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = statistics.NormalDist().inv_cdf(p)
+    return (z
+            + (z**3 + z) / (4 * df)
+            + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+            + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3)
+            + (79 * z**9 + 776 * z**7 + 1482 * z**5 - 1920 * z**3 - 945 * z) / (92160 * df**4))
+
+
+def confidence_interval(values, confidence=0.95):
+    # mean and half-width of the t confidence interval of the mean
+    num = len(values)
+    mean = statistics.fmean(values)
+    if num < 2:
+        return mean, math.inf
+    return mean, t_quantile(0.5 + confidence / 2, num - 1) * statistics.stdev(values) / math.sqrt(num)
+
+
+def get_metric_names(rows):
+    # per month bills, the costs not billed at the end of the run and the totals
+    names = []
+    for row in rows:
+        for name in row:
+            if (name.startswith('storage_') or name.startswith('network_')) and name not in names:
+                names.append(name)
+    return names
+
+
+def make_unit_tasks(configs, unit_id, base_seed, variance_reduction, sim_days):
+    # the runs of one replication unit, one or two (antithetic) per configuration.
+    # With crn and antithetic all configurations of a unit share their seed.
+    tasks = []
+    for config_id, overrides in enumerate(configs):
+        if variance_reduction == 'none':
+            seed = base_seed + unit_id * len(configs) + config_id
+        else:
+            seed = base_seed + unit_id
+        antithetic_list = (False, True) if variance_reduction == 'antithetic' else (False,)
+        for antithetic in antithetic_list:
+            run_overrides = dict(overrides, SEED=seed)
+            if antithetic:
+                run_overrides['WORKLOAD_ANTITHETIC'] = True
+            if sim_days:
+                run_overrides['SIM_DURATION'] = int(sim_days * 24 * 3600) + 1
+            run_id = (unit_id, config_id, antithetic)
+            tasks.append((run_id, overrides, run_overrides, None))
+    return tasks
+
+
+def get_unit_values(rows, num_configs, metric_names):
+    # value of every metric per configuration of a unit, antithetic runs are averaged
+    values = [{} for _ in range(num_configs)]
+    for config_id in range(num_configs):
+        config_rows = [row for row in rows if row['config'] == config_id]
+        for name in metric_names:
+            metric_values = [row[name] for row in config_rows if name in row]
+            if len(metric_values) == len(config_rows):
+                values[config_id][name] = statistics.fmean(metric_values)
+    return values
+
+
+def summarize_units(unit_values, metric_names, confidence):
+    # confidence intervals per configuration and, when comparing two
+    # configurations, of their paired difference
+    num_configs = len(unit_values[0])
+    summary = {'configs': [], 'difference': None, 'num_units': len(unit_values)}
+    for config_id in range(num_configs):
+        intervals = {}
+        for name in metric_names:
+            samples = [values[config_id][name] for values in unit_values if name in values[config_id]]
+            if samples:
+                intervals[name] = confidence_interval(samples, confidence)
+        summary['configs'].append(intervals)
+    if num_configs == 2:
+        intervals = {}
+        for name in metric_names:
+            samples = [values[1][name] - values[0][name] for values in unit_values
+                       if name in values[0] and name in values[1]]
+            if samples:
+                intervals[name] = confidence_interval(samples, confidence)
+        summary['difference'] = intervals
+    return summary
+
+
+def is_precise(summary, half_width, rel_half_width):
+    # the stopping rule is applied to the difference when comparing, otherwise to every configuration.
+    # Metrics without variance (e.g. costs that are always zero) are not evidence of precision and
+    # are skipped; without any other metric the ensemble does not converge.
+    interval_list = [summary['difference']] if summary['difference'] is not None else summary['configs']
+    num_checked = 0
+    for intervals in interval_list:
+        for mean, width in intervals.values():
+            if width == 0:
+                continue
+            num_checked += 1
+            if half_width is not None and width > half_width:
+                return False
+            if rel_half_width is not None and width > rel_half_width * abs(mean):
+                return False
+    return num_checked > 0
+
+
+def run_ensemble(configs, sim_days=None, base_seed=42, variance_reduction='crn', confidence=0.95, half_width=None,
+                 rel_half_width=None, min_units=5, max_units=100, num_workers=None, metrics=None, on_batch=None):
+    # Runs replication units of all configurations until the confidence
+    # intervals of the metrics are narrow enough or max_units is reached;
+    # without a target precision min_units are run. New units are started in
+    # batches that keep the workers busy, so an ensemble stops at most one
+    # batch after the precision was reached.
+    # Returns the summary and the rows of all runs.
+    assert variance_reduction in VARIANCE_REDUCTIONS, variance_reduction
+    assert min_units >= 2 and max_units >= min_units, (min_units, max_units)
+    has_target = half_width is not None or rel_half_width is not None
+    if not has_target:
+        max_units = min_units
+    num_workers = num_workers or os.cpu_count()
+    num_runs_per_unit = len(configs) * (2 if variance_reduction == 'antithetic' else 1)
+    units_per_batch = max(1, num_workers // num_runs_per_unit)
+    rows = []
+    unit_values = []
+    summary = None
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        while len(unit_values) < max_units:
+            num_units = max(units_per_batch, min_units - len(unit_values))
+            num_units = min(num_units, max_units - len(unit_values))
+            unit_ids = range(len(unit_values), len(unit_values) + num_units)
+            tasks = [task for unit_id in unit_ids
+                     for task in make_unit_tasks(configs, unit_id, base_seed, variance_reduction, sim_days)]
+            batch_rows = list(executor.map(sweep.run_task, tasks))
+            for row in batch_rows:
+                row['unit'], row['config'], row['antithetic'] = row.pop('run')
+            rows.extend(batch_rows)
+
+            metric_names = metrics or get_metric_names(rows)
+            for unit_id in unit_ids:
+                unit_rows = [row for row in batch_rows if row['unit'] == unit_id]
+                unit_values.append(get_unit_values(unit_rows, len(configs), metric_names))
+            summary = summarize_units(unit_values, metric_names, confidence)
+            if on_batch:
+                on_batch(summary)
+            summary['converged'] = has_target and is_precise(summary, half_width, rel_half_width)
+            if len(unit_values) >= min_units and summary['converged']:
+                break
+    return summary, rows
+
+
+def print_intervals(title, intervals):
+    print(title)
+    for name, (mean, width) in intervals.items():
+        print('  {:<20} CHF {:>12,.2f} +- {:,.2f}'.format(name, mean, width))
+
+
+def print_summary(summary, configs):
+    for config_id, intervals in enumerate(summary['configs']):
+        print_intervals('Config {} {}'.format(config_id, json.dumps(configs[config_id])), intervals)
+    if summary['difference'] is not None:
+        print_intervals('Config 1 - config 0', summary['difference'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs replications of sim.py until the confidence intervals of the bills are narrow enough.')
+    parser.add_argument('-p', '--param', action='append', type=sweep.parse_param, default=[],
+                        help='CloudSimulator parameter and its values, e.g. TRANSFER_UPDATE_DELAY=10,20 (grid over all given parameters)')
+    parser.add_argument('--runs', help='json file with a list of parameter override dicts (used instead of the grid)')
+    parser.add_argument('--variance-reduction', default='crn', choices=VARIANCE_REDUCTIONS,
+                        help='crn runs all configurations of a replication with the same seed, antithetic additionally pairs every run with one of mirrored workload noise')
+    parser.add_argument('--confidence', type=float, default=0.95, help='confidence level of the intervals')
+    parser.add_argument('--half-width', type=float, help='target half-width of the intervals in CHF')
+    parser.add_argument('--rel-half-width', type=float, help='target half-width of the intervals relative to their mean')
+    parser.add_argument('--metric', action='append', help='metric the stopping rule is applied to, e.g. storage_month1 (default: all bills)')
+    parser.add_argument('--min-reps', type=int, default=5, help='replications before the stopping rule is checked')
+    parser.add_argument('--max-reps', type=int, default=100, help='replications after which the ensemble stops regardless of precision')
+    parser.add_argument('-s', '--seed', type=int, default=42, help='seed of the first replication')
+    parser.add_argument('-j', '--workers', type=int, help='number of worker processes (default: number of cpus)')
+    parser.add_argument('--sim-days', type=float, help='simulated days per run (default: 90)')
+    parser.add_argument('-o', '--output', help='csv file the rows of all runs are written to')
+    parser.add_argument('--json', help='json file the confidence intervals are written to')
+    args = parser.parse_args()
+
+    if args.runs:
+        with open(args.runs) as f:
+            configs = json.load(f)
+    else:
+        configs = list(sweep.expand_grid(args.param))
+
+    def on_batch(summary):
+        print('{} replications done'.format(summary['num_units']))
+
+    summary, rows = run_ensemble(configs, args.sim_days, args.seed, args.variance_reduction, args.confidence,
+                                 args.half_width, args.rel_half_width, args.min_reps, args.max_reps, args.workers,
+                                 args.metric, on_batch)
+    print_summary(summary, configs)
+    if not summary['converged'] and (args.half_width is not None or args.rel_half_width is not None):
+        print('Target precision not reached after {} replications'.format(summary['num_units']))
+    if args.output:
+        sweep.write_table(rows, args.output)
+        print('Wrote {}'.format(args.output))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(dict(summary, configs=[dict(config=config, intervals=intervals)
+                                             for config, intervals in zip(configs, summary['configs'])]), f, indent=2)
+        print('Wrote {}'.format(args.json))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,2 +1,5 @@
+from .ledger import TrafficLedger
 from .linkselector import LinkSelector
+from .pricing import PriceSchedule, PriceTable
 from .transfer import Transfer
+from .transfertable import TransferTable
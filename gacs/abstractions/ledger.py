@@ -0,0 +1,30 @@
+import numpy as np
+
+
+class TrafficLedger:
+    # Bytes transferred per linkselector since the last reset. Every registered
+    # linkselector owns one slot of the traffic array, so the traffic of all of
+    # them can be billed with a single vector operation.
+    def __init__(self, capacity=64):
+        self.linkselector_list = []
+        self.traffic = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.linkselector_list)
+
+    def add_linkselector(self, linkselector):
+        assert linkselector.ledger is None, linkselector.id
+        idx = len(self.linkselector_list)
+        if idx == len(self.traffic):
+            self.traffic = np.concatenate([self.traffic, np.zeros(len(self.traffic), dtype=np.int64)])
+        linkselector.ledger = self
+        linkselector.ledger_index = idx
+        self.linkselector_list.append(linkselector)
+
+    def get_traffic(self):
+        return self.traffic[:len(self.linkselector_list)].copy()
+
+    def reset(self):
+        traffic = self.get_traffic()
+        self.traffic[:len(self.linkselector_list)] = 0
+        return traffic
@@ -1,4 +1,4 @@
-
+from gacs.abstractions import pricing
 from gacs.common import utils
 
 class StorageLink:
@@ -6,66 +6,135 @@ class StorageLink:
         self.id = utils.next_id()
         self.linkselector = linkselector
         self.bandwidth = bandwidth # 2**30
-        self.used_traffic = 0
         self.active_transfers = 0
+        # cached get_available_bandwidth() and position in linkselector.link_heap
+        self.available_bandwidth = bandwidth
+        self.heap_index = None
+        self.link_index = None
 
     def get_available_bandwidth(self):
         return self.bandwidth / (self.active_transfers + 1)
 
+    def has_priority_over(self, other):
+        if self.available_bandwidth != other.available_bandwidth:
+            return self.available_bandwidth > other.available_bandwidth
+        return self.link_index < other.link_index
+
 class LinkSelector:
     def __init__(self, src_site, dst_site):
         self.id = utils.next_id()
         self.src_site = src_site
         self.dst_site = dst_site
         self.total_transferred = 0
-        self.network_price_chf = {0: 0.0000000, 1: 0.0000000, 1024: 0.0000000, 10240: 0.0000000}
+        self.network_price_chf = pricing.FREE
+        # TrafficLedger the traffic of this linkselector is accounted in
+        self.ledger = None
+        self.ledger_index = None
         self.link_list = []
 
+        # max-heap of links ordered by available bandwidth (ties by creation order)
+        self.link_heap = []
+        self.full_bandwidth = 0
+        self.available_bandwidth = 0
+        self.num_active_transfers = 0
+
     def get_weight(self):
         return 1
 
+    def add_traffic(self, amount):
+        self.total_transferred += amount
+        if self.ledger is not None:
+            self.ledger.traffic[self.ledger_index] += amount
+
     def create_link(self, bandwidth):
         new_link = StorageLink(self, bandwidth)
+        new_link.link_index = len(self.link_list)
         self.link_list.append(new_link)
+        self.full_bandwidth += bandwidth
+        self.available_bandwidth += new_link.available_bandwidth
+
+        new_link.heap_index = len(self.link_heap)
+        self.link_heap.append(new_link)
+        self.sift_up(new_link)
         return new_link
 
+    def sift_up(self, link):
+        heap = self.link_heap
+        idx = link.heap_index
+        while idx > 0:
+            parent_idx = (idx - 1) >> 1
+            parent = heap[parent_idx]
+            if not link.has_priority_over(parent):
+                break
+            heap[idx] = parent
+            parent.heap_index = idx
+            idx = parent_idx
+        heap[idx] = link
+        link.heap_index = idx
+
+    def sift_down(self, link):
+        heap = self.link_heap
+        size = len(heap)
+        idx = link.heap_index
+        while True:
+            child_idx = 2 * idx + 1
+            if child_idx >= size:
+                break
+            if child_idx + 1 < size and heap[child_idx + 1].has_priority_over(heap[child_idx]):
+                child_idx += 1
+            child = heap[child_idx]
+            if not child.has_priority_over(link):
+                break
+            heap[idx] = child
+            child.heap_index = idx
+            idx = child_idx
+        heap[idx] = link
+        link.heap_index = idx
+
+    def change_active_transfers(self, link, delta):
+        link.active_transfers += delta
+        self.num_active_transfers += delta
+        old_available_bw = link.available_bandwidth
+        link.available_bandwidth = link.get_available_bandwidth()
+        if self.num_active_transfers == 0:
+            # avoid accumulating rounding errors over the run
+            self.available_bandwidth = self.full_bandwidth
+        else:
+            self.available_bandwidth += link.available_bandwidth - old_available_bw
+        if delta > 0:
+            self.sift_down(link)
+        else:
+            self.sift_up(link)
+
     def calc_full_bandwidth(self):
-        bw = 0
-        for link in self.link_list:
-            bw += link.bandwidth
-        return bw
+        return self.full_bandwidth
 
     def calc_available_bandwidth(self):
-        bw = 0
-        for link in self.link_list:
-            bw += link.get_available_bandwidth()
-        return bw
+        return self.available_bandwidth
 
     def calc_used_bandwidth(self):
-        full_bw = 0
-        available_bw = 0
-        for link in self.link_list:
-            full_bw += link.bandwidth
-            available_bw += link.get_available_bandwidth()
-        assert full_bw >= available_bw, (full_bw, available_bw)
-        return (full_bw - available_bw)
-        
+        return max(self.full_bandwidth - self.available_bandwidth, 0)
+
     def select_link(self):
-        assert len(self.link_list) > 0
-        best_link = self.link_list[0]
-        max_available_bw = 0
-        for link in self.link_list:
-            bw = link.get_available_bandwidth()
-            if bw > max_available_bw:
-                max_available_bw = bw
-                best_link = link
-        return best_link
-    
+        assert len(self.link_heap) > 0
+        return self.link_heap[0]
+
     def alloc_link(self):
         link = self.select_link()
-        link.active_transfers += 1
+        self.change_active_transfers(link, 1)
         return link
 
     def free_link(self, link):
         assert link.active_transfers > 0
-        link.active_transfers -= 1
+        self.change_active_transfers(link, -1)
+
+    def reselect_link(self, link):
+        # equivalent to free_link() followed by alloc_link() but keeps the link
+        # unless another one offers more bandwidth than staying on it
+        best_link = self.select_link()
+        if best_link is link:
+            return link
+        if best_link.available_bandwidth <= link.bandwidth / link.active_transfers:
+            return link
+        self.free_link(link)
+        return self.alloc_link()
@@ -0,0 +1,88 @@
+from bisect import bisect_right
+
+import numpy as np
+
+
+class PriceSchedule:
+    # Tiered price of a traffic volume. tiers is a list of (threshold, price)
+    # pairs with cumulative thresholds: tier i charges its price for the volume
+    # between the threshold of tier i-1 (0 for the first tier) and its own
+    # threshold. The last tier charges all remaining volume, whatever its
+    # threshold is. Tiers of zero width are allowed and never charged except
+    # when they are the last one.
+    def __init__(self, tiers):
+        tiers = [(threshold, price) for threshold, price in tiers]
+        if not tiers:
+            raise ValueError('a price schedule needs at least one tier')
+        prev_threshold = 0
+        for threshold, price in tiers:
+            if threshold < prev_threshold:
+                raise ValueError('tier thresholds must be cumulative: {}'.format(tiers))
+            if price < 0:
+                raise ValueError('tier prices must not be negative: {}'.format(tiers))
+            prev_threshold = threshold
+        self.tiers = tiers
+
+        # lower bound, price and costs of all lower tiers for every tier
+        self.bounds = [0] + [threshold for threshold, _ in tiers[:-1]]
+        self.prices = [price for _, price in tiers]
+        self.base_costs = [0.0]
+        for idx in range(1, len(tiers)):
+            width = self.bounds[idx] - self.bounds[idx - 1]
+            self.base_costs.append(self.base_costs[-1] + width * self.prices[idx - 1])
+
+        self.bounds_array = np.array(self.bounds, dtype=np.float64)
+        self.prices_array = np.array(self.prices, dtype=np.float64)
+        self.base_costs_array = np.array(self.base_costs, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.tiers)
+
+    def __repr__(self):
+        return 'PriceSchedule({})'.format(self.tiers)
+
+    def get_cost(self, volume):
+        assert volume >= 0, volume
+        idx = bisect_right(self.bounds, volume) - 1
+        return self.base_costs[idx] + (volume - self.bounds[idx]) * self.prices[idx]
+
+    def get_costs(self, volumes):
+        # vectorized get_cost() over an array of any shape
+        volumes = np.asarray(volumes, dtype=np.float64)
+        assert (volumes >= 0).all()
+        idx = np.searchsorted(self.bounds_array, volumes, side='right') - 1
+        return self.base_costs_array[idx] + (volumes - self.bounds_array[idx]) * self.prices_array[idx]
+
+
+FREE = PriceSchedule([(0, 0.0)])
+
+
+class PriceTable:
+    # Stacks the schedules of many entities (e.g. linkselectors) into padded
+    # matrices, so the costs of all of them are evaluated with one numpy call.
+    def __init__(self, schedules):
+        self.schedules = list(schedules)
+        num_tiers = max((len(schedule) for schedule in self.schedules), default=1)
+        shape = (len(self.schedules), num_tiers)
+        # padded tiers start at infinity and are never selected
+        self.bounds = np.full(shape, np.inf)
+        self.prices = np.zeros(shape)
+        self.base_costs = np.zeros(shape)
+        for row, schedule in enumerate(self.schedules):
+            num = len(schedule)
+            self.bounds[row, :num] = schedule.bounds_array
+            self.prices[row, :num] = schedule.prices_array
+            self.base_costs[row, :num] = schedule.base_costs_array
+
+    def __len__(self):
+        return len(self.schedules)
+
+    def get_costs(self, volumes):
+        # volumes has the schedules as last axis, e.g. (num schedules,) for one
+        # bill or (num scenarios, num schedules) for a projection
+        volumes = np.asarray(volumes, dtype=np.float64)
+        assert volumes.shape[-1] == len(self.schedules), volumes.shape
+        assert (volumes >= 0).all()
+        rows = np.arange(len(self.schedules))
+        idx = (self.bounds <= volumes[..., np.newaxis]).sum(axis=-1) - 1
+        return self.base_costs[rows, idx] + (volumes - self.bounds[rows, idx]) * self.prices[rows, idx]
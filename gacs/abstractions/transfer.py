@@ -21,10 +21,16 @@ class Transfer:
 
         self.last_update_time = None
         self.link = None
+        self.engine = None
+        self.table_index = None
+        # notified by end(), e.g. the job scheduler staging in the file
+        self.waiter = None
         self.state = self.INIT
 
     def delete(self):
         self.state = self.DELETED
+        if self.engine:
+            self.engine.on_transfer_deleted(self)
 
     def begin(self, current_time):
         assert self.state == self.INIT
@@ -43,8 +49,7 @@ class Transfer:
         assert time_passed > 0, (current_time, self.last_update_time, time_passed)
         self.last_update_time = current_time
 
-        self.linkselector.free_link(self.link)
-        self.link = self.linkselector.alloc_link()
+        self.link = self.linkselector.reselect_link(self.link)
 
         src_size = self.file.size
         dst_size = self.dst_replica.size
@@ -52,10 +57,16 @@ class Transfer:
         bandwidth = int(self.link.bandwidth / self.link.active_transfers)
         transferred = min(bandwidth * time_passed, src_size - dst_size)
         assert transferred > 0, (self.state, bandwidth * time_passed, src_size - dst_size)
+        self.transfer_bytes(current_time, transferred)
+
+    def transfer_bytes(self, current_time, amount):
+        transferred = min(amount, self.file.size - self.dst_replica.size)
+        assert transferred > 0, (self.state, amount, transferred)
+        self.last_update_time = current_time
 
         self.dst_rse.increase_replica(self.file, current_time, transferred)
-        self.link.used_traffic += transferred
-        if src_size == self.dst_replica.size:
+        self.linkselector.add_traffic(transferred)
+        if self.file.size == self.dst_replica.size:
             self.state = self.COMPLETE
 
     def end(self, current_time):
@@ -64,3 +75,5 @@ class Transfer:
         if self.state == self.COMPLETE:
             self.file.remove_transfer(self)
         monitoring.OnTransferEnd(self)
+        if self.waiter:
+            self.waiter.on_transfer_end(self)
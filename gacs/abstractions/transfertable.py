@@ -0,0 +1,127 @@
+import numpy as np
+
+
+class TransferTable:
+    # Array backed state of all active transfers. Row i belongs to transfers[i];
+    # rows are swap removed like Rucio.file_list. Link and storage element objects
+    # are mapped to dense ids so the per link traffic and per rse storage can be
+    # accumulated with bincount. Replica objects are only updated when a transfer
+    # completes, is deleted or sync_replicas() is called.
+    def __init__(self, capacity=1024):
+        self.num_rows = 0
+        self.transfers = []
+        self.file_size = np.zeros(capacity, dtype=np.int64)
+        self.bytes_done = np.zeros(capacity, dtype=np.int64)
+        self.link_id = np.zeros(capacity, dtype=np.int64)
+        self.rse_id = np.zeros(capacity, dtype=np.int64)
+        self.last_update_time = np.zeros(capacity, dtype=np.float64)
+
+        self.link_list = []
+        self.link_index = {}
+        self.link_bandwidth = np.zeros(0, dtype=np.int64)
+        self.link_active = np.zeros(0, dtype=np.int64)
+
+        self.rse_list = []
+        self.rse_index = {}
+
+    def __len__(self):
+        return self.num_rows
+
+    def get_link_id(self, link):
+        idx = self.link_index.get(link)
+        if idx is None:
+            idx = len(self.link_list)
+            self.link_list.append(link)
+            self.link_index[link] = idx
+            self.link_bandwidth = np.append(self.link_bandwidth, link.bandwidth)
+            self.link_active = np.append(self.link_active, 0)
+        return idx
+
+    def get_rse_id(self, rse_obj):
+        idx = self.rse_index.get(rse_obj)
+        if idx is None:
+            idx = len(self.rse_list)
+            self.rse_list.append(rse_obj)
+            self.rse_index[rse_obj] = idx
+        return idx
+
+    def grow(self):
+        capacity = 2 * len(self.file_size)
+        for name in ('file_size', 'bytes_done', 'link_id', 'rse_id', 'last_update_time'):
+            column = getattr(self, name)
+            new_column = np.zeros(capacity, dtype=column.dtype)
+            new_column[:self.num_rows] = column[:self.num_rows]
+            setattr(self, name, new_column)
+
+    def add(self, transfer):
+        assert transfer.link is not None, transfer.id
+        if self.num_rows == len(self.file_size):
+            self.grow()
+
+        row = self.num_rows
+        link_id = self.get_link_id(transfer.link)
+        self.file_size[row] = transfer.file.size
+        self.bytes_done[row] = transfer.dst_replica.size
+        self.link_id[row] = link_id
+        self.rse_id[row] = self.get_rse_id(transfer.dst_rse)
+        self.last_update_time[row] = transfer.last_update_time
+        self.link_active[link_id] += 1
+
+        transfer.table_index = row
+        self.transfers.append(transfer)
+        self.num_rows += 1
+
+    def remove(self, transfer, current_time):
+        # brings the replica up to date before the row is dropped
+        row = transfer.table_index
+        self.sync_replica(row, current_time)
+        self.link_active[self.link_id[row]] -= 1
+
+        last_row = self.num_rows - 1
+        last_transfer = self.transfers.pop()
+        if row != last_row:
+            for column in (self.file_size, self.bytes_done, self.link_id, self.rse_id, self.last_update_time):
+                column[row] = column[last_row]
+            last_transfer.table_index = row
+            self.transfers[row] = last_transfer
+        transfer.table_index = None
+        self.num_rows -= 1
+
+    def sync_replica(self, row, current_time):
+        transfer = self.transfers[row]
+        replica = transfer.dst_replica
+        amount = int(self.bytes_done[row]) - replica.size
+        if amount > 0:
+            replica.increase(current_time, amount)
+        transfer.last_update_time = float(self.last_update_time[row])
+
+    def sync_replicas(self, current_time):
+        for row in range(self.num_rows):
+            self.sync_replica(row, current_time)
+
+    def update(self, current_time):
+        # advances all transfers and returns the ones that completed; they are
+        # still part of the table and must be removed by the caller
+        n = self.num_rows
+        if n == 0:
+            return []
+
+        link_id = self.link_id[:n]
+        rse_id = self.rse_id[:n]
+        bytes_done = self.bytes_done[:n]
+        time_passed = current_time - self.last_update_time[:n]
+        assert (time_passed >= 0).all(), current_time
+
+        bandwidth = self.link_bandwidth[link_id] // self.link_active[link_id]
+        transferred = np.minimum(bandwidth * time_passed.astype(np.int64), self.file_size[:n] - bytes_done)
+        bytes_done += transferred
+        self.last_update_time[:n] = current_time
+
+        traffic = np.bincount(link_id, weights=transferred, minlength=len(self.link_list))
+        for idx in np.flatnonzero(traffic):
+            self.link_list[idx].linkselector.add_traffic(int(traffic[idx]))
+        storage = np.bincount(rse_id, weights=transferred, minlength=len(self.rse_list))
+        for idx in np.flatnonzero(storage):
+            self.rse_list[idx].increase_storage(current_time, int(storage[idx]))
+
+        return [self.transfers[row] for row in np.flatnonzero(bytes_done == self.file_size[:n])]
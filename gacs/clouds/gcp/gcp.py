@@ -1,13 +1,19 @@
 
-from gacs import grid
+import numpy as np
+
+from gacs import abstractions, grid
 from gacs.common import monitoring
 
 
 class Region(grid.Site):
-    def __init__(self, name, location_desc, multi_locations, storage_price_chf, sku_id):
+    def __init__(self, name, location_desc, multi_locations, storage_price_chf, sku_id, multi_location=None):
         super().__init__(name, location_desc)
 
+        # names of all regions of the multi location and its name if known
         self.multi_locations = multi_locations
+        self.multi_location = multi_location
+        # ordinal of the region in the cloud matrices
+        self.region_index = None
         self.storage_price_chf = storage_price_chf
         self.sku_id = sku_id
 
@@ -27,66 +33,69 @@ class Bucket(grid.StorageElement):
         assert isinstance(region_obj, Region), type(region_obj)
         super().__init__(region_obj, name)
         self.storage_type = storage_type
-        self.time_at_last_reset = 0
-        self.storage_at_last_reset = 0
-        self.storage_events = []
+        # ordinal of the bucket in the cloud matrices
+        self.bucket_index = None
+        # buckets simulated by another shard only mirror its replicas and are not billed
+        self.billed = True
+
+        # used_storage integrated over time (byte * seconds) since the last billing
+        self.time_at_last_change = 0
+        self.byte_seconds = 0
+
+        # optional downsampled volume series for monitoring; disabled if None
+        self.sample_interval = None
+        self.time_at_last_sample = 0
+        self.byte_seconds_at_last_sample = 0
+
+    def account_storage(self, current_time):
+        time_diff = current_time - self.time_at_last_change
+        assert time_diff >= 0, (current_time, self.time_at_last_change)
+        if time_diff > 0:
+            self.byte_seconds += self.used_storage * time_diff
+            self.time_at_last_change = current_time
+
+    def sample_storage_volume(self, current_time, force=False):
+        # force samples before the billing resets byte_seconds, so the costs
+        # of the samples add up to the bills
+        if self.sample_interval is None:
+            return
+        time_diff = current_time - self.time_at_last_sample
+        if time_diff < self.sample_interval and not (force and time_diff > 0):
+            return
+        gb_scale = 1024**3
+        month_scale = 30*24*3600
+        byte_seconds = self.byte_seconds - self.byte_seconds_at_last_sample
+        costs = byte_seconds / gb_scale / month_scale * self.site_obj.storage_price_chf
+        monitoring.OnCloudStorageVolumeChange(self, current_time, self.used_storage/gb_scale, costs)
+        self.time_at_last_sample = current_time
+        self.byte_seconds_at_last_sample = self.byte_seconds
 
-    def increase_replica(self, file_obj, current_time, amount):
-        event = [current_time, amount]
-        self.storage_events.append(event)
-        super().increase_replica(file_obj, current_time, amount)
+    def increase_storage(self, current_time, amount):
+        self.account_storage(current_time)
+        super().increase_storage(current_time, amount)
+        self.sample_storage_volume(current_time)
 
     def remove_replica(self, file_obj, current_time):
-        replica_obj = self.replica_by_name[file_obj.name]
-        event = [current_time, -(replica_obj.size)]
-        self.storage_events.append(event)
+        self.account_storage(current_time)
         super().remove_replica(file_obj, current_time)
+        self.sample_storage_volume(current_time)
 
-    def process_storage_billing(self, current_time):
-        price = self.site_obj.storage_price_chf
-        time_offset = self.time_at_last_reset
-        used_storage_at_time = self.storage_at_last_reset
-        costs = 0
+    def get_storage_costs(self, current_time):
+        # storage costs since the last billing
+        self.account_storage(current_time)
         gb_scale = 1024**3
         month_scale = 30*24*3600
-        for event in self.storage_events:
-            time_diff = event[0] - time_offset
-            assert time_diff >= 0
-            if time_diff > 0:
-                storage_gb = used_storage_at_time/gb_scale
-                time_month = time_diff/month_scale
-                c = storage_gb * time_month * price
-                costs += c
-                time_offset = event[0]
-                monitoring.OnCloudStorageVolumeChange(self, event[0], storage_gb, c)
-            used_storage_at_time += event[1]
-
-        assert used_storage_at_time == self.used_storage, (used_storage_at_time, self.used_storage)
-
-        if time_offset < current_time:
-            time_diff = current_time - time_offset
-
-            storage_gb = used_storage_at_time/gb_scale
-            time_month = time_diff/month_scale
-            costs += storage_gb * time_month * price
-
-        self.time_at_last_reset = current_time
-        self.storage_at_last_reset = self.used_storage
-        self.storage_events.clear()
-        return costs
+        return self.byte_seconds / gb_scale / month_scale * self.site_obj.storage_price_chf
 
+    def process_storage_billing(self, current_time):
+        self.account_storage(current_time)
+        self.sample_storage_volume(current_time, force=True)
+        costs = self.get_storage_costs(current_time)
 
-def sum_price_recursive(traffic, price_info, idx):
-    assert traffic >= 0, traffic
+        self.byte_seconds = 0
+        self.byte_seconds_at_last_sample = 0
+        return costs
 
-    threshold = price_info[idx][0]
-    price = price_info[idx][1]
-    if idx >= 1:
-        threshold -= price_info[idx - 1][0]
-    if traffic <= threshold or (idx + 1) >= len(price_info):
-        return traffic * price
-    costs = threshold * price
-    return costs + sum_price_recursive(traffic - threshold, price_info, idx + 1)
 
 class Cloud:
     def __init__(self):
@@ -97,18 +106,38 @@ class Cloud:
         self.bucket_by_name  = {}
 
         self.linkselector_list = []
-
-        self.transfer_list = []
+        # traffic per linkselector since the last billing; grid linkselectors
+        # towards the cloud can be registered too
+        self.traffic_ledger = abstractions.TrafficLedger()
+        # network price schedules of the ledger's linkselectors stacked for billing
+        self.network_price_table = None
 
         self.multi_locations = {}
 
+        # dense matrices indexed by region_index, built by build_location_matrices()
+        # and build_matrices()
+        self.same_location = None
+        self.same_multi_location = None
+        # multi location id of every region and the names of the multi locations
+        self.region_multi_location = None
+        self.multi_location_names = []
+        # index into network_price_schedules, -1 without linkselector
+        self.price_tier_id = None
+        self.network_price_schedules = []
+        # full bandwidth of the linkselector in bytes per second, 0 without one
+        self.bandwidth = None
+        # index into linkselector_list, -1 without linkselector
+        self.linkselector_index = None
+        # region_index of every bucket by bucket_index
+        self.bucket_region_index = None
+
+        self.storage_sample_interval = None
+
     def is_same_location(self, region1, region2):
-        return region1.name == region2.name
+        return bool(self.same_location[region1.region_index, region2.region_index])
 
     def is_same_multi_location(self, region1, region2):
-        if region1.name in region2.multi_locations:
-            return not self.is_same_location(region1, region2)
-        return False
+        return bool(self.same_multi_location[region1.region_index, region2.region_index])
 
     def setup_default_regions(self):
         assert len(self.region_list) == 0, self.name
@@ -150,6 +179,7 @@ class Cloud:
             for dst_region in self.region_list:
                 linkselector = src_region.create_linkselector(dst_region)
                 self.linkselector_list.append(linkselector)
+                self.traffic_ledger.add_linkselector(linkselector)
 
     def setup_default_networkcosts(self):
         assert len(self.region_list) > 0, self.name
@@ -168,56 +198,52 @@ class Cloud:
         eu - sa   96EB-C6ED-FBDE 0.1121580 0.1121580 0.1028115 0.0747720
         na - sa   BB86-91E8-5450 0.1121580 0.1121580 0.1028115 0.0747720
         """
-        # setup bucket to bucket transfer cost
-        cost_same_region    = [(0, 0)]
-        cost_same_multi      = [(1, 0.0093465)]
+        # setup bucket to bucket transfer cost (GiB thresholds, CHF per GiB)
+        cost_same_region    = abstractions.PriceSchedule([(0, 0)])
+        cost_same_multi      = abstractions.PriceSchedule([(1, 0.0093465)])
 
         cost_ww = {'asia': {}, 'australia-southeast1': {}, 'europe': {}, 'southamerica-east1': {}, 'us': {}}
 
-        cost_ww['asia']['australia-southeast1'] = [(1024, 0.1775835), (10240, 0.1682370), (10240, 0.1401975)]
-        cost_ww['asia']['europe']               = [(1024, 0.1121580), (10240, 0.1028115), (10240, 0.0747720)]
-        cost_ww['asia']['southamerica-east1']   = [(1024, 0.1121580), (10240, 0.1028115), (10240, 0.0747720)]
-        cost_ww['asia']['us']                   = [(1, 0.0000000), (1024, 0.1121580), (10240, 0.1028115), (10240, 0.0747720)]
-
-        cost_ww['australia-southeast1']['europe']             = [(1024, 0.1775835), (10240, 0.1682370), (10240, 0.1401975)]
-        cost_ww['australia-southeast1']['southamerica-east1'] = [(1024, 0.1121580), (10240, 0.1028115), (10240, 0.0747720)]
-        cost_ww['australia-southeast1']['us']                 = [(1024, 0.1775835), (10240, 0.1682370), (10240, 0.1401975)]
-
-        cost_ww['europe']['southamerica-east1'] = [(1024, 0.1121580), (10240, 0.1028115), (10240, 0.0747720)]
-        cost_ww['europe']['us']                 = [(1, 0.0000000), (1024, 0.1121580), (10240, 0.1028115), (10240, 0.0747720)]
-
-        cost_ww['southamerica-east1']['us'] = [(1024, 0.1121580), (10240, 0.1028115), (10240, 0.0747720)]
+        cost_ww['asia']['australia-southeast1'] = abstractions.PriceSchedule([(1024, 0.1775835), (10240, 0.1682370), (10240, 0.1401975)])
+        cost_ww['asia']['europe']               = abstractions.PriceSchedule([(1024, 0.1121580), (10240, 0.1028115), (10240, 0.0747720)])
+        cost_ww['asia']['southamerica-east1']   = abstractions.PriceSchedule([(1024, 0.1121580), (10240, 0.1028115), (10240, 0.0747720)])
+        cost_ww['asia']['us']                   = abstractions.PriceSchedule([(1, 0.0000000), (1024, 0.1121580), (10240, 0.1028115), (10240, 0.0747720)])
+
+        cost_ww['australia-southeast1']['europe']             = abstractions.PriceSchedule([(1024, 0.1775835), (10240, 0.1682370), (10240, 0.1401975)])
+        cost_ww['australia-southeast1']['southamerica-east1'] = abstractions.PriceSchedule([(1024, 0.1121580), (10240, 0.1028115), (10240, 0.0747720)])
+        cost_ww['australia-southeast1']['us']                 = abstractions.PriceSchedule([(1024, 0.1775835), (10240, 0.1682370), (10240, 0.1401975)])
+
+        cost_ww['europe']['southamerica-east1'] = abstractions.PriceSchedule([(1024, 0.1121580), (10240, 0.1028115), (10240, 0.0747720)])
+        cost_ww['europe']['us']                 = abstractions.PriceSchedule([(1, 0.0000000), (1024, 0.1121580), (10240, 0.1028115), (10240, 0.0747720)])
+
+        cost_ww['southamerica-east1']['us'] = abstractions.PriceSchedule([(1024, 0.1121580), (10240, 0.1028115), (10240, 0.0747720)])
+
+        # multi location x multi location schedules, so the linkselectors are
+        # priced by index instead of by name
+        self.build_location_matrices()
+        num_multi_locations = len(self.multi_location_names)
+        cost_ww_table = [[None] * num_multi_locations for _ in range(num_multi_locations)]
+        for ml1_id, ml1_name in enumerate(self.multi_location_names):
+            for ml2_id, ml2_name in enumerate(self.multi_location_names):
+                if ml1_id != ml2_id:
+                    # the cost_ww dict only holds one order of each pair
+                    costs = cost_ww.get(ml1_name, {}).get(ml2_name) or cost_ww.get(ml2_name, {}).get(ml1_name)
+                    assert costs, (ml1_name, ml2_name)
+                    cost_ww_table[ml1_id][ml2_id] = costs
+
+        region_multi_location = self.region_multi_location.tolist()
         for linkselector in self.linkselector_list:
-            r1 = linkselector.src_site
-            r2 = linkselector.dst_site
-            same_loc = self.is_same_location(r1, r2)
-            same_mloc = self.is_same_multi_location(r1, r2)
-            if same_loc == False and same_mloc == False:
-                # 1. case: two different multi regions
-                # search both multi location names
-                mr1_name = mr2_name = ''
-                for ml_name in self.multi_locations:
-                    if r1.name in self.multi_locations[ml_name]:
-                        mr1_name = ml_name
-                    if r2.name in self.multi_locations[ml_name]:
-                        mr2_name = ml_name
-                assert len(mr1_name) and len(mr2_name), (mr1_name, mr2_name)
-
-                # determine order of multi location names for cost_ww dict
-                mr = cost_ww.get(mr1_name)
-                costs = mr.get(mr2_name)
-                if not costs:
-                    mr = cost_ww.get(mr2_name)
-                    costs = mr.get(mr1_name)
-                assert costs, (mr1_name, mr2_name)
-
-                linkselector.network_price_chf = costs
-            elif same_loc:
-                # 2. case: r1 and r2 are the same region
+            r1_idx = linkselector.src_site.region_index
+            r2_idx = linkselector.dst_site.region_index
+            if self.same_location[r1_idx, r2_idx]:
+                # 1. case: r1 and r2 are the same region
                 linkselector.network_price_chf = cost_same_region
-            else:
-                # 3. case: region r1 is inside the multi region r2
+            elif self.same_multi_location[r1_idx, r2_idx]:
+                # 2. case: region r1 is inside the multi region r2
                 linkselector.network_price_chf = cost_same_multi
+            else:
+                # 3. case: two different multi regions
+                linkselector.network_price_chf = cost_ww_table[region_multi_location[r1_idx]][region_multi_location[r2_idx]]
 
         #download apac      1F8B-71B0-3D1B 0.0000000 0.1121580 0.1028115 0.0747720
         #download australia 9B2D-2B7D-FA5C 0.1775835 0.1775835 0.1682370 0.1401975
@@ -232,57 +258,120 @@ class Cloud:
         self.setup_default_linkselectors()
         self.setup_default_networkcosts()
         self.setup_default_operationcosts()
+        self.build_matrices()
+
+    def build_location_matrices(self):
+        # region x region location flags; regions without a multi location name
+        # are grouped by their list of multi location regions
+        num_regions = len(self.region_list)
+        multi_location_ids = {}
+        self.multi_location_names = []
+        self.region_multi_location = np.empty(num_regions, dtype=np.int64)
+        for idx, region in enumerate(self.region_list):
+            region.region_index = idx
+            key = region.multi_location if region.multi_location is not None else tuple(region.multi_locations)
+            ml_id = multi_location_ids.get(key)
+            if ml_id is None:
+                ml_id = len(self.multi_location_names)
+                multi_location_ids[key] = ml_id
+                self.multi_location_names.append(key)
+            self.region_multi_location[idx] = ml_id
+        self.same_location = np.eye(num_regions, dtype=bool)
+        self.same_multi_location = (self.region_multi_location[:, np.newaxis] == self.region_multi_location) & ~self.same_location
+
+    def build_matrices(self):
+        # Dense region x region views of the topology and the network prices for
+        # vectorized lookups. Has to be called again after regions, buckets,
+        # linkselectors or links were added or the network prices changed.
+        self.build_location_matrices()
+        num_regions = len(self.region_list)
+        self.price_tier_id = np.full((num_regions, num_regions), -1, dtype=np.int64)
+        self.bandwidth = np.zeros((num_regions, num_regions))
+        self.linkselector_index = np.full((num_regions, num_regions), -1, dtype=np.int64)
+        schedule_ids = {}
+        self.network_price_schedules = []
+        for ls_idx, linkselector in enumerate(self.linkselector_list):
+            schedule = linkselector.network_price_chf
+            schedule_id = schedule_ids.get(id(schedule))
+            if schedule_id is None:
+                schedule_id = len(self.network_price_schedules)
+                schedule_ids[id(schedule)] = schedule_id
+                self.network_price_schedules.append(schedule)
+            src_idx = linkselector.src_site.region_index
+            dst_idx = linkselector.dst_site.region_index
+            self.price_tier_id[src_idx, dst_idx] = schedule_id
+            self.bandwidth[src_idx, dst_idx] = linkselector.calc_full_bandwidth()
+            self.linkselector_index[src_idx, dst_idx] = ls_idx
+
+        for idx, bucket in enumerate(self.bucket_list):
+            bucket.bucket_index = idx
+        self.bucket_region_index = np.array([bucket.site_obj.region_index for bucket in self.bucket_list], dtype=np.int64)
+
+    def get_bucket_matrix(self, region_matrix):
+        # bucket x bucket view of a region x region matrix
+        idx = self.bucket_region_index
+        return region_matrix[idx[:, np.newaxis], idx]
+
+    def get_billed_buckets(self):
+        return [bucket for bucket in self.bucket_list if bucket.billed]
 
     def process_billing(self, current_time):
         bill = {}
-        for transfer in self.transfer_list:
-            transfer.update(current_time)
-
         storage_costs = {}
         storage_costs_total = 0
-        for bucket in self.bucket_list:
+        for bucket in self.get_billed_buckets():
             costs = bucket.process_storage_billing(current_time)
             storage_costs[bucket.name] = costs
             storage_costs_total += costs
         bill['storage_per_bucket'] = storage_costs
         bill['storage_total'] = storage_costs_total
 
-        network_costs_total = 0
-        for linkselector in self.linkselector_list:
-            costs = 0
-            traffic = 0
-            for link in linkselector.link_list:
-                assert link.used_traffic >= 0, link.used_traffic
-                traffic += link.used_traffic
-                link.used_traffic = 0
-
-            traffic /= 1024**3 # scale from Bytes to GiB
-            price_info = linkselector.network_price_chf
-            costs = sum_price_recursive(traffic, price_info, 0)
-            network_costs_total += costs
-        bill['network_total'] = network_costs_total
+        traffic = self.traffic_ledger.reset() / 1024**3 # scale from Bytes to GiB
+        bill['network_total'] = self.get_network_price_table().get_costs(traffic).sum().item()
 
         return bill
 
+    def get_costs_to_date(self, current_time):
+        # storage and network costs since the last billing without resetting them
+        storage_costs = sum(bucket.get_storage_costs(current_time) for bucket in self.get_billed_buckets())
+        traffic = self.traffic_ledger.get_traffic() / 1024**3
+        network_costs = self.get_network_price_table().get_costs(traffic).sum().item()
+        return storage_costs, network_costs
+
+    def get_network_price_table(self):
+        schedules = [linkselector.network_price_chf for linkselector in self.traffic_ledger.linkselector_list]
+        table = self.network_price_table
+        if table is None or len(table.schedules) != len(schedules) or any(a is not b for a, b in zip(table.schedules, schedules)):
+            table = abstractions.PriceTable(schedules)
+            self.network_price_table = table
+        return table
+
+    def project_network_costs(self, traffic):
+        # network costs of hypothetical monthly traffic in GiB per ledger linkselector;
+        # traffic has the shape (len(traffic_ledger),) or (num scenarios, len(traffic_ledger))
+        return self.get_network_price_table().get_costs(traffic)
+
     def get_as_graph(self):
-        graph = {}
-        for src_bucket in self.bucket_list:
-            src_name = src_bucket.name
-            src_region = src_bucket.site_obj
-            graph[src_name] = {}
-            for dst_bucket in self.bucket_list:
-                dst_name = dst_bucket.name
-                dst_region = dst_bucket.site_obj
-                w = 0
-                ls = src_region.linkselector_by_name.get(dst_region.name)
-                if ls != None:
-                    w = ls.get_weight()
-                graph[src_name][dst_name] = w
-        return graph
+        # bucket x bucket matrices in bucket_index order by name: the location
+        # flags, price_tier_id into network_price_schedules, bandwidth and the
+        # linkselector weight; a zero weight means there is no linkselector
+        self.build_matrices()
+        weights = np.zeros(len(self.linkselector_list))
+        for ls_idx, linkselector in enumerate(self.linkselector_list):
+            weights[ls_idx] = linkselector.get_weight()
+        ls_idx = self.get_bucket_matrix(self.linkselector_index)
+        return {
+            'same_location': self.get_bucket_matrix(self.same_location),
+            'same_multi_location': self.get_bucket_matrix(self.same_multi_location),
+            'price_tier_id': self.get_bucket_matrix(self.price_tier_id),
+            'bandwidth': self.get_bucket_matrix(self.bandwidth),
+            'linkselector_index': ls_idx,
+            'weight': np.where(ls_idx >= 0, weights[ls_idx], 0.0),
+        }
 
     def create_region(self, multi_location, region_name, location_desc, storage_price_chf, sku_id):
         mul_locs = self.multi_locations[multi_location]
-        new_region = Region(region_name, location_desc, mul_locs, storage_price_chf, sku_id)
+        new_region = Region(region_name, location_desc, mul_locs, storage_price_chf, sku_id, multi_location=multi_location)
         self.region_list.append(new_region)
         self.region_by_name[new_region.name] = new_region
         return new_region
@@ -321,6 +410,7 @@ class Cloud:
                 raise RuntimeError('create_bucket: cannot create multi regional bucket in region {}'.format(region_name))
 
         new_bucket = region_obj.create_rse(bucket_name, storage_type)
+        new_bucket.sample_interval = self.storage_sample_interval
 
         self.bucket_list.append(new_bucket)
         self.bucket_by_name[bucket_name] = new_bucket
@@ -1,43 +1,93 @@
-
+import atexit
 import logging
-
-
-def setup_logging(lvl=logging.INFO):
+import logging.handlers
+import queue
+
+
+class SimFormatter(logging.Formatter):
+    FORMAT = '[{simtime:>10}: {name:<20}] {message}'
+    COLORS = [(logging.CRITICAL, '\033[31;1m'),
+              (logging.ERROR, '\033[31;1m'),
+              (logging.WARNING, '\033[33;1m'),
+              (logging.INFO, '\033[32;1m'),
+              (logging.DEBUG, '\033[36;1m')]
+    RESET = '\033[0m'
+
+    def __init__(self):
+        super().__init__(self.FORMAT, style='{')
+        # one precompiled style per level number
+        self.level_styles = {}
+        for levelno, _ in self.COLORS:
+            self.get_style(levelno)
+
+    def get_style(self, levelno):
+        style = self.level_styles.get(levelno)
+        if style is None:
+            color = self.RESET
+            for min_levelno, level_color in self.COLORS:
+                if levelno >= min_levelno:
+                    color = level_color
+                    break
+            style = logging.StrFormatStyle(color + self.FORMAT + self.RESET)
+            self.level_styles[levelno] = style
+        return style
+
+    def formatMessage(self, record):
+        if getattr(record, 'simtime', None) is None:
+            record.simtime = '-'
+        return self.get_style(record.levelno).format(record)
+
+
+class SimQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # only resolve the message; formatting happens in the listener thread.
+        # Tracebacks are appended to the message like QueueHandler.prepare()
+        # does, exc_info cannot be passed on.
+        msg = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        if record.exc_text:
+            msg = msg + '\n' + record.exc_text
+        if record.stack_info:
+            msg = msg + '\n' + record.stack_info
+        record.msg = msg
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        record.stack_info = None
+        return record
+
+
+def setup_logging(lvl=logging.INFO, async_sink=False):
     logger = logging.getLogger('gacs')
 
     logger.setLevel(lvl)
+    if logger.handlers:
+        # already set up by a previous simulator in this process
+        return SimLogger(logger)
+
     hdlr = logging.StreamHandler()
-    def emit_decorator(fnc):
-        def func(*args):
-            levelno = args[0].levelno
-            if levelno >= logging.CRITICAL:
-                color = '\033[31;1m'
-            elif levelno >= logging.ERROR:
-                color = '\033[31;1m'
-            elif levelno >= logging.WARNING:
-                color = '\033[33;1m'
-            elif levelno >= logging.INFO:
-                color = '\033[32;1m'
-            elif levelno >= logging.DEBUG:
-                color = '\033[36;1m'
-            else:
-                color = '\033[0m'
-
-            if not getattr(args[0], 'simtime', None):
-                args[0].simtime = '-'
-
-            format_str = '[{simtime:>10}: {name:<20}] {message}'
-
-            formatter = logging.Formatter(color + format_str + '\033[0m', style='{')
-            hdlr.setFormatter(formatter)
-            return fnc(*args)
-        return func
-
-    hdlr.emit = emit_decorator(hdlr.emit)
+    hdlr.setFormatter(SimFormatter())
+    if async_sink:
+        record_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(record_queue, hdlr)
+        listener.start()
+        atexit.register(listener.stop)
+        hdlr = SimQueueHandler(record_queue)
     logger.addHandler(hdlr)
     return SimLogger(logger)
 
 
+class BraceMessage:
+    # str.format() style message that is only formatted if the record is emitted
+    def __init__(self, message, args):
+        self.message = message
+        self.args = args
+
+    def __str__(self):
+        return self.message.format(*self.args)
+
+
 class SimLogger:
     def __init__(self, logger):
         if isinstance(logger, str):
@@ -48,17 +98,27 @@ class SimLogger:
     def getChild(self, name):
         return SimLogger(self.logger.getChild(name))
 
-    def debug(self, message, simtime=None):
-        self.logger.debug(message, extra={'simtime': simtime})
+    def isEnabledFor(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level, message, simtime=None, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        if args:
+            message = BraceMessage(message, args)
+        self.logger.log(level, message, extra={'simtime': simtime})
+
+    def debug(self, message, simtime=None, *args):
+        self.log(logging.DEBUG, message, simtime, *args)
 
-    def info(self, message, simtime=None):
-        self.logger.info(message, extra={'simtime': simtime})
+    def info(self, message, simtime=None, *args):
+        self.log(logging.INFO, message, simtime, *args)
 
-    def warning(self, message, simtime=None):
-        self.logger.warning(message, extra={'simtime': simtime})
+    def warning(self, message, simtime=None, *args):
+        self.log(logging.WARNING, message, simtime, *args)
 
-    def error(self, message, simtime=None):
-        self.logger.error(message, extra={'simtime': simtime})
+    def error(self, message, simtime=None, *args):
+        self.log(logging.ERROR, message, simtime, *args)
 
-    def critical(self, message, simtime=None):
-        self.logger.critical(message, extra={'simtime': simtime})
+    def critical(self, message, simtime=None, *args):
+        self.log(logging.CRITICAL, message, simtime, *args)
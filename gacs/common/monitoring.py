@@ -1,21 +1,239 @@
 from gacs import abstractions
-from gacs.common import utils
 
+import os
 import time
+import zipfile
+
+import numpy as np
+
+TRANSFER_DTYPE = np.dtype([('end_time', 'f8'), ('duration', 'f8'), ('size', 'i8'), ('state', 'i1')])
+TICK_DTYPE = np.dtype([('time', 'f8'), ('num_active_transfers', 'i8'), ('reaper_duration', 'f8'), ('num_files', 'i8')])
+STORAGE_DTYPE = np.dtype([('bucket', 'i4'), ('time', 'f8'), ('volume', 'f8'), ('cost', 'f8')])
+BILL_DTYPE = np.dtype([('month', 'i4'), ('storage_total', 'f8'), ('network_total', 'f8')])
+# costs accumulated since the last bill, sampled in between bills
+COST_DTYPE = np.dtype([('time', 'f8'), ('storage_total', 'f8'), ('network_total', 'f8')])
+# per process totals of a profiled run and their resumption wall times in log2 microsecond bins
+PROFILE_DTYPE = np.dtype([('process', 'U64'), ('wall_time', 'f8'), ('resumptions', 'i8'), ('events', 'i8')])
+PROFILE_HISTOGRAM_BINS = 32
+# durations a job spent staging in, waiting for a compute slot and running (including stage out)
+JOB_DTYPE = np.dtype([('end_time', 'f8'), ('stagein_duration', 'f8'), ('queue_duration', 'f8'), ('run_duration', 'f8'),
+                      ('num_inputs', 'i4'), ('num_transfers', 'i4'), ('state', 'i1')])
 
 data = None
+
+
+class Series:
+    # Append only table with a fixed schema. Rows are written into preallocated
+    # chunks; completed chunks are flushed to the results file if one is open
+    # and kept in memory otherwise.
+    def __init__(self, name, dtype, chunk_size=2**16):
+        self.name = name
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        self.chunk = np.empty(chunk_size, dtype=dtype)
+        self.chunk_len = 0
+        self.chunks = []
+        self.num_flushed_chunks = 0
+        self.num_rows = 0
+        self.writer = None
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['writer'] = None
+        return state
+
+    def append(self, *row):
+        self.chunk[self.chunk_len] = row
+        self.chunk_len += 1
+        self.num_rows += 1
+        if self.chunk_len == self.chunk_size:
+            self.finish_chunk()
+
+    def finish_chunk(self):
+        if self.chunk_len == 0:
+            return
+        chunk = self.chunk[:self.chunk_len]
+        if self.writer:
+            self.writer.write_chunk(self.name, self.num_flushed_chunks, chunk)
+            self.num_flushed_chunks += 1
+        else:
+            self.chunks.append(chunk)
+            self.chunk = np.empty(self.chunk_size, dtype=self.dtype)
+        self.chunk_len = 0
+
+    def to_array(self):
+        if self.num_flushed_chunks:
+            raise RuntimeError('series {} was flushed to disk, use load_results'.format(self.name))
+        return np.concatenate(self.chunks + [self.chunk[:self.chunk_len]])
+
+
+class ResultsWriter:
+    # Writes series chunks as <series>/<chunk nr>.npy members into a zip file,
+    # which numpy reads as npz archive.
+    def __init__(self, path):
+        self.path = path
+        self.zip_file = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+
+    def write_array(self, name, array):
+        with self.zip_file.open(name + '.npy', 'w', force_zip64=True) as f:
+            np.lib.format.write_array(f, np.asanyarray(array), allow_pickle=False)
+
+    def write_chunk(self, series_name, chunk_nr, chunk):
+        self.write_array('{}/{:06d}'.format(series_name, chunk_nr), chunk)
+
+    def copy_chunks(self, path, series_name, num_chunks):
+        # copies the first num_chunks chunks of a series from another results file
+        with np.load(path) as npz:
+            for chunk_nr in range(num_chunks):
+                self.write_chunk(series_name, chunk_nr, npz['{}/{:06d}'.format(series_name, chunk_nr)])
+
+    def close(self):
+        self.zip_file.close()
+
+
 class MonitoringData:
     def __init__(self):
         self.transfer_num_completed = 0
         self.transfer_num_deleted = 0
-        self.transfer_duration = []
-        self.transfer_size = []
-        self.tick_times = []
-        self.num_active_transfers = []
-        self.reaper_duration = []
-        self.num_files = []
-        self.storage_graph = ([], [], [])
+        self.job_num_done = 0
+        self.job_num_failed = 0
+        self.transfers = Series('transfers', TRANSFER_DTYPE)
+        self.ticks = Series('ticks', TICK_DTYPE)
+        self.storage = Series('storage', STORAGE_DTYPE)
+        self.bills = Series('bills', BILL_DTYPE, chunk_size=64)
+        self.costs = Series('costs', COST_DTYPE, chunk_size=1024)
+        self.jobs = Series('jobs', JOB_DTYPE)
         self.storage_graph_indices = {}
+        self.writer = None
+        # results file the flushed chunks were written to
+        self.results_path = None
+        # set by OnProfileDone() for profiled runs
+        self.profile = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['writer'] = None
+        return state
+
+    def get_series(self):
+        return [self.transfers, self.ticks, self.storage, self.bills, self.costs, self.jobs]
+
+    def get_counters(self):
+        return {'transfer_num_completed': self.transfer_num_completed,
+                'transfer_num_deleted': self.transfer_num_deleted,
+                'job_num_done': self.job_num_done,
+                'job_num_failed': self.job_num_failed}
+
+    def get_results(self):
+        results = {series.name: series.to_array() for series in self.get_series()}
+        results['storage_buckets'] = list(self.storage_graph_indices)
+        results['counters'] = self.get_counters()
+        if self.profile:
+            results['profile'] = self.profile
+        return results
+
+
+def open_results(path):
+    assert data.writer is None, data.writer.path
+    writer = ResultsWriter(path)
+    for series in data.get_series():
+        if series.num_flushed_chunks:
+            # restored from a checkpoint of a run that already streamed to a results file
+            assert os.path.abspath(path) != os.path.abspath(data.results_path), path
+            writer.copy_chunks(data.results_path, series.name, series.num_flushed_chunks)
+        series.writer = writer
+    data.writer = writer
+    data.results_path = path
+
+
+def close_results():
+    writer = data.writer
+    for series in data.get_series():
+        series.finish_chunk()
+        series.writer = None
+    for name, value in data.get_counters().items():
+        writer.write_array('counters/' + name, value)
+    writer.write_array('storage_buckets', np.array(list(data.storage_graph_indices), dtype=str))
+    if data.profile:
+        for name, value in data.profile.items():
+            writer.write_array('profile/' + name, value)
+    writer.close()
+    data.writer = None
+
+
+def save_results(path, results):
+    # writes results, e.g. merged from several runs, in the format of a streamed results file
+    writer = ResultsWriter(path)
+    for name in ('transfers', 'ticks', 'storage', 'bills', 'costs', 'jobs'):
+        writer.write_chunk(name, 0, results[name])
+    for name, value in results['counters'].items():
+        writer.write_array('counters/' + name, value)
+    writer.write_array('storage_buckets', np.array(list(results['storage_buckets']), dtype=str))
+    for name, value in results.get('profile', {}).items():
+        writer.write_array('profile/' + name, value)
+    writer.close()
+
+
+def load_results(path):
+    chunks = {}
+    results = {'counters': {}, 'storage_buckets': []}
+    with np.load(path) as npz:
+        for key in sorted(npz.files):
+            prefix, _, name = key.rpartition('/')
+            if prefix == 'counters':
+                results['counters'][name] = npz[key].item()
+            elif prefix == 'profile':
+                results.setdefault('profile', {})[name] = npz[key]
+            elif prefix:
+                chunks.setdefault(prefix, []).append(npz[key])
+            else:
+                results[name] = npz[key].tolist()
+    results['transfers'] = np.concatenate(chunks.get('transfers', [np.empty(0, TRANSFER_DTYPE)]))
+    results['ticks'] = np.concatenate(chunks.get('ticks', [np.empty(0, TICK_DTYPE)]))
+    results['storage'] = np.concatenate(chunks.get('storage', [np.empty(0, STORAGE_DTYPE)]))
+    results['bills'] = np.concatenate(chunks.get('bills', [np.empty(0, BILL_DTYPE)]))
+    results['costs'] = np.concatenate(chunks.get('costs', [np.empty(0, COST_DTYPE)]))
+    results['jobs'] = np.concatenate(chunks.get('jobs', [np.empty(0, JOB_DTYPE)]))
+    return results
+
+
+def summarize(results):
+    # compact, json serialisable summary of the results of one run
+    summary = {'counters': dict(results['counters'])}
+
+    transfers = results['transfers']
+    transfer_summary = {'num': len(transfers)}
+    if len(transfers):
+        for column in ('size', 'duration'):
+            values = transfers[column]
+            transfer_summary[column + '_min'] = values.min().item()
+            transfer_summary[column + '_max'] = values.max().item()
+            transfer_summary[column + '_mean'] = values.mean().item()
+    summary['transfers'] = transfer_summary
+
+    ticks = results['ticks']
+    if len(ticks):
+        summary['sim_time'] = ticks['time'][-1].item()
+        summary['num_active_transfers_mean'] = ticks['num_active_transfers'].mean().item()
+        summary['num_files_max'] = ticks['num_files'].max().item()
+        summary['reaper_duration_total'] = ticks['reaper_duration'].sum().item()
+
+    jobs = results.get('jobs')
+    if jobs is not None and len(jobs):
+        job_summary = {'num': len(jobs)}
+        for column in ('stagein_duration', 'queue_duration', 'run_duration'):
+            job_summary[column + '_mean'] = jobs[column].mean().item()
+            job_summary[column + '_max'] = jobs[column].max().item()
+        summary['jobs'] = job_summary
+
+    summary['bills'] = [{name: row[name].item() for name in BILL_DTYPE.names} for row in results['bills']]
+    if 'profile' in results:
+        summary['profile'] = [{name: row[name].item() for name in PROFILE_DTYPE.names}
+                              for row in results['profile']['processes']]
+    return summary
 
 
 def init():
@@ -32,8 +250,18 @@ def OnTransferEnd(transfer):
         data.transfer_num_completed += 1
     elif transfer.state == abstractions.Transfer.DELETED:
         data.transfer_num_deleted += 1
-    data.transfer_duration.append(transfer.end_time - transfer.start_time)
-    data.transfer_size.append(transfer.file.size)
+    data.transfers.append(transfer.end_time, transfer.end_time - transfer.start_time, transfer.file.size, transfer.state)
+
+
+def OnJobEnd(job):
+    if job.state == job.DONE:
+        data.job_num_done += 1
+        data.jobs.append(job.end_time, job.queue_time - job.submit_time, job.start_time - job.queue_time,
+                         job.end_time - job.start_time, len(job.input_files), job.num_transfers, job.state)
+    else:
+        data.job_num_failed += 1
+        data.jobs.append(job.end_time, job.end_time - job.submit_time, 0, 0,
+                         len(job.input_files), job.num_transfers, job.state)
 
 
 def OnFileDeletion(file):
@@ -50,77 +278,26 @@ def OnCreateTransferCloudToCloud(transfer):
 
 def OnCloudStorageVolumeChange(bucket, time, volume, cost):
     idx = data.storage_graph_indices.get(bucket.name)
-    if not idx:
+    if idx is None:
         idx = len(data.storage_graph_indices)
         data.storage_graph_indices[bucket.name] = idx
-        data.storage_graph[0].append([])
-        data.storage_graph[1].append([])
-        data.storage_graph[2].append([])
-    data.storage_graph[0][idx].append(time)
-    data.storage_graph[1][idx].append(volume)
-    data.storage_graph[2][idx].append(cost)
+    data.storage.append(idx, time, volume, cost)
 
 
 def OnBillingDone(bill, month):
-    pass
+    data.bills.append(month, bill['storage_total'], bill['network_total'])
+
+
+def OnCostSample(current_time, storage_total, network_total):
+    data.costs.append(current_time, storage_total, network_total)
+
+
+def OnProfileDone(stats_list):
+    processes = np.array([(stats.name, stats.wall_time, stats.resumptions, stats.events) for stats in stats_list],
+                         dtype=PROFILE_DTYPE)
+    histograms = np.array([stats.histogram for stats in stats_list], dtype=np.int64)
+    data.profile = {'processes': processes, 'histograms': histograms}
 
 
 def OnMonitorTick(current_time, num_active_transfers, last_reaper_duration, num_files):
-    data.tick_times.append(current_time)
-    data.num_active_transfers.append(num_active_transfers)
-    data.reaper_duration.append(last_reaper_duration)
-    data.num_files.append(num_files)
-
-
-def plotIt():
-    import matplotlib.pyplot as plt
-    import statistics
-    print('NumComplete:    {:,d}'.format(data.transfer_num_completed))
-    print('NumDeleted:     {:,d}'.format(data.transfer_num_deleted))
-    min_transfer = utils.sizefmt(min(data.transfer_size))
-    max_transfer = utils.sizefmt(max(data.transfer_size))
-    avg_transfer = statistics.mean(data.transfer_size)
-    print('MinTransferred: {}'.format(min_transfer))
-    print('MaxTransferred: {}'.format(max_transfer))
-    print('AvgTransferred: {}'.format(utils.sizefmt(avg_transfer)))
-    min_duration = min(data.transfer_duration)
-    max_duration = max(data.transfer_duration)
-    print('MinDuration:    {}'.format(min_duration))
-    print('MaxDuration:    {}'.format(max_duration))
-    print('AvgDuration:    {:,.2f}'.format(statistics.mean(data.transfer_duration)))
-
-    plt.figure(1)
-    for k in data.storage_graph_indices:
-        idx = data.storage_graph_indices[k]
-        plt.plot(data.storage_graph[0][idx], data.storage_graph[1][idx], label=k)
-    plt.legend()
-    plt.ylabel('volume GiB')
-    plt.xlabel('sim time/tick')
-
-    plt.figure(2)
-    for k in data.storage_graph_indices:
-        idx = data.storage_graph_indices[k]
-        plt.plot(data.storage_graph[0][idx], data.storage_graph[2][idx], label=k)
-    plt.legend()
-    plt.ylabel('costs/CHF')
-    plt.xlabel('sim time/tick')
-
-    plt.figure(3)
-    plt.plot(data.tick_times, data.num_active_transfers)
-    plt.legend(['NumActiveTransfers'])
-    plt.ylabel('count')
-    plt.xlabel('sim time/tick')
-
-    plt.figure(4)
-    plt.plot(data.tick_times, data.reaper_duration)
-    plt.legend(['ReaperDuration'])
-    plt.ylabel('duration/s (realtime)')
-    plt.xlabel('sim time/tick')
-
-    plt.figure(5)
-    plt.plot(data.tick_times, data.num_files)
-    plt.legend(['NumFiles'])
-    plt.ylabel('count')
-    plt.xlabel('sim time/tick')
-
-    plt.show()
+    data.ticks.append(current_time, num_active_transfers, last_reaper_duration, num_files)
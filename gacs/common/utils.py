@@ -3,14 +3,36 @@ from itertools import count
 
 
 def setup_utils():
-    global idgen
+    global idgen, rse_idgen
     idgen = count(1)
+    rse_idgen = count(0)
 
 
 def next_id():
     return next(idgen)
 
 
+def next_rse_id():
+    # dense ids used as bit positions in File.rse_mask
+    return next(rse_idgen)
+
+
+def get_state():
+    # next values of the id generators, used by checkpoints
+    global idgen, rse_idgen
+    next_id_value = next(idgen)
+    next_rse_id_value = next(rse_idgen)
+    idgen = count(next_id_value)
+    rse_idgen = count(next_rse_id_value)
+    return {'next_id': next_id_value, 'next_rse_id': next_rse_id_value}
+
+
+def set_state(state):
+    global idgen, rse_idgen
+    idgen = count(state['next_id'])
+    rse_idgen = count(state['next_rse_id'])
+
+
 def sizefmt(num, suffix='B', faktor=1024.0):
     assert faktor != 0
     units = ['','Ki','Mi','Gi','Ti','Pi','Ei','Zi']
@@ -1,3 +1,6 @@
 from .data import File, Replica
+from .sampling import ReplicaCandidateIndex
+from .selection import ReplicaSelector
 from .storage import Site, StorageElement
 from .rucio import Rucio
+from .catalog import SQLiteRucio
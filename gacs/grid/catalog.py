@@ -0,0 +1,616 @@
+import collections
+import random
+import sqlite3
+import weakref
+
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from gacs.common import utils
+from gacs.grid import File, Replica, StorageElement
+from gacs.grid.rucio import Rucio
+from gacs.grid.sampling import CandidateSet
+
+
+# Files and the replicas at catalogue rses are rows of a sqlite database.
+# Slots are dense positions per table (per rse for replicas) that are kept
+# dense by swap removal, like the indices of Rucio.file_list, so uniform
+# samples are drawn by slot. external_replicas holds the files with a replica
+# at an observed in-memory rse (e.g. a bucket) to filter transfer candidates.
+SCHEMA = '''
+CREATE TABLE files (file_id INTEGER PRIMARY KEY, name NOT NULL, size INTEGER NOT NULL, die_time REAL NOT NULL,
+                    slot INTEGER NOT NULL);
+CREATE UNIQUE INDEX files_name ON files (name);
+CREATE UNIQUE INDEX files_slot ON files (slot);
+CREATE INDEX files_die_time ON files (die_time);
+CREATE TABLE replicas (file_id INTEGER NOT NULL, rse_id INTEGER NOT NULL, slot INTEGER NOT NULL, size INTEGER NOT NULL,
+                       state INTEGER NOT NULL, PRIMARY KEY (file_id, rse_id)) WITHOUT ROWID;
+CREATE UNIQUE INDEX replicas_slot ON replicas (rse_id, slot);
+CREATE TABLE external_replicas (rse_id INTEGER NOT NULL, file_id INTEGER NOT NULL,
+                                PRIMARY KEY (rse_id, file_id)) WITHOUT ROWID;
+'''
+
+TABLES = ('files', 'replicas', 'external_replicas')
+
+
+class FileListView(Sequence):
+    # file_list of SQLiteRucio, indexed by slot; supports len() and random.sample()
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __len__(self):
+        return self.catalog.num_files
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('file slot {} out of range'.format(idx))
+        return self.catalog.get_file_at(idx)
+
+    def __iter__(self):
+        for name in self.catalog.iter_names('SELECT name FROM files ORDER BY slot'):
+            yield self.catalog.get_file(name)
+
+
+class FileMapView(Mapping):
+    # file_by_name of SQLiteRucio
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __len__(self):
+        return self.catalog.num_files
+
+    def __getitem__(self, name):
+        file_obj = self.catalog.get_file(name)
+        if file_obj is None:
+            raise KeyError(name)
+        return file_obj
+
+    def __contains__(self, name):
+        return self.catalog.get_file(name) is not None
+
+    def __iter__(self):
+        return self.catalog.iter_names('SELECT name FROM files ORDER BY slot')
+
+
+class ReplicaListView(Sequence):
+    # replica_list of a CatalogStorageElement, indexed by slot
+    def __init__(self, rse_obj):
+        self.rse_obj = rse_obj
+
+    def __len__(self):
+        return self.rse_obj.num_replicas
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('replica slot {} out of range'.format(idx))
+        return self.rse_obj.catalog.get_replicas_at(self.rse_obj, [idx])[0]
+
+    def __iter__(self):
+        catalog = self.rse_obj.catalog
+        query = ('SELECT f.name FROM replicas r JOIN files f ON f.file_id = r.file_id '
+                 'WHERE r.rse_id = {} ORDER BY r.slot').format(self.rse_obj.rse_id)
+        for name in catalog.iter_names(query):
+            yield self.rse_obj.get_replica(catalog.get_file(name))
+
+
+class ReplicaMapView(Mapping):
+    # replica_by_name of a CatalogStorageElement
+    def __init__(self, rse_obj):
+        self.rse_obj = rse_obj
+
+    def __len__(self):
+        return self.rse_obj.num_replicas
+
+    def __getitem__(self, name):
+        file_obj = self.rse_obj.catalog.get_file(name)
+        replica_obj = self.rse_obj.get_replica(file_obj) if file_obj is not None else None
+        if replica_obj is None:
+            raise KeyError(name)
+        return replica_obj
+
+    def __iter__(self):
+        query = ('SELECT f.name FROM replicas r JOIN files f ON f.file_id = r.file_id '
+                 'WHERE r.rse_id = {} ORDER BY r.slot').format(self.rse_obj.rse_id)
+        return self.rse_obj.catalog.iter_names(query)
+
+
+class CatalogStorageElement(StorageElement):
+    # Storage element whose replicas are rows of the catalogue. Replica objects
+    # only exist while their file is loaded. Observers are notified about
+    # replicas of loaded files; replicas of files registered in bulk or
+    # deleted by the reaper without being loaded are only announced by file
+    # id to observers that implement on_replicas_created/removed_bulk.
+    def __init__(self, site_obj, name, catalog):
+        super().__init__(site_obj, name)
+        self.catalog = catalog
+        self.num_replicas = 0
+        self.replica_list = ReplicaListView(self)
+        self.replica_by_name = ReplicaMapView(self)
+
+    def get_replica(self, file_obj):
+        for replica_obj in file_obj.replica_list:
+            if replica_obj.rse_obj is self:
+                return replica_obj
+        return None
+
+    def create_replica(self, file_obj):
+        if file_obj.has_replica(self):
+            raise NotImplementedError()
+        new_replica = Replica(self, file_obj, None)
+        file_obj.add_replica(new_replica)
+        self.catalog.insert_replica(new_replica, self.num_replicas)
+        self.num_replicas += 1
+        for index in self.replica_indexes:
+            index.on_replica_created(new_replica)
+        return new_replica
+
+    def sample_replicas(self, k):
+        slots = random.sample(range(self.num_replicas), min(k, self.num_replicas))
+        return self.catalog.get_replicas_at(self, slots)
+
+    def increase_replica(self, file_obj, current_time, amount):
+        super().increase_replica(file_obj, current_time, amount)
+        self.catalog.update_replica(self.get_replica(file_obj))
+
+    def remove_replica(self, file_obj, current_time):
+        replica_obj = self.get_replica(file_obj)
+        self.catalog.delete_replica(replica_obj)
+        self.num_replicas -= 1
+        self.used_storage -= replica_obj.size
+        for index in self.replica_indexes:
+            index.on_replica_removed(replica_obj)
+        replica_obj.delete(current_time)
+
+
+class CatalogCandidateIndex:
+    # ReplicaCandidateIndex of catalogue source rses. Instead of keeping the
+    # candidates, the index counts the (src, dst) replica pairs of every file;
+    # samples are drawn by slot from the source replicas and files with a
+    # replica at dst are rejected. Pairs whose candidates are rare (for which
+    # rejection is slow) get their candidates selected in sql once and kept
+    # up to date like in ReplicaCandidateIndex, until they are common again.
+    MIN_ACCEPT_RATIO = 0.125
+
+    def __init__(self, catalog, src_rses, dst_rses):
+        self.catalog = catalog
+        self.src_rses = list(src_rses)
+        self.dst_rses = list(dst_rses)
+        assert all(isinstance(rse_obj, CatalogStorageElement) for rse_obj in self.src_rses), 'sources must be catalogue rses'
+        self.src_mask = 0
+        self.dst_mask = 0
+        for src_rse in self.src_rses:
+            self.src_mask |= src_rse.rse_bit
+        for dst_rse in self.dst_rses:
+            self.dst_mask |= dst_rse.rse_bit
+        # number of files with a replica at src and at dst, counted from the start
+        assert not any(len(dst_rse.replica_list) for dst_rse in self.dst_rses), 'destinations must be empty'
+        self.num_pairs = {}
+        for src_rse in self.src_rses:
+            for dst_rse in self.dst_rses:
+                self.num_pairs[(src_rse.rse_id, dst_rse.rse_id)] = 0
+        # file ids of the candidates of the pairs in which they are rare
+        self.rare_candidates = {}
+        for rse_obj in self.src_rses + self.dst_rses:
+            rse_obj.replica_indexes.append(self)
+
+    def get_num_candidates(self, src_rse, dst_rse):
+        return src_rse.num_replicas - self.num_pairs[(src_rse.rse_id, dst_rse.rse_id)]
+
+    def sample(self, src_rse, dst_rse, k):
+        num_candidates = self.get_num_candidates(src_rse, dst_rse)
+        k = min(k, num_candidates)
+        if k <= 0:
+            return []
+        key = (src_rse.rse_id, dst_rse.rse_id)
+        ratio = num_candidates / src_rse.num_replicas
+        candidates = self.rare_candidates.get(key)
+        if candidates is not None and ratio >= 2 * self.MIN_ACCEPT_RATIO:
+            del self.rare_candidates[key]
+            candidates = None
+        if candidates is None and ratio >= self.MIN_ACCEPT_RATIO:
+            return self.sample_by_rejection(src_rse, dst_rse, k, ratio)
+
+        if candidates is None:
+            candidates = CandidateSet()
+            for file_id in self.catalog.get_candidate_file_ids(src_rse, dst_rse):
+                candidates.add(file_id)
+            self.rare_candidates[key] = candidates
+        assert len(candidates) == num_candidates, (len(candidates), num_candidates)
+        return [src_rse.get_replica(file_obj) for file_obj in self.catalog.get_files_by_id(candidates.sample(k))]
+
+    def sample_by_rejection(self, src_rse, dst_rse, k, ratio):
+        # the first k candidates of a random order of the slots
+        num_replicas = src_rse.num_replicas
+        num_draws = min(num_replicas, int(k / ratio * 1.25) + 8)
+        drawn_slots = random.sample(range(num_replicas), num_draws)
+        slots = self.catalog.filter_candidate_slots(src_rse, dst_rse, drawn_slots)[:k]
+        if len(slots) < k:
+            # rarely, the missing ones are drawn from all remaining candidates
+            chosen_slots = set(slots)
+            candidate_slots = [slot for slot in self.catalog.get_candidate_slots(src_rse, dst_rse) if slot not in chosen_slots]
+            slots.extend(random.sample(candidate_slots, k - len(slots)))
+        return self.catalog.get_replicas_at(src_rse, slots)
+
+    def get_partner_rse_ids(self, replica_obj, mask):
+        # rses of mask holding a replica of the same file, except the deleted ones
+        return [partner.rse_obj.rse_id for partner in replica_obj.file.replica_list
+                if partner.rse_obj.rse_bit & mask and partner.state != Replica.DELETED]
+
+    def on_replica_created(self, replica_obj):
+        rse_obj = replica_obj.rse_obj
+        file_id = replica_obj.file.file_index
+        if rse_obj.rse_bit & self.src_mask:
+            dst_rse_ids = self.get_partner_rse_ids(replica_obj, self.dst_mask)
+            for dst_rse_id in dst_rse_ids:
+                self.num_pairs[(rse_obj.rse_id, dst_rse_id)] += 1
+            for (src_rse_id, dst_rse_id), candidates in self.rare_candidates.items():
+                if src_rse_id == rse_obj.rse_id and dst_rse_id not in dst_rse_ids:
+                    candidates.add(file_id)
+        if rse_obj.rse_bit & self.dst_mask:
+            self.catalog.insert_external_replica(replica_obj)
+            for src_rse_id in self.get_partner_rse_ids(replica_obj, self.src_mask):
+                key = (src_rse_id, rse_obj.rse_id)
+                self.num_pairs[key] += 1
+                if key in self.rare_candidates:
+                    self.rare_candidates[key].discard(file_id)
+
+    def on_replica_available(self, replica_obj):
+        pass
+
+    def on_replica_removed(self, replica_obj):
+        # removed replicas are marked deleted afterwards, so every pair is
+        # only decremented by the first of its replicas that is removed
+        rse_obj = replica_obj.rse_obj
+        file_id = replica_obj.file.file_index
+        if rse_obj.rse_bit & self.src_mask:
+            for dst_rse_id in self.get_partner_rse_ids(replica_obj, self.dst_mask):
+                self.num_pairs[(rse_obj.rse_id, dst_rse_id)] -= 1
+            for (src_rse_id, _), candidates in self.rare_candidates.items():
+                if src_rse_id == rse_obj.rse_id:
+                    candidates.discard(file_id)
+        if rse_obj.rse_bit & self.dst_mask:
+            self.catalog.delete_external_replica(replica_obj)
+            readd = not replica_obj.file.has_replica(rse_obj)
+            for src_rse_id in self.get_partner_rse_ids(replica_obj, self.src_mask):
+                key = (src_rse_id, rse_obj.rse_id)
+                self.num_pairs[key] -= 1
+                if readd and key in self.rare_candidates:
+                    self.rare_candidates[key].add(file_id)
+
+    # replicas of files that are not loaded, they have no replicas at dst
+
+    def on_replicas_created_bulk(self, rse_obj, file_ids):
+        for (src_rse_id, _), candidates in self.rare_candidates.items():
+            if src_rse_id == rse_obj.rse_id:
+                for file_id in file_ids:
+                    candidates.add(file_id)
+
+    def on_replicas_removed_bulk(self, rse_obj, file_ids):
+        for (src_rse_id, _), candidates in self.rare_candidates.items():
+            if src_rse_id == rse_obj.rse_id:
+                for file_id in file_ids:
+                    candidates.discard(file_id)
+
+
+class SQLiteRucio(Rucio):
+    # Rucio with the file catalogue in a sqlite database, for catalogues that
+    # do not fit into memory. Rses created by create_rse() keep their replicas
+    # in the database; other rses (e.g. buckets) are kept in memory as usual.
+    #
+    # File objects are loaded on access. A file that is referenced anywhere
+    # (by a transfer, a job, a bucket replica) is found again through a weak
+    # identity map, so there is never more than one object per file; up to
+    # cache_size recently loaded files are kept in addition. New rows are
+    # written behind in bulk, and before anything is read from the database.
+    # The database file is recreated.
+    def __init__(self, path, cache_size=2**16, flush_rows=2**16):
+        super().__init__()
+        self.path = path
+        self.cache_size = cache_size
+        self.flush_rows = flush_rows
+        self.conn = sqlite3.connect(path)
+        # the catalogue is scratch data of a single run
+        self.conn.execute('PRAGMA journal_mode = OFF')
+        self.conn.execute('PRAGMA synchronous = OFF')
+        for table in TABLES:
+            self.conn.execute('DROP TABLE IF EXISTS {}'.format(table))
+        self.conn.executescript(SCHEMA)
+
+        self.num_files = 0
+        self.next_file_id = 0
+        self.rse_by_id = {}
+        self.file_list = FileListView(self)
+        self.file_by_name = FileMapView(self)
+        self.die_times = None
+
+        self.loaded_files = weakref.WeakValueDictionary()
+        self.cached_files = collections.OrderedDict()
+
+        # write-behind buffers
+        self.pending_files = []
+        self.pending_replicas = []
+        self.pending_updates = {}
+        self.pending_external = []
+
+    def __getstate__(self):
+        raise NotImplementedError('a sqlite catalogue cannot be checkpointed')
+
+    def create_rse(self, site_obj, rse_name):
+        assert rse_name not in site_obj.rse_by_name, (site_obj.name, rse_name)
+        new_rse = CatalogStorageElement(site_obj, rse_name, self)
+        site_obj.rse_by_name[rse_name] = new_rse
+        self.rse_by_id[new_rse.rse_id] = new_rse
+        self.add_rse(new_rse)
+        return new_rse
+
+    def create_candidate_index(self, src_rses, dst_rses):
+        return CatalogCandidateIndex(self, src_rses, dst_rses)
+
+    # write-behind
+
+    def get_num_pending(self):
+        return len(self.pending_files) + len(self.pending_replicas) + len(self.pending_updates) + len(self.pending_external)
+
+    def flush(self, commit=False):
+        if self.get_num_pending():
+            execute = self.conn.executemany
+            execute('INSERT INTO files VALUES (?, ?, ?, ?, ?)', self.pending_files)
+            execute('INSERT INTO replicas VALUES (?, ?, ?, ?, ?)', self.pending_replicas)
+            execute('UPDATE replicas SET size = ?, state = ? WHERE file_id = ? AND rse_id = ?',
+                    [(size, state, file_id, rse_id) for (file_id, rse_id), (size, state) in self.pending_updates.items()])
+            execute('INSERT INTO external_replicas VALUES (?, ?)', self.pending_external)
+            self.pending_files = []
+            self.pending_replicas = []
+            self.pending_updates = {}
+            self.pending_external = []
+            commit = True
+        if commit:
+            self.conn.commit()
+
+    def flush_if_full(self):
+        if self.get_num_pending() >= self.flush_rows:
+            self.flush()
+
+    def insert_replica(self, replica_obj, slot):
+        self.pending_replicas.append((replica_obj.file.file_index, replica_obj.rse_obj.rse_id, slot, replica_obj.size, replica_obj.state))
+        self.flush_if_full()
+
+    def update_replica(self, replica_obj):
+        self.pending_updates[(replica_obj.file.file_index, replica_obj.rse_obj.rse_id)] = (replica_obj.size, replica_obj.state)
+        self.flush_if_full()
+
+    def insert_external_replica(self, replica_obj):
+        self.pending_external.append((replica_obj.rse_obj.rse_id, replica_obj.file.file_index))
+        self.flush_if_full()
+
+    def delete_external_replica(self, replica_obj):
+        self.flush()
+        self.conn.execute('DELETE FROM external_replicas WHERE rse_id = ? AND file_id = ?',
+                          (replica_obj.rse_obj.rse_id, replica_obj.file.file_index))
+
+    def delete_replica(self, replica_obj):
+        # swap removal: the last replica of the rse takes over the slot
+        self.flush()
+        rse_obj = replica_obj.rse_obj
+        key = (replica_obj.file.file_index, rse_obj.rse_id)
+        slot = self.conn.execute('SELECT slot FROM replicas WHERE file_id = ? AND rse_id = ?', key).fetchone()[0]
+        self.conn.execute('DELETE FROM replicas WHERE file_id = ? AND rse_id = ?', key)
+        last_slot = rse_obj.num_replicas - 1
+        if slot != last_slot:
+            self.conn.execute('UPDATE replicas SET slot = ? WHERE rse_id = ? AND slot = ?', (slot, rse_obj.rse_id, last_slot))
+
+    # loading files
+
+    def load_file(self, row):
+        file_id, name, size, die_time = row
+        new_file = File(name, size, die_time, file_id)
+        replica_rows = self.conn.execute('SELECT rse_id, size, state FROM replicas WHERE file_id = ?', (file_id,)).fetchall()
+        for rse_id, replica_size, state in replica_rows:
+            replica_obj = Replica(self.rse_by_id[rse_id], new_file, None)
+            replica_obj.size = replica_size
+            replica_obj.state = state
+            new_file.add_replica(replica_obj)
+        self.loaded_files[name] = new_file
+        return new_file
+
+    def cache_file(self, file_obj):
+        cached_files = self.cached_files
+        cached_files[file_obj.name] = file_obj
+        cached_files.move_to_end(file_obj.name)
+        if len(cached_files) > self.cache_size:
+            cached_files.popitem(last=False)
+        return file_obj
+
+    def get_file(self, name):
+        file_obj = self.loaded_files.get(name)
+        if file_obj is None:
+            self.flush()
+            row = self.conn.execute('SELECT file_id, name, size, die_time FROM files WHERE name = ?', (name,)).fetchone()
+            if row is None:
+                return None
+            file_obj = self.load_file(row)
+        return self.cache_file(file_obj)
+
+    def get_file_at(self, slot):
+        self.flush()
+        name = self.conn.execute('SELECT name FROM files WHERE slot = ?', (slot,)).fetchone()[0]
+        return self.get_file(name)
+
+    def iter_names(self, query):
+        # fetched at once, the callers may modify the catalogue while iterating
+        self.flush()
+        return iter([row[0] for row in self.conn.execute(query)])
+
+    def get_replicas_at(self, rse_obj, slots):
+        # replicas at the given slots of rse_obj, in the order of slots
+        self.flush()
+        names = {}
+        for start in range(0, len(slots), 500):
+            chunk = slots[start:start + 500]
+            query = ('SELECT r.slot, f.name FROM replicas r JOIN files f ON f.file_id = r.file_id '
+                     'WHERE r.rse_id = ? AND r.slot IN ({})').format(','.join('?' * len(chunk)))
+            names.update(self.conn.execute(query, [rse_obj.rse_id] + chunk))
+        return [rse_obj.get_replica(self.get_file(names[slot])) for slot in slots]
+
+    def filter_candidate_slots(self, src_rse, dst_rse, slots):
+        # slots of src_rse whose file has no replica at dst_rse, in the order of slots
+        self.flush()
+        accepted = set()
+        for start in range(0, len(slots), 500):
+            chunk = slots[start:start + 500]
+            query = ('SELECT r.slot FROM replicas r WHERE r.rse_id = ? AND r.slot IN ({}) AND NOT EXISTS '
+                     '(SELECT 1 FROM external_replicas e WHERE e.rse_id = ? AND e.file_id = r.file_id)').format(','.join('?' * len(chunk)))
+            accepted.update(row[0] for row in self.conn.execute(query, [src_rse.rse_id] + chunk + [dst_rse.rse_id]))
+        return [slot for slot in slots if slot in accepted]
+
+    def get_candidate_file_ids(self, src_rse, dst_rse):
+        self.flush()
+        query = ('SELECT r.file_id FROM replicas r WHERE r.rse_id = ? AND NOT EXISTS '
+                 '(SELECT 1 FROM external_replicas e WHERE e.rse_id = ? AND e.file_id = r.file_id)')
+        return [row[0] for row in self.conn.execute(query, (src_rse.rse_id, dst_rse.rse_id))]
+
+    def get_files_by_id(self, file_ids):
+        # files of the given ids, in the order of file_ids
+        self.flush()
+        names = {}
+        for start in range(0, len(file_ids), 500):
+            chunk = file_ids[start:start + 500]
+            query = 'SELECT file_id, name FROM files WHERE file_id IN ({})'.format(','.join('?' * len(chunk)))
+            names.update(self.conn.execute(query, chunk))
+        return [self.get_file(names[file_id]) for file_id in file_ids]
+
+    def get_candidate_slots(self, src_rse, dst_rse):
+        self.flush()
+        query = ('SELECT r.slot FROM replicas r WHERE r.rse_id = ? AND NOT EXISTS '
+                 '(SELECT 1 FROM external_replicas e WHERE e.rse_id = ? AND e.file_id = r.file_id) ORDER BY r.slot')
+        return [row[0] for row in self.conn.execute(query, (src_rse.rse_id, dst_rse.rse_id))]
+
+    # Rucio interface
+
+    def create_file(self, file_name, file_size, die_time):
+        if file_name in self.file_by_name:
+            raise RuntimeError('Rucio.create_file: file name {} is already registerd'.format(file_name))
+
+        new_file = File(file_name, file_size, die_time, self.next_file_id)
+        self.pending_files.append((self.next_file_id, file_name, file_size, die_time, self.num_files))
+        self.next_file_id += 1
+        self.num_files += 1
+        self.loaded_files[file_name] = new_file
+        self.flush_if_full()
+        return self.cache_file(new_file)
+
+    def create_files_bulk(self, sizes, die_times, replica_masks, current_time=0, names=None):
+        # like Rucio.create_files_bulk, but only rows are written: the files
+        # are loaded when they are accessed and nothing is returned
+        sizes = np.asarray(sizes, dtype=np.int64)
+        die_times = np.asarray(die_times)
+        replica_masks = np.asarray(replica_masks, dtype=bool)
+        num_files = len(sizes)
+        assert len(die_times) == num_files, (len(die_times), num_files)
+        assert replica_masks.shape[0] == num_files, (replica_masks.shape, num_files)
+        assert replica_masks.shape[1] <= len(self.rse_list), (replica_masks.shape, len(self.rse_list))
+        if names is None:
+            names = [utils.next_id() for _ in range(num_files)]
+        assert len(names) == num_files, (len(names), num_files)
+
+        file_ids = range(self.next_file_id, self.next_file_id + num_files)
+        self.pending_files.extend(zip(file_ids, names, sizes.tolist(), die_times.tolist(),
+                                      range(self.num_files, self.num_files + num_files)))
+        self.next_file_id += num_files
+        self.num_files += num_files
+
+        for rse_idx in range(replica_masks.shape[1]):
+            rows = np.flatnonzero(replica_masks[:, rse_idx]).tolist()
+            if not rows:
+                continue
+            rse_obj = self.rse_list[rse_idx]
+            assert isinstance(rse_obj, CatalogStorageElement), rse_obj.name
+            slots = range(rse_obj.num_replicas, rse_obj.num_replicas + len(rows))
+            self.pending_replicas.extend((file_ids[row], rse_obj.rse_id, slot, size, Replica.AVAILABLE)
+                                         for row, slot, size in zip(rows, slots, sizes[rows].tolist()))
+            rse_obj.num_replicas += len(rows)
+            rse_obj.increase_storage(current_time, int(sizes[rows].sum()))
+            for index in rse_obj.replica_indexes:
+                index.on_replicas_created_bulk(rse_obj, [file_ids[row] for row in rows])
+        self.flush_if_full()
+
+    def remove_file(self, file_obj, current_time):
+        # swap removal: the last file takes over the slot
+        self.flush()
+        slot = self.conn.execute('SELECT slot FROM files WHERE file_id = ?', (file_obj.file_index,)).fetchone()[0]
+        self.conn.execute('DELETE FROM files WHERE file_id = ?', (file_obj.file_index,))
+        last_slot = self.num_files - 1
+        if slot != last_slot:
+            self.conn.execute('UPDATE files SET slot = ? WHERE slot = ?', (slot, last_slot))
+        self.num_files -= 1
+        self.loaded_files.pop(file_obj.name, None)
+        self.cached_files.pop(file_obj.name, None)
+        file_obj.delete(current_time)
+
+    def run_reaper(self, current_time):
+        # Files that are referenced in memory are deleted like in Rucio. All
+        # others cannot have transfers or replicas outside of the catalogue,
+        # they are deleted in sql without loading them.
+        self.flush()
+        rows = self.conn.execute('SELECT file_id, name FROM files WHERE die_time <= ? ORDER BY die_time, file_id',
+                                 (current_time,)).fetchall()
+        cold_file_ids = []
+        for file_id, name in rows:
+            # the cache only keeps files alive, they are not needed anymore
+            self.cached_files.pop(name, None)
+        for file_id, name in rows:
+            file_obj = self.loaded_files.get(name)
+            if file_obj is not None:
+                self.remove_file(file_obj, current_time)
+            else:
+                cold_file_ids.append(file_id)
+        if cold_file_ids:
+            self.delete_files(cold_file_ids, current_time)
+        self.flush(commit=True)
+        return len(rows)
+
+    def delete_files(self, file_ids, current_time):
+        # rows written behind may have taken slots that are compacted
+        self.flush()
+        conn = self.conn
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS doomed_files (file_id INTEGER PRIMARY KEY)')
+        conn.execute('DELETE FROM doomed_files')
+        conn.executemany('INSERT INTO doomed_files VALUES (?)', [(file_id,) for file_id in file_ids])
+
+        query = 'SELECT rse_id, slot, size, file_id FROM replicas WHERE file_id IN (SELECT file_id FROM doomed_files)'
+        deleted_by_rse_id = collections.defaultdict(list)
+        for rse_id, slot, size, file_id in conn.execute(query).fetchall():
+            deleted_by_rse_id[rse_id].append((slot, size, file_id))
+        conn.execute('DELETE FROM replicas WHERE file_id IN (SELECT file_id FROM doomed_files)')
+        for rse_id, deleted in deleted_by_rse_id.items():
+            rse_obj = self.rse_by_id[rse_id]
+            rse_obj.num_replicas -= len(deleted)
+            rse_obj.used_storage -= sum(size for _, size, _ in deleted)
+            self.compact_slots('replicas', 'rse_id = {}'.format(rse_id), [slot for slot, _, _ in deleted], rse_obj.num_replicas)
+            for index in rse_obj.replica_indexes:
+                index.on_replicas_removed_bulk(rse_obj, [file_id for _, _, file_id in deleted])
+
+        slots = [row[0] for row in conn.execute('SELECT slot FROM files WHERE file_id IN (SELECT file_id FROM doomed_files)')]
+        conn.execute('DELETE FROM files WHERE file_id IN (SELECT file_id FROM doomed_files)')
+        self.num_files -= len(slots)
+        self.compact_slots('files', '1', slots, self.num_files)
+
+    def compact_slots(self, table, condition, freed_slots, num_rows):
+        # moves the rows behind num_rows into the freed slots below it
+        holes = sorted(slot for slot in freed_slots if slot < num_rows)
+        if not holes:
+            return
+        query = 'SELECT slot FROM {} WHERE {} AND slot >= ? ORDER BY slot'.format(table, condition)
+        movers = [row[0] for row in self.conn.execute(query, (num_rows,))]
+        assert len(movers) == len(holes), (table, len(movers), len(holes))
+        update = 'UPDATE {} SET slot = ? WHERE {} AND slot = ?'.format(table, condition)
+        self.conn.executemany(update, zip(holes, movers))
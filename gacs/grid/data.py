@@ -1,60 +1,63 @@
 
-from gacs.common import monitoring, utils
+from gacs.common import monitoring
 
 
 class File:
+    # __weakref__ lets SQLiteRucio find loaded files again
+    __slots__ = ('name', 'size', 'die_time', 'file_index', 'rse_mask', 'replica_list', 'transfer_list', '__weakref__')
+
     def __init__(self, file_name, size, die_time, file_index):
         self.name = file_name
         self.size = size
         self.die_time = die_time
         self.file_index = file_index
 
-        self.rse_list = []
-        self.rse_by_name = {}
+        # bitset of the rse_id of every rse holding a replica of this file
+        self.rse_mask = 0
+        # a tuple is smaller than a list and files only get a few replicas
+        self.replica_list = ()
 
-        self.replica_list = []
-        #self.replica_by_id = {}
+        # only allocated while the file is transferred
+        self.transfer_list = None
 
-        self.transfer_list = []
+    def has_replica(self, rse_obj):
+        return bool(self.rse_mask & rse_obj.rse_bit)
 
     def add_transfer(self, transfer):
+        if self.transfer_list is None:
+            self.transfer_list = []
         self.transfer_list.append(transfer)
 
     def remove_transfer(self, transfer):
         self.transfer_list.remove(transfer)
+        if not self.transfer_list:
+            self.transfer_list = None
 
     def add_replica(self, replica_obj):
-        rse_obj = replica_obj.rse_obj
-        self.rse_list.append(rse_obj)
-        self.rse_by_name[rse_obj.name] = rse_obj
-        self.replica_list.append(replica_obj)
-
-    def remove_replica(self, replica_obj):
-        raise NotImplemented()
-        rse_obj = replica_obj.rse_obj
-        self.rse_list.remove(rse_obj)
-        del self.rse_by_name[rse_obj.name]
-        self.replica_list.remove(replica_obj)
+        self.rse_mask |= replica_obj.rse_obj.rse_bit
+        self.replica_list += (replica_obj,)
 
     def delete(self, current_time):
         monitoring.OnFileDeletion(self)
-        for transfer in self.transfer_list:
-            transfer.delete()
-        for rse in self.rse_list:
-            rse.remove_replica(self, current_time)
-        self.rse_list.clear()
-        self.rse_by_name.clear()
-        self.replica_list.clear()
-        self.transfer_list.clear()
+        if self.transfer_list:
+            # deleting a transfer can end other transfers of this file
+            for transfer in list(self.transfer_list):
+                transfer.delete()
+        for replica_obj in self.replica_list:
+            replica_obj.rse_obj.remove_replica(self, current_time)
+        self.rse_mask = 0
+        self.replica_list = ()
+        self.transfer_list = None
 
 
 class Replica:
+    __slots__ = ('rse_obj', 'file', 'rse_index', 'size', 'state')
+
     CORRUPTED = 0
     AVAILABLE = 1
     DELETED = 2
 
     def __init__(self, rse_obj, file_obj, rse_index):
-        self.id = utils.next_id()
         self.rse_obj = rse_obj
         self.file = file_obj
         self.rse_index = rse_index
@@ -63,7 +66,7 @@ class Replica:
 
     def increase(self, current_time, amount):
         self.size += amount
-        assert self.size <= self.file.size, (self.state, selft.size, self.file.size)
+        assert self.size <= self.file.size, (self.state, self.size, self.file.size)
         if self.size == self.file.size:
             self.state = self.AVAILABLE
 
@@ -1,11 +1,12 @@
+import heapq
+import itertools
 
-#import heapq
-#import bisect
+import numpy as np
 
 from gacs import abstractions
-from gacs.grid import File, StorageElement
+from gacs.common import utils
+from gacs.grid import File, ReplicaCandidateIndex, StorageElement
 
-#import itertools
 
 class Rucio:
     def __init__(self):
@@ -15,9 +16,9 @@ class Rucio:
         self.file_list = []
         self.file_by_name = {}
 
-        #self.die_time_prio_counter = itertools.count(1)
-        #self.die_times = []
-        #self.min_die_time = 0
+        # min-heap of (die_time, insertion counter, file) used by the reaper
+        self.die_time_prio_counter = itertools.count(1)
+        self.die_times = []
 
     def get_rse_obj(self, rse):
         rse_obj = None
@@ -33,20 +34,29 @@ class Rucio:
 
     def get_file_obj(self, file):
         file_obj = None
-        if isinstance(file, str):
+        if isinstance(file, (str, int)):
             file_obj = self.file_by_name.get(file)
             if not file_obj:
                 raise LookupError('file name {} is not registered'.format(file))
         elif isinstance(file, File):
             file_obj = file
         else:
-            raise TypeError('file must be either file name or file object')
+            raise TypeError('file must be either file name, file id or file object')
         return file_obj
 
     def add_rse(self, rse_obj):
         self.rse_list.append(rse_obj)
         self.rse_by_name[rse_obj.name] = rse_obj
 
+    def create_rse(self, site_obj, rse_name):
+        # storage element of the catalogue at site_obj; backends may store its replicas elsewhere
+        rse_obj = site_obj.create_rse(rse_name)
+        self.add_rse(rse_obj)
+        return rse_obj
+
+    def create_candidate_index(self, src_rses, dst_rses):
+        return ReplicaCandidateIndex(src_rses, dst_rses)
+
     def create_replica(self, file, rse):
         rse_obj = self.get_rse_obj(rse)
         file_obj = self.get_file_obj(file)
@@ -59,14 +69,39 @@ class Rucio:
         new_file = File(file_name, file_size, die_time, len(self.file_list))
         self.file_list.append(new_file)
         self.file_by_name[file_name] = new_file
-        #self.min_die_time = min(self.min_die_time, die_time)
-        # O(log n) search + rebalancing
-        # heapq.heappush(self.die_times, (die_time, next(self.die_time_prio_counter), new_file))
-
-        # O(log n) search + insertion
-        #bisect.insort(self.die_times, (die_time, next(self.die_time_prio_counter), new_file))
+        heapq.heappush(self.die_times, (die_time, next(self.die_time_prio_counter), new_file))
         return new_file
 
+    def create_files_bulk(self, sizes, die_times, replica_masks, current_time=0, names=None):
+        # registers len(sizes) complete files; replica_masks[i, j] places a replica
+        # of file i at self.rse_list[j]. Files are named with utils.next_id()
+        # unless names are given.
+        sizes = np.asarray(sizes, dtype=np.int64)
+        die_times = np.asarray(die_times)
+        replica_masks = np.asarray(replica_masks, dtype=bool)
+        num_files = len(sizes)
+        assert len(die_times) == num_files, (len(die_times), num_files)
+        assert replica_masks.shape[0] == num_files, (replica_masks.shape, num_files)
+        assert replica_masks.shape[1] <= len(self.rse_list), (replica_masks.shape, len(self.rse_list))
+
+        first_index = len(self.file_list)
+        new_files = []
+        if names is None:
+            names = [utils.next_id() for _ in range(num_files)]
+        assert len(names) == num_files, (len(names), num_files)
+        for file_index, name, size, die_time in zip(itertools.count(first_index), names, sizes.tolist(), die_times.tolist()):
+            new_file = File(name, size, die_time, file_index)
+            new_files.append(new_file)
+            self.file_by_name[new_file.name] = new_file
+            heapq.heappush(self.die_times, (die_time, next(self.die_time_prio_counter), new_file))
+        self.file_list.extend(new_files)
+
+        for rse_idx in range(replica_masks.shape[1]):
+            rows = np.flatnonzero(replica_masks[:, rse_idx])
+            if len(rows):
+                self.rse_list[rse_idx].create_replicas_bulk([new_files[row] for row in rows.tolist()], current_time)
+        return new_files
+
     def create_transfer(self, file, src_rse, dst_rse):
         src_site_obj = self.get_rse_obj(src_rse).site_obj
         dst_rse_obj = self.get_rse_obj(dst_rse)
@@ -79,80 +114,23 @@ class Rucio:
         transfer = abstractions.Transfer(file, linkselector, dst_replica)
         return transfer
 
-    def run_reaper_heap(self, current_time):
-        num_files = len(self.file_list)
-        while len(self.die_times) and self.die_times[0][0] <= current_time:
-            file = self.die_times[0][2]
-            file.delete()
-            self.file_list.remove(file)
-            del self.file_by_name[file.name]
-            heapq.heappop(self.die_times)
-        return num_files - len(self.file_list)
-
-    def run_reaper_bisect(self, current_time):
-        num_files = len(self.file_list)
-        if not num_files:
-            return 0
-
-        p = bisect.bisect_right(self.die_times, (current_time, 0, None))
-        for i in range(p):
-            f = self.die_times[i][2]
-            assert f.die_time <= current_time
-            f.delete(current_time)
-            self.file_list.remove(f)
-            del self.file_by_name[f.name]
-        del self.die_times[0:p]
-        return num_files - len(self.file_list)
-
-    def run_reaper_random(self, current_time):
-        num_files = len(self.file_list)
-        if not num_files or self.min_die_time > current_time:
-            return 0
-        self.file_list.sort(key=lambda file_obj: file_obj.die_time, reverse=True)
-        file_obj = self.file_list[-1]
-        while file_obj.die_time <= current_time:
-            file_obj.delete(current_time)
-            del self.file_by_name[file_obj.name]
-            self.file_list.pop()
-            file_obj = self.file_list[-1]
-        self.min_die_time = file_obj.die_time
-        return num_files - len(self.file_list)
-
-    def run_reaper_random2(self, current_time):
-        to_remove = list(filter(lambda file_obj: file_obj.die_time <= current_time, self.file_list))
-        #self.file_list = list(filter(lambda file_obj: file_obj.die_time > current_time, self.file_list))
-        for file_obj in to_remove:
-            tmp = self.file_list.pop()
-            try:
-                tmp.file_index = file_obj.file_index
-                self.file_list[tmp.file_index] = tmp
-            except IndexError as err:
-                print(err)
-                pass
-            file_obj.delete(current_time)
-            del self.file_by_name[file_obj.name]
-        return len(to_remove)
-
-    def run_reaper_linear(self, current_time):
-        num_files = len(self.file_list)
-
-        i = 0
-        k = num_files - 1
-        while i <= k:
-            item_k = self.file_list[k]
-            item_i = self.file_list[i]
-            while k > 0 and item_k.die_time <= current_time:
-                k -= 1
-                item_k = self.file_list[k]
-
-            if item_i.die_time <= current_time:
-                item_i.delete()
-                del self.file_by_name[item_i.name]
-                self.file_list[k] = item_i
-                self.file_list[i] = item_k
-                k -= 1
-            i += 1
-
-        if k < num_files - 1:
-            del self.file_list[k+1:]
-        return num_files - len(self.file_list)
+    def remove_file(self, file_obj, current_time):
+        # O(1) swap removal: the last file takes over the index of the removed one
+        last_file = self.file_list.pop()
+        if last_file is not file_obj:
+            last_file.file_index = file_obj.file_index
+            self.file_list[last_file.file_index] = last_file
+        del self.file_by_name[file_obj.name]
+        file_obj.delete(current_time)
+
+    def run_reaper(self, current_time):
+        # lazy deletion: heap entries of files that are no longer registered are dropped on pop
+        num_deleted = 0
+        die_times = self.die_times
+        while die_times and die_times[0][0] <= current_time:
+            file_obj = heapq.heappop(die_times)[2]
+            if self.file_by_name.get(file_obj.name) is not file_obj:
+                continue
+            self.remove_file(file_obj, current_time)
+            num_deleted += 1
+        return num_deleted
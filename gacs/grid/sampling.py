@@ -0,0 +1,112 @@
+import random
+
+
+def sample_in_place(items, k, on_move=None):
+    # partial Fisher-Yates shuffle: moves k uniformly drawn items to the front
+    # of items in O(k) and returns them; on_move(item, new_pos) is called for
+    # every item that changed its position
+    n = len(items)
+    k = min(k, n)
+    for i in range(k):
+        j = random.randrange(i, n)
+        if j != i:
+            items[i], items[j] = items[j], items[i]
+            if on_move:
+                on_move(items[i], i)
+                on_move(items[j], j)
+    return items[:k]
+
+
+class CandidateSet:
+    # swap removal list of replicas with their positions for O(1) add/discard
+    def __init__(self):
+        self.replica_list = []
+        self.position_by_replica = {}
+
+    def __len__(self):
+        return len(self.replica_list)
+
+    def add(self, replica_obj):
+        if replica_obj in self.position_by_replica:
+            return
+        self.position_by_replica[replica_obj] = len(self.replica_list)
+        self.replica_list.append(replica_obj)
+
+    def discard(self, replica_obj):
+        pos = self.position_by_replica.pop(replica_obj, None)
+        if pos is None:
+            return
+        last_replica = self.replica_list.pop()
+        if pos != len(self.replica_list):
+            self.replica_list[pos] = last_replica
+            self.position_by_replica[last_replica] = pos
+
+    def set_position(self, replica_obj, pos):
+        self.position_by_replica[replica_obj] = pos
+
+    def sample(self, k):
+        return sample_in_place(self.replica_list, k, self.set_position)
+
+
+class ReplicaCandidateIndex:
+    # Keeps for every (src rse, dst rse) pair the replicas at src whose file has
+    # no replica at dst yet. Storage elements notify the index about created and
+    # removed replicas, so drawing N transfer candidates costs O(N).
+    def __init__(self, src_rses, dst_rses):
+        self.src_rses = list(src_rses)
+        self.dst_rses = list(dst_rses)
+        self.src_mask = 0
+        self.dst_mask = 0
+        self.candidates = {}
+        for src_rse in self.src_rses:
+            self.src_mask |= src_rse.rse_bit
+            for dst_rse in self.dst_rses:
+                self.candidates[(src_rse.rse_id, dst_rse.rse_id)] = CandidateSet()
+
+        for rse_obj in self.src_rses + self.dst_rses:
+            rse_obj.replica_indexes.append(self)
+        for dst_rse in self.dst_rses:
+            self.dst_mask |= dst_rse.rse_bit
+        for src_rse in self.src_rses:
+            for replica_obj in src_rse.replica_list:
+                self.add_src_replica(replica_obj)
+
+    def get_candidates(self, src_rse, dst_rse):
+        return self.candidates[(src_rse.rse_id, dst_rse.rse_id)]
+
+    def get_num_candidates(self, src_rse, dst_rse):
+        return len(self.get_candidates(src_rse, dst_rse))
+
+    def sample(self, src_rse, dst_rse, k):
+        return self.get_candidates(src_rse, dst_rse).sample(k)
+
+    def add_src_replica(self, replica_obj):
+        file_obj = replica_obj.file
+        src_rse_id = replica_obj.rse_obj.rse_id
+        for dst_rse in self.dst_rses:
+            if not file_obj.has_replica(dst_rse):
+                self.candidates[(src_rse_id, dst_rse.rse_id)].add(replica_obj)
+
+    def get_src_replicas(self, file_obj):
+        return [replica_obj for replica_obj in file_obj.replica_list if replica_obj.rse_obj.rse_bit & self.src_mask]
+
+    def on_replica_created(self, replica_obj):
+        rse_obj = replica_obj.rse_obj
+        if rse_obj.rse_bit & self.src_mask:
+            self.add_src_replica(replica_obj)
+        if rse_obj.rse_bit & self.dst_mask:
+            for src_replica in self.get_src_replicas(replica_obj.file):
+                self.candidates[(src_replica.rse_obj.rse_id, rse_obj.rse_id)].discard(src_replica)
+
+    def on_replica_available(self, replica_obj):
+        pass
+
+    def on_replica_removed(self, replica_obj):
+        rse_obj = replica_obj.rse_obj
+        if rse_obj.rse_bit & self.src_mask:
+            for dst_rse in self.dst_rses:
+                self.candidates[(rse_obj.rse_id, dst_rse.rse_id)].discard(replica_obj)
+        if rse_obj.rse_bit & self.dst_mask and not replica_obj.file.has_replica(rse_obj):
+            for src_replica in self.get_src_replicas(replica_obj.file):
+                if src_replica is not replica_obj:
+                    self.candidates[(src_replica.rse_obj.rse_id, rse_obj.rse_id)].add(src_replica)
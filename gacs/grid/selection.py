@@ -0,0 +1,121 @@
+import math
+
+import numpy as np
+
+from gacs import abstractions
+from gacs.grid.data import Replica
+
+
+GiB = 1024**3
+
+
+class ReplicaSelector:
+    # Picks the source replica of a transfer to a destination rse. Every
+    # (src, dst) rse pair gets a score in CHF per GiB: the marginal network
+    # price of its linkselector at the traffic accounted so far plus the time
+    # one GiB takes at the bandwidth a new transfer would get, valued with
+    # time_value_chf per hour. The scores are kept in a cost matrix indexed by
+    # rse_id that is recomputed at most every refresh_interval sim seconds, so
+    # selecting a source only walks the replica list of the file. Between two
+    # refreshes every selected source counts as one more transfer on the best
+    # link of its linkselector, so a batch of stage-ins is spread over the
+    # sources instead of piling onto the one that was cheapest at the refresh.
+    # Availability is checked on the few replicas of the file instead of being
+    # kept per file, which would cost memory for every file of the catalogue.
+    def __init__(self, src_rses, dst_rses, time_value_chf=1.0, refresh_interval=60):
+        self.src_rses = list(src_rses)
+        self.dst_rses = list(dst_rses)
+        self.time_value_chf = time_value_chf
+        self.refresh_interval = refresh_interval
+        self.next_refresh_time = None
+
+        # linkselector of every (dst, src) pair that has one
+        self.pair_list = []
+        self.pair_index = {}
+        self.linkselector_list = []
+        # indices of the pairs sharing a linkselector
+        self.pairs_by_linkselector = {}
+        for dst_rse in self.dst_rses:
+            dst_site_name = dst_rse.site_obj.name
+            for src_rse in self.src_rses:
+                linkselector = src_rse.site_obj.linkselector_by_dst_name.get(dst_site_name)
+                if linkselector is not None and linkselector.link_list:
+                    pair_idx = len(self.pair_list)
+                    self.pair_list.append((dst_rse.rse_id, src_rse.rse_id))
+                    self.pair_index[(dst_rse.rse_id, src_rse.rse_id)] = pair_idx
+                    self.linkselector_list.append(linkselector)
+                    self.pairs_by_linkselector.setdefault(linkselector, []).append(pair_idx)
+        self.price_table = abstractions.PriceTable([linkselector.network_price_chf for linkselector in self.linkselector_list])
+        self.pair_rows = np.array([dst_rse_id for dst_rse_id, _ in self.pair_list], dtype=np.int64)
+        self.pair_cols = np.array([src_rse_id for _, src_rse_id in self.pair_list], dtype=np.int64)
+
+        # scores of rse pairs without linkselector stay infinite
+        max_rse_id = max([rse_obj.rse_id for rse_obj in self.src_rses + self.dst_rses], default=0)
+        self.cost_matrix = np.full((max_rse_id + 1, max_rse_id + 1), np.inf)
+        # rows of cost_matrix as lists, indexing them is cheaper than indexing numpy arrays
+        self.cost_rows = [row.tolist() for row in self.cost_matrix]
+
+        # per pair since the last refresh: marginal price, bandwidth of the best
+        # link and the number of transfers sharing it including the next one
+        self.prices = []
+        self.link_bandwidths = []
+        self.link_transfers = []
+
+    def get_traffic(self):
+        # traffic of the current billing period in GiB per linkselector
+        traffic = np.zeros(len(self.linkselector_list))
+        for idx, linkselector in enumerate(self.linkselector_list):
+            if linkselector.ledger is not None:
+                traffic[idx] = linkselector.ledger.traffic[linkselector.ledger_index]
+        return traffic / GiB
+
+    def refresh(self, current_time):
+        if not self.linkselector_list:
+            return
+        traffic = self.get_traffic()
+        prices = self.price_table.get_costs(traffic + 1) - self.price_table.get_costs(traffic)
+        # a new transfer is put on the best link and gets its available bandwidth
+        links = [linkselector.select_link() for linkselector in self.linkselector_list]
+        self.prices = prices.tolist()
+        self.link_bandwidths = [link.bandwidth for link in links]
+        self.link_transfers = [link.active_transfers + 1 for link in links]
+        hours = GiB * np.array(self.link_transfers) / np.array(self.link_bandwidths) / 3600
+        self.cost_matrix[self.pair_rows, self.pair_cols] = prices + self.time_value_chf * hours
+        self.cost_rows = [row.tolist() for row in self.cost_matrix]
+        self.next_refresh_time = current_time + self.refresh_interval
+
+    def add_selection(self, dst_rse_id, src_rse_id):
+        # the selected transfer will share the best link with the next one
+        linkselector = self.linkselector_list[self.pair_index[(dst_rse_id, src_rse_id)]]
+        for pair_idx in self.pairs_by_linkselector[linkselector]:
+            self.link_transfers[pair_idx] += 1
+            hours = GiB * self.link_transfers[pair_idx] / self.link_bandwidths[pair_idx] / 3600
+            dst_id, src_id = self.pair_list[pair_idx]
+            cost = self.prices[pair_idx] + self.time_value_chf * hours
+            self.cost_matrix[dst_id, src_id] = cost
+            self.cost_rows[dst_id][src_id] = cost
+
+    def get_cost_row(self, dst_rse, current_time):
+        if self.next_refresh_time is None or current_time >= self.next_refresh_time:
+            self.refresh(current_time)
+        return self.cost_rows[dst_rse.rse_id]
+
+    def select_source(self, file_obj, dst_rse, current_time):
+        # cheapest available replica of file_obj to transfer to dst_rse or None
+        cost_row = self.get_cost_row(dst_rse, current_time)
+        num_costs = len(cost_row)
+        best_replica = None
+        best_cost = math.inf
+        for replica_obj in file_obj.replica_list:
+            if replica_obj.state != Replica.AVAILABLE:
+                continue
+            rse_id = replica_obj.rse_obj.rse_id
+            if rse_id >= num_costs:
+                continue
+            cost = cost_row[rse_id]
+            if cost < best_cost:
+                best_replica = replica_obj
+                best_cost = cost
+        if best_replica is not None:
+            self.add_selection(dst_rse.rse_id, best_replica.rse_obj.rse_id)
+        return best_replica
@@ -1,6 +1,8 @@
 
 from gacs import abstractions
+from gacs.common import utils
 from gacs.grid import Replica
+from gacs.grid.sampling import sample_in_place
 
 
 class Site:
@@ -29,11 +31,15 @@ class StorageElement:
     def __init__(self, site_obj, name):
         self.site_obj = site_obj
         self.name = name
+        self.rse_id = utils.next_rse_id()
+        self.rse_bit = 1 << self.rse_id
 
         self.used_storage = 0
 
         self.replica_list = []
         self.replica_by_name = {}
+        # observers (e.g. ReplicaCandidateIndex) notified about created, completed and removed replicas
+        self.replica_indexes = []
 
     def create_replica(self, file_obj):
         if file_obj.name in self.replica_by_name:
@@ -42,24 +48,48 @@ class StorageElement:
         self.replica_list.append(new_replica)
         self.replica_by_name[file_obj.name] = new_replica
         file_obj.add_replica(new_replica)
+        for index in self.replica_indexes:
+            index.on_replica_created(new_replica)
         return new_replica
 
+    def set_replica_position(self, replica_obj, pos):
+        replica_obj.rse_index = pos
+
+    def sample_replicas(self, k):
+        # uniform sample of k replicas in O(k) without copying replica_list
+        return sample_in_place(self.replica_list, k, self.set_replica_position)
+
+    def create_replicas_bulk(self, file_objs, current_time):
+        # creates complete replicas and accounts their storage at once
+        total_size = 0
+        for file_obj in file_objs:
+            new_replica = self.create_replica(file_obj)
+            new_replica.increase(current_time, file_obj.size)
+            total_size += file_obj.size
+        if total_size > 0:
+            self.increase_storage(current_time, total_size)
+
     def increase_replica(self, file_obj, current_time, amount):
         assert amount > 0, amount
         replica_obj = self.replica_by_name[file_obj.name]
         amount = min(amount, file_obj.size - replica_obj.size)
-        self.used_storage += amount
+        self.increase_storage(current_time, amount)
         replica_obj.increase(current_time, amount)
+        if replica_obj.state == Replica.AVAILABLE:
+            for index in self.replica_indexes:
+                index.on_replica_available(replica_obj)
+
+    def increase_storage(self, current_time, amount):
+        self.used_storage += amount
 
     def remove_replica(self, file_obj, current_time):
         replica_obj = self.replica_by_name.pop(file_obj.name)
-        tmp = self.replica_list.pop()
-        try:
-            tmp.rse_index = replica_obj.rse_index
-            self.replica_list[tmp.rse_index] = tmp
-        except IndexError as err:
-            print(err)
-            pass
-        #self.replica_list.remove(replica_obj)
+        # O(1) swap removal: the last replica takes over the index of the removed one
+        last_replica = self.replica_list.pop()
+        if last_replica is not replica_obj:
+            last_replica.rse_index = replica_obj.rse_index
+            self.replica_list[last_replica.rse_index] = last_replica
         self.used_storage -= replica_obj.size
+        for index in self.replica_indexes:
+            index.on_replica_removed(replica_obj)
         replica_obj.delete(current_time)
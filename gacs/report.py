@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+
+from gacs.common import monitoring, utils
+
+
+def print_summary(summary):
+    counters = summary['counters']
+    transfers = summary['transfers']
+    print('NumComplete:    {:,d}'.format(counters['transfer_num_completed']))
+    print('NumDeleted:     {:,d}'.format(counters['transfer_num_deleted']))
+    if transfers['num']:
+        print('MinTransferred: {}'.format(utils.sizefmt(transfers['size_min'])))
+        print('MaxTransferred: {}'.format(utils.sizefmt(transfers['size_max'])))
+        print('AvgTransferred: {}'.format(utils.sizefmt(transfers['size_mean'])))
+        print('MinDuration:    {}'.format(transfers['duration_min']))
+        print('MaxDuration:    {}'.format(transfers['duration_max']))
+        print('AvgDuration:    {:,.2f}'.format(transfers['duration_mean']))
+    jobs = summary.get('jobs')
+    if jobs:
+        print('JobsDone:       {:,d}'.format(counters['job_num_done']))
+        print('JobsFailed:     {:,d}'.format(counters['job_num_failed']))
+        print('AvgStageIn:     {:,.2f}'.format(jobs['stagein_duration_mean']))
+        print('AvgQueued:      {:,.2f}'.format(jobs['queue_duration_mean']))
+        print('AvgRuntime:     {:,.2f}'.format(jobs['run_duration_mean']))
+    for bill in summary['bills']:
+        print('Bill month {:>2}:  CHF {:,.2f} storage, CHF {:,.2f} network'.format(bill['month'],
+                                                                                bill['storage_total'],
+                                                                                bill['network_total']))
+
+
+def print_profile(processes, sim_time):
+    # where the wall time of a profiled run went, also per simulated day
+    total = processes['wall_time'].sum() or 1.0
+    sim_days = sim_time / (24 * 3600) or 1.0
+    print('{:<48} {:>10} {:>6} {:>12} {:>12} {:>10} {:>10}'.format('process', 'wall/s', '%', 'resumptions',
+                                                                   'events', 'us/resume', 's/sim-day'))
+    for row in processes:
+        resumptions = row['resumptions'].item()
+        wall_time = row['wall_time'].item()
+        per_resume = wall_time / resumptions * 1e6 if resumptions else 0.0
+        print('{:<48} {:>10.3f} {:>6.1f} {:>12,d} {:>12,d} {:>10.1f} {:>10.3f}'.format(row['process'].item(),
+                                                                                 wall_time,
+                                                                                 100 * wall_time / total,
+                                                                                 resumptions,
+                                                                                 row['events'].item(),
+                                                                                 per_resume,
+                                                                                 wall_time / sim_days))
+
+
+def make_figures(results):
+    import matplotlib.pyplot as plt
+    figures = {}
+    ticks = results['ticks']
+    storage = results['storage']
+
+    fig, ax = plt.subplots()
+    for idx, name in enumerate(results['storage_buckets']):
+        rows = storage[storage['bucket'] == idx]
+        ax.plot(rows['time'], rows['volume'], label=name)
+    ax.legend()
+    ax.set_ylabel('volume GiB')
+    ax.set_xlabel('sim time/tick')
+    figures['storage_volume'] = fig
+
+    fig, ax = plt.subplots()
+    for idx, name in enumerate(results['storage_buckets']):
+        rows = storage[storage['bucket'] == idx]
+        ax.plot(rows['time'], rows['cost'], label=name)
+    ax.legend()
+    ax.set_ylabel('costs/CHF')
+    ax.set_xlabel('sim time/tick')
+    figures['storage_cost'] = fig
+
+    costs = results['costs']
+    if len(costs):
+        fig, ax = plt.subplots()
+        ax.plot(costs['time'], costs['storage_total'], label='storage')
+        ax.plot(costs['time'], costs['network_total'], label='network')
+        ax.legend()
+        ax.set_ylabel('costs since last bill/CHF')
+        ax.set_xlabel('sim time/tick')
+        figures['costs_to_date'] = fig
+
+    fig, ax = plt.subplots()
+    ax.plot(ticks['time'], ticks['num_active_transfers'])
+    ax.legend(['NumActiveTransfers'])
+    ax.set_ylabel('count')
+    ax.set_xlabel('sim time/tick')
+    figures['active_transfers'] = fig
+
+    fig, ax = plt.subplots()
+    ax.plot(ticks['time'], ticks['reaper_duration'])
+    ax.legend(['ReaperDuration'])
+    ax.set_ylabel('duration/s (realtime)')
+    ax.set_xlabel('sim time/tick')
+    figures['reaper_duration'] = fig
+
+    fig, ax = plt.subplots()
+    ax.plot(ticks['time'], ticks['num_files'])
+    ax.legend(['NumFiles'])
+    ax.set_ylabel('count')
+    ax.set_xlabel('sim time/tick')
+    figures['num_files'] = fig
+    return figures
+
+
+def show_results(results):
+    import matplotlib.pyplot as plt
+    make_figures(results)
+    plt.show()
+
+
+def save_figures(results, output_dir, fmt):
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, fig in make_figures(results).items():
+        path = os.path.join(output_dir, '{}.{}'.format(name, fmt))
+        fig.savefig(path)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='gacs-report', description='Summarises and plots the results file of a simulation run.')
+    parser.add_argument('results', help='npz results file written by sim.py --results')
+    parser.add_argument('-o', '--output-dir', help='directory the figures are rendered to')
+    parser.add_argument('-f', '--format', default='png', choices=['png', 'svg', 'pdf'], help='image format of the figures')
+    parser.add_argument('--json', action='store_true', help='print the summary as json')
+    parser.add_argument('--show', action='store_true', help='show the figures interactively')
+    args = parser.parse_args(argv)
+
+    results = monitoring.load_results(args.results)
+    summary = monitoring.summarize(results)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+        if 'profile' in results:
+            print_profile(results['profile']['processes'], summary.get('sim_time', 0))
+
+    if args.output_dir:
+        if not args.show:
+            import matplotlib
+            matplotlib.use('Agg')
+        for path in save_figures(results, args.output_dir, args.format):
+            print('Wrote {}'.format(path))
+    if args.show:
+        show_results(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,3 @@
 from .basesim import BaseSim
+from .transferengine import FluidTransferEngine, PollingTransferEngine, TableTransferEngine
+from .jobscheduler import Job, JobScheduler
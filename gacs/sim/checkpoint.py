@@ -0,0 +1,102 @@
+import gzip
+import math
+import pickle
+import random
+
+import numpy.random as npr
+import simpy
+
+from gacs.common import monitoring, utils
+
+
+class SimPickler(pickle.Pickler):
+    # the simpy environment is not pickled; every reference to it is replaced
+    # by the environment of the restoring run
+    def __init__(self, f, env):
+        super().__init__(f, pickle.HIGHEST_PROTOCOL)
+        self.env = env
+
+    def persistent_id(self, obj):
+        if obj is self.env:
+            return 'env'
+        return None
+
+
+class SimUnpickler(pickle.Unpickler):
+    def __init__(self, f, env):
+        super().__init__(f)
+        self.env = env
+
+    def persistent_load(self, pid):
+        if pid == 'env':
+            return self.env
+        raise pickle.UnpicklingError('unknown persistent id {}'.format(pid))
+
+
+def get_pending_events(env):
+    # (time, priority, event id) of every event scheduled in env. simpy has no
+    # public api for the scheduled time of an event, so this reads the event
+    # queue of simpy 4; it is the only place that depends on simpy internals.
+    if simpy.__version__.split('.')[0] != '4':
+        raise RuntimeError('checkpoints require simpy 4, found simpy {}'.format(simpy.__version__))
+    return {event: (time, priority, eid) for time, priority, eid, event in env._queue}
+
+
+def save(path, env, sim_state, wakeups):
+    # wakeups is a list of (event, key) pairs for the pending timeouts that
+    # have to be recreated on restore. The event ids are saved as well, so the
+    # recreated events keep their order among events with equal times.
+    pending = get_pending_events(env)
+    wakeup_list = []
+    for event, key in wakeups:
+        if event not in pending:
+            raise RuntimeError('cannot checkpoint {}: not waiting on a scheduled event'.format(key))
+        event_time, _, eid = pending[event]
+        wakeup_list.append((event_time, eid, key))
+    wakeup_list.sort(key=lambda wakeup: wakeup[:2])
+
+    state = {'sim': sim_state,
+             'wakeups': wakeup_list,
+             'monitoring': monitoring.data,
+             'utils': utils.get_state(),
+             'random': random.getstate(),
+             'numpy_random': npr.get_state()}
+    # higher compression levels barely shrink checkpoints but take many times longer
+    with gzip.open(path, 'wb', compresslevel=1) as f:
+        # the sim time comes first so the environment can be created before the state is loaded
+        pickle.dump(env.now, f, pickle.HIGHEST_PROTOCOL)
+        SimPickler(f, env).dump(state)
+
+
+def load(path, env_class=simpy.Environment):
+    # returns the new environment, the saved sim state and the recreated
+    # wakeups as list of (event, key) pairs
+    with gzip.open(path, 'rb') as f:
+        env = env_class(initial_time=pickle.load(f))
+        state = SimUnpickler(f, env).load()
+
+    monitoring.data = state['monitoring']
+    utils.set_state(state['utils'])
+    random.setstate(state['random'])
+    npr.set_state(state['numpy_random'])
+
+    wakeups = []
+    for event_time, _, key in state['wakeups']:
+        wakeups.append((schedule_at(env, event_time), key))
+    return env, state['sim'], wakeups
+
+
+def get_exact_delay(now, event_time):
+    # delay for which now + delay == event_time; event_time - now can be off by
+    # one ulp for the float completion times of the transfer engines
+    delay = event_time - now
+    while now + delay < event_time:
+        delay = math.nextafter(delay, math.inf)
+    while now + delay > event_time:
+        delay = math.nextafter(delay, -math.inf)
+    return delay
+
+
+def schedule_at(env, event_time):
+    # like env.timeout() but with an absolute time
+    return env.timeout(get_exact_delay(env.now, event_time))
@@ -0,0 +1,236 @@
+import collections
+import heapq
+import math
+import random
+
+from gacs import abstractions, grid
+from gacs.common import monitoring, utils
+
+
+class Job:
+    STAGEIN = 1
+    QUEUED = 2
+    RUNNING = 3
+    STAGEOUT = 4
+    DONE = 5
+    FAILED = 6
+
+    def __init__(self, bucket_obj, input_files, runtime):
+        self.id = utils.next_id()
+        self.bucket_obj = bucket_obj
+        self.input_files = input_files
+        self.runtime = runtime
+        self.output_files = []
+        self.state = self.STAGEIN
+
+        self.num_pending_inputs = 0
+        self.num_transfers = 0
+        self.submit_time = 0
+        self.queue_time = 0
+        self.start_time = 0
+        self.end_time = 0
+
+
+class ComputeSite:
+    # compute slots of one region and the jobs waiting for one
+    def __init__(self, region_obj, num_slots):
+        self.region_obj = region_obj
+        self.num_slots = num_slots
+        self.num_busy = 0
+        self.queue = collections.deque()
+
+
+class JobScheduler:
+    # Runs jobs without one simpy process per job. Missing input files are
+    # staged in through the shared transfer engine; all jobs waiting for the same
+    # file at the same bucket share one transfer. Jobs with all inputs wait for a
+    # compute slot of their region. Running and staging out jobs are kept in a
+    # heap of end times and one simpy event is scheduled for the earliest one.
+    # End times are rounded up to multiples of time_resolution, which bounds the
+    # event rate independent of the number of jobs.
+    def __init__(self, sim, rucio, transfer_engine, replica_selector, num_slots_per_region, time_resolution=60, stageout_duration=300,
+                 output_prefix=''):
+        self.sim = sim
+        self.rucio = rucio
+        self.transfer_engine = transfer_engine
+        self.replica_selector = replica_selector
+        self.num_slots_per_region = num_slots_per_region
+        self.time_resolution = time_resolution
+        self.stageout_duration = stageout_duration
+        self.output_lifetime = 14 * 24 * 3600
+        # prepended to the output file names, which must be unique across the shards of a run
+        self.output_prefix = output_prefix
+
+        self.compute_site_by_region = {}
+        # (file name, bucket rse_id) -> jobs waiting for the transfer of the file
+        self.waiting_jobs_by_transfer = {}
+        # min-heap of (end time, job id, job) of running and staging out jobs
+        self.end_heap = []
+        self.num_active = 0
+        self.generation = 0
+        self.wakeup_event = None
+        self.wakeup_time = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['wakeup_event'] = None
+        return state
+
+    def get_num_active(self):
+        return self.num_active
+
+    def get_compute_site(self, region_obj):
+        compute_site = self.compute_site_by_region.get(region_obj)
+        if compute_site is None:
+            compute_site = ComputeSite(region_obj, self.num_slots_per_region)
+            self.compute_site_by_region[region_obj] = compute_site
+        return compute_site
+
+    def submit(self, jobs):
+        current_time = self.sim.now
+        new_transfers = []
+        for job in jobs:
+            job.submit_time = current_time
+            self.num_active += 1
+            if not self.stage_in(job, new_transfers):
+                self.end_job(job, Job.FAILED, current_time)
+            elif job.num_pending_inputs == 0:
+                self.enqueue(job, current_time)
+        if new_transfers:
+            self.transfer_engine.submit(new_transfers)
+        self.schedule_wakeup(current_time)
+
+    def stage_in(self, job, new_transfers):
+        bucket_obj = job.bucket_obj
+        for file_obj in job.input_files:
+            replica_obj = bucket_obj.replica_by_name.get(file_obj.name)
+            if replica_obj is not None and replica_obj.state == grid.Replica.AVAILABLE:
+                continue
+
+            key = (file_obj.name, bucket_obj.rse_id)
+            waiting_jobs = self.waiting_jobs_by_transfer.get(key)
+            if waiting_jobs is None:
+                if replica_obj is not None:
+                    # transfer created by someone else, e.g. the transfer generation
+                    transfer = self.find_transfer(file_obj, bucket_obj)
+                    if transfer is None:
+                        return False
+                else:
+                    src_replica = self.replica_selector.select_source(file_obj, bucket_obj, self.sim.now)
+                    if src_replica is None:
+                        return False
+                    transfer = self.rucio.create_transfer(file_obj, src_replica.rse_obj, bucket_obj)
+                    new_transfers.append(transfer)
+                    job.num_transfers += 1
+                transfer.waiter = self
+                waiting_jobs = []
+                self.waiting_jobs_by_transfer[key] = waiting_jobs
+            waiting_jobs.append(job)
+            job.num_pending_inputs += 1
+        return True
+
+    def find_transfer(self, file_obj, bucket_obj):
+        for transfer in file_obj.transfer_list or ():
+            if transfer.dst_rse is bucket_obj:
+                return transfer
+        return None
+
+    def on_transfer_end(self, transfer):
+        # called by Transfer.end() of every transfer this scheduler waits for
+        current_time = self.sim.now
+        key = (transfer.file.name, transfer.dst_rse.rse_id)
+        for job in self.waiting_jobs_by_transfer.pop(key, ()):
+            if job.state != Job.STAGEIN:
+                continue
+            if transfer.state != abstractions.Transfer.COMPLETE:
+                self.end_job(job, Job.FAILED, current_time)
+                continue
+            job.num_pending_inputs -= 1
+            if job.num_pending_inputs == 0:
+                self.enqueue(job, current_time)
+        self.schedule_wakeup(current_time)
+
+    def enqueue(self, job, current_time):
+        job.state = Job.QUEUED
+        job.queue_time = current_time
+        compute_site = self.get_compute_site(job.bucket_obj.site_obj)
+        compute_site.queue.append(job)
+        self.start_jobs(compute_site, current_time)
+
+    def start_jobs(self, compute_site, current_time):
+        while compute_site.queue and compute_site.num_busy < compute_site.num_slots:
+            job = compute_site.queue.popleft()
+            compute_site.num_busy += 1
+            job.state = Job.RUNNING
+            job.start_time = current_time
+            self.push_end(job, current_time + job.runtime)
+
+    def push_end(self, job, end_time):
+        if self.time_resolution > 0:
+            end_time = math.ceil(end_time / self.time_resolution) * self.time_resolution
+        heapq.heappush(self.end_heap, (end_time, job.id, job))
+
+    def stage_out(self, job, current_time):
+        bucket_obj = job.bucket_obj
+        die_time = current_time + self.output_lifetime
+        for name, size in (('{}out_res_j{}'.format(self.output_prefix, job.id), random.randint(2**26, 2**30)),
+                           ('{}out_log_j{}'.format(self.output_prefix, job.id), random.randint(2**21, 2**24))):
+            file_obj = self.rucio.create_file(name, size, die_time)
+            self.rucio.create_replica(file_obj, bucket_obj)
+            bucket_obj.increase_replica(file_obj, current_time, size)
+            job.output_files.append(file_obj)
+        job.state = Job.STAGEOUT
+        self.push_end(job, current_time + self.stageout_duration)
+
+    def end_job(self, job, state, current_time):
+        job.state = state
+        job.end_time = current_time
+        self.num_active -= 1
+        monitoring.OnJobEnd(job)
+
+    def process_ends(self, current_time):
+        freed_sites = {}
+        end_heap = self.end_heap
+        while end_heap and end_heap[0][0] <= current_time:
+            job = heapq.heappop(end_heap)[2]
+            if job.state == Job.RUNNING:
+                self.stage_out(job, current_time)
+            else:
+                compute_site = self.get_compute_site(job.bucket_obj.site_obj)
+                compute_site.num_busy -= 1
+                freed_sites[compute_site] = None
+                self.end_job(job, Job.DONE, current_time)
+        for compute_site in freed_sites:
+            self.start_jobs(compute_site, current_time)
+
+    def schedule_wakeup(self, current_time):
+        if not self.end_heap:
+            return
+        wakeup_time = self.end_heap[0][0]
+        if self.wakeup_event is not None and self.wakeup_time <= wakeup_time:
+            return
+        self.generation += 1
+        self.watch_wakeup(self.sim.timeout(max(wakeup_time - current_time, 0)), wakeup_time)
+
+    def watch_wakeup(self, event, wakeup_time):
+        self.wakeup_event = event
+        self.wakeup_time = wakeup_time
+        generation = self.generation
+        event.callbacks.append(lambda event: self.on_wakeup(generation))
+
+    def on_wakeup(self, generation):
+        if generation != self.generation:
+            return
+        self.wakeup_event = None
+        current_time = self.sim.now
+        self.process_ends(current_time)
+        self.schedule_wakeup(current_time)
+
+    def get_pending_events(self):
+        if self.wakeup_event is None:
+            return []
+        return [(self.wakeup_event, self.wakeup_time)]
+
+    def resume_event(self, wakeup_time, event):
+        # continues a scheduler restored from a checkpoint with a recreated event
+        self.watch_wakeup(event, wakeup_time)
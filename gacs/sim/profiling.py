@@ -0,0 +1,96 @@
+import math
+import time
+
+import numpy as np
+import simpy
+
+from gacs.common import monitoring
+
+
+class ProcessStats:
+    def __init__(self, name):
+        self.name = name
+        self.wall_time = 0.0
+        self.resumptions = 0
+        self.events = 0
+        # resumption wall times in log2 microsecond bins
+        self.histogram = np.zeros(monitoring.PROFILE_HISTOGRAM_BINS, dtype=np.int64)
+
+    def add_resumption(self, wall_time):
+        self.wall_time += wall_time
+        self.resumptions += 1
+        exponent = math.frexp(wall_time * 1e6)[1]
+        self.histogram[min(max(exponent, 0), len(self.histogram) - 1)] += 1
+
+
+class ProfilingEnvironment(simpy.Environment):
+    # simpy environment that wraps every process it starts. Per process name
+    # (the qualified name of the generator function) it records the wall time
+    # spent in the generator, the number of resumptions and the number of
+    # events scheduled while it ran. Events scheduled and time spent outside of
+    # processes (event callbacks and the simpy kernel) are accounted as 'other'.
+    OTHER = 'other'
+
+    def __init__(self, initial_time=0):
+        super().__init__(initial_time)
+        self.stats_by_name = {}
+        self.other_stats = ProcessStats(self.OTHER)
+        self.current_stats = None
+        self.step_wall_time = 0.0
+
+    def get_stats(self, name):
+        stats = self.stats_by_name.get(name)
+        if stats is None:
+            stats = ProcessStats(name)
+            self.stats_by_name[name] = stats
+        return stats
+
+    def process(self, generator):
+        name = getattr(generator, '__qualname__', type(generator).__name__)
+        return super().process(self.profile_generator(self.get_stats(name), generator))
+
+    def profile_generator(self, stats, generator):
+        value = None
+        error = None
+        while True:
+            self.current_stats = stats
+            t1 = time.perf_counter()
+            try:
+                if error is None:
+                    event = generator.send(value)
+                else:
+                    event = generator.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                stats.add_resumption(time.perf_counter() - t1)
+                self.current_stats = None
+            try:
+                value = yield event
+                error = None
+            except BaseException as err:
+                value = None
+                error = err
+
+    def schedule(self, event, priority=simpy.events.NORMAL, delay=0):
+        (self.current_stats or self.other_stats).events += 1
+        super().schedule(event, priority, delay)
+
+    def step(self):
+        t1 = time.perf_counter()
+        try:
+            super().step()
+        finally:
+            self.step_wall_time += time.perf_counter() - t1
+
+    def get_stats_list(self):
+        # per process stats sorted by wall time followed by the remainder
+        stats_list = sorted(self.stats_by_name.values(), key=lambda stats: stats.wall_time, reverse=True)
+        other = self.other_stats
+        other.wall_time = max(self.step_wall_time - sum(stats.wall_time for stats in stats_list), 0.0)
+        other.resumptions = 0
+        return stats_list + [other]
+
+
+def export(env):
+    monitoring.OnProfileDone(env.get_stats_list())
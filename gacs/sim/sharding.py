@@ -0,0 +1,335 @@
+import multiprocessing
+import time
+
+import numpy as np
+
+from gacs import abstractions
+from gacs.common import monitoring
+from gacs.sim import checkpoint
+
+
+def partition_regions(region_list, num_shards):
+    # contiguous groups of regions of about equal size; the default region order
+    # keeps the regions of a multi location together
+    shard_by_region_name = {}
+    for idx, region in enumerate(region_list):
+        shard_by_region_name[region.name] = idx * num_shards // len(region_list)
+    return shard_by_region_name
+
+
+class ShardRouter:
+    # Connects the simulator of one shard with the other shards. A shard owns
+    # the buckets of its regions and simulates the transfers leaving them. The
+    # grid is replicated in every shard, so grid to cloud transfers are
+    # simulated by the shard of the destination.
+    #
+    # Messages are timestamped lookahead seconds after the event that sent
+    # them; this is the delay with which transfer requests start and replica
+    # registrations arrive in the other shards. It allows the shards to run
+    # ahead independently within windows of lookahead seconds.
+    #
+    # The router is registered as replica observer of the local buckets, to
+    # register their completed replicas in the other shards, and it is the
+    # transfer engine of the job scheduler, to forward transfers from remote
+    # buckets to the shard owning the source.
+    def __init__(self, sim, rucio, transfer_engine, rse_by_name, shard_id, shard_by_site_name, lookahead):
+        assert lookahead > 0, lookahead
+        self.sim = sim
+        self.rucio = rucio
+        # grid rses and buckets of all shards
+        self.rse_by_name = rse_by_name
+        self.transfer_engine = transfer_engine
+        self.shard_id = shard_id
+        self.shard_by_site_name = shard_by_site_name
+        self.num_shards = max(shard_by_site_name.values()) + 1
+        self.lookahead = lookahead
+
+        self.outbox = []
+        self.num_sent = 0
+        # local proxies of transfers forwarded to another shard by transfer id
+        self.remote_transfers = {}
+        # (shard, remote transfer id) of transfers simulated for another shard
+        self.forwarded_transfers = {}
+        # transfers forwarded to other shards and how many of them completed
+        self.num_remote_submitted = 0
+        self.num_remote_completed = 0
+
+    def get_shard(self, rse_obj):
+        # sites of the grid are not partitioned and belong to every shard
+        return self.shard_by_site_name.get(rse_obj.site_obj.name, self.shard_id)
+
+    def is_local(self, rse_obj):
+        return self.get_shard(rse_obj) == self.shard_id
+
+    def send(self, dst_shard, kind, payload):
+        self.outbox.append((dst_shard, (self.sim.now + self.lookahead, self.shard_id, self.num_sent, kind, payload)))
+        self.num_sent += 1
+
+    def broadcast(self, kind, payload):
+        for dst_shard in range(self.num_shards):
+            if dst_shard != self.shard_id:
+                self.send(dst_shard, kind, payload)
+
+    def get_stats(self):
+        return {'num_sent': self.num_sent,
+                'num_remote_submitted': self.num_remote_submitted,
+                'num_remote_completed': self.num_remote_completed}
+
+    def take_outbox(self):
+        outbox = self.outbox
+        self.outbox = []
+        return outbox
+
+    def deliver(self, messages):
+        # messages are (time, src shard, sequence nr, kind, payload) tuples
+        for message in sorted(messages, key=lambda message: message[:3]):
+            assert message[0] >= self.sim.now, (message, self.sim.now)
+            event = checkpoint.schedule_at(self.sim, message[0])
+            event.callbacks.append(lambda event, message=message: self.on_message(message))
+
+    def on_message(self, message):
+        _, src_shard, _, kind, payload = message
+        if kind == 'replica':
+            self.on_remote_replica(*payload)
+        elif kind == 'transfer':
+            self.on_transfer_request(src_shard, *payload)
+        elif kind == 'transfer_end':
+            self.on_remote_transfer_end(*payload)
+        else:
+            raise ValueError('unknown message kind {}'.format(kind))
+
+    # replica observer of the local buckets
+
+    def on_replica_created(self, replica_obj):
+        pass
+
+    def on_replica_removed(self, replica_obj):
+        pass
+
+    def on_replica_available(self, replica_obj):
+        self.broadcast('replica', (replica_obj.file.name, replica_obj.rse_obj.name))
+
+    def on_remote_replica(self, file_name, rse_name):
+        # files that only exist in the sending shard (job outputs) or that are
+        # deleted already are ignored
+        file_obj = self.rucio.file_by_name.get(file_name)
+        rse_obj = self.rse_by_name[rse_name]
+        if file_obj is None or file_name in rse_obj.replica_by_name:
+            return
+        self.rucio.create_replica(file_obj, rse_obj)
+        rse_obj.increase_replica(file_obj, self.sim.now, file_obj.size)
+
+    # transfer engine interface for the job scheduler
+
+    def get_num_active(self):
+        return self.transfer_engine.get_num_active() + len(self.remote_transfers)
+
+    def submit(self, transfers):
+        local_transfers = []
+        for transfer in transfers:
+            src_rse = transfer.linkselector.src_site
+            src_shard = self.shard_by_site_name.get(src_rse.name, self.shard_id)
+            if src_shard == self.shard_id:
+                local_transfers.append(transfer)
+                continue
+            # the proxy is never begun; it only waits for the end message
+            transfer.engine = self
+            transfer.file.add_transfer(transfer)
+            self.remote_transfers[transfer.id] = transfer
+            self.num_remote_submitted += 1
+            src_replica = self.get_src_replica(transfer)
+            self.send(src_shard, 'transfer', (transfer.id, transfer.file.name, src_replica.rse_obj.name, transfer.dst_rse.name))
+        if local_transfers:
+            self.transfer_engine.submit(local_transfers)
+
+    def get_src_replica(self, transfer):
+        # the replica at the source site the transfer was created for
+        for replica_obj in transfer.file.replica_list:
+            if replica_obj.rse_obj.site_obj is transfer.linkselector.src_site and replica_obj is not transfer.dst_replica:
+                return replica_obj
+        raise LookupError('no source replica for transfer {}'.format(transfer.id))
+
+    def on_transfer_deleted(self, transfer):
+        # the file of a forwarded transfer was deleted locally
+        if self.remote_transfers.pop(transfer.id, None) is None:
+            return
+        transfer.end_time = self.sim.now
+        if transfer.waiter:
+            transfer.waiter.on_transfer_end(transfer)
+
+    def on_transfer_request(self, src_shard, remote_id, file_name, src_rse_name, dst_rse_name):
+        file_obj = self.rucio.file_by_name.get(file_name)
+        dst_rse = self.rse_by_name[dst_rse_name]
+        src_replica = None
+        if file_obj is not None:
+            src_replica = self.rse_by_name[src_rse_name].replica_by_name.get(file_name)
+        if src_replica is None or file_name in dst_rse.replica_by_name:
+            self.send(src_shard, 'transfer_end', (remote_id, abstractions.Transfer.DELETED))
+            return
+        transfer = self.rucio.create_transfer(file_obj, src_replica.rse_obj, dst_rse)
+        transfer.waiter = self
+        self.forwarded_transfers[transfer.id] = (src_shard, remote_id)
+        self.transfer_engine.submit([transfer])
+
+    def on_transfer_end(self, transfer):
+        # a transfer simulated for another shard ended
+        src_shard, remote_id = self.forwarded_transfers.pop(transfer.id)
+        self.send(src_shard, 'transfer_end', (remote_id, transfer.state))
+
+    def on_remote_transfer_end(self, transfer_id, state):
+        transfer = self.remote_transfers.pop(transfer_id, None)
+        if transfer is None:
+            return
+        current_time = self.sim.now
+        transfer.end_time = current_time
+        transfer.file.remove_transfer(transfer)
+        dst_replica = transfer.dst_replica
+        if state == abstractions.Transfer.COMPLETE and dst_replica.state != dst_replica.DELETED:
+            # the traffic was accounted by the shard of the source
+            transfer.dst_rse.increase_replica(transfer.file, current_time, transfer.file.size - dst_replica.size)
+            transfer.state = abstractions.Transfer.COMPLETE
+            self.num_remote_completed += 1
+        else:
+            transfer.state = abstractions.Transfer.DELETED
+        if transfer.waiter:
+            transfer.waiter.on_transfer_end(transfer)
+
+
+def run_shard(conn, factory, shard_id, num_shards):
+    # worker process of one shard, driven by run_sharded(); every reply
+    # includes the cpu time the shard spent on the request
+    cpu_time = time.process_time()
+    cloud_sim = factory(shard_id, num_shards)
+    cloud_sim.init_simulation()
+    cloud_sim.start_processes()
+    env = cloud_sim.sim
+    router = cloud_sim.shard_router
+    conn.send((env.peek(), cloud_sim.SIM_DURATION, router.lookahead, time.process_time() - cpu_time))
+    while True:
+        command, until, messages = conn.recv()
+        if command == 'finish':
+            break
+        cpu_time = time.process_time()
+        router.deliver(messages)
+        if until > env.now:
+            env.run(until=until)
+        conn.send((env.peek(), router.take_outbox(), time.process_time() - cpu_time))
+    results = monitoring.data.get_results()
+    results['router'] = router.get_stats()
+    conn.send(results)
+    conn.close()
+
+
+def receive(conn, shard_id):
+    try:
+        return conn.recv()
+    except EOFError:
+        raise RuntimeError('shard {} exited unexpectedly'.format(shard_id)) from None
+
+
+def run_sharded(factory, num_shards):
+    # Runs one simulator per shard in worker processes; factory(shard_id,
+    # num_shards) creates the simulator of a shard. Conservative time
+    # synchronization: every round, all shards run up to the earliest pending
+    # event or message plus the lookahead. Events before that time cannot be
+    # affected by messages that are sent in the same round, because messages
+    # are timestamped lookahead seconds after their cause.
+    # Returns the merged results of all shards. results['sharding'] holds the
+    # number of rounds, the cpu seconds, counters and router stats of every
+    # shard; the critical path sums the cpu seconds of the slowest shard of
+    # every round. It leaves out the communication, so it is a lower bound of
+    # the wall time on one core per shard.
+    ctx = multiprocessing.get_context()
+    conns = []
+    workers = []
+    for shard_id in range(num_shards):
+        parent_conn, child_conn = ctx.Pipe()
+        worker = ctx.Process(target=run_shard, args=(child_conn, factory, shard_id, num_shards), daemon=True)
+        worker.start()
+        conns.append(parent_conn)
+        workers.append(worker)
+
+    try:
+        next_times = []
+        cpu_times = []
+        for conn in conns:
+            next_time, sim_duration, lookahead, cpu_time = receive(conn, len(next_times))
+            next_times.append(next_time)
+            cpu_times.append(cpu_time)
+        critical_path = max(cpu_times)
+        num_rounds = 0
+        inboxes = [[] for _ in range(num_shards)]
+        while True:
+            lbts = min(next_times + [message[0] for inbox in inboxes for message in inbox])
+            if lbts >= sim_duration:
+                break
+            until = min(lbts + lookahead, sim_duration)
+            for conn, inbox in zip(conns, inboxes):
+                conn.send(('run', until, inbox))
+            inboxes = [[] for _ in range(num_shards)]
+            round_cpu_time = 0.0
+            for shard_id, conn in enumerate(conns):
+                next_times[shard_id], outbox, cpu_time = receive(conn, shard_id)
+                cpu_times[shard_id] += cpu_time
+                round_cpu_time = max(round_cpu_time, cpu_time)
+                for dst_shard, message in outbox:
+                    inboxes[dst_shard].append(message)
+            critical_path += round_cpu_time
+            num_rounds += 1
+
+        results_list = []
+        for conn in conns:
+            conn.send(('finish', None, None))
+            results_list.append(receive(conn, len(results_list)))
+    finally:
+        for worker in workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+    results = merge_results(results_list)
+    results['sharding'] = {'num_rounds': num_rounds, 'cpu_times': cpu_times, 'critical_path': critical_path,
+                           'counters': [shard_results['counters'] for shard_results in results_list],
+                           'routers': [shard_results['router'] for shard_results in results_list]}
+    return results
+
+
+def merge_results(results_list):
+    # results of the whole simulation from the results of its shards
+    results = {'counters': {}}
+    for shard_results in results_list:
+        for name, value in shard_results['counters'].items():
+            results['counters'][name] = results['counters'].get(name, 0) + value
+
+    for name in ('transfers', 'jobs'):
+        rows = np.concatenate([shard_results[name] for shard_results in results_list])
+        results[name] = rows[np.argsort(rows['end_time'], kind='stable')]
+
+    # bucket indices are per shard; only the shard owning a bucket samples it
+    storage_buckets = []
+    storage_chunks = []
+    for shard_results in results_list:
+        rows = shard_results['storage'].copy()
+        index_map = np.empty(max(len(shard_results['storage_buckets']), 1), dtype=rows['bucket'].dtype)
+        for idx, bucket_name in enumerate(shard_results['storage_buckets']):
+            if bucket_name not in storage_buckets:
+                storage_buckets.append(bucket_name)
+            index_map[idx] = storage_buckets.index(bucket_name)
+        rows['bucket'] = index_map[rows['bucket']]
+        storage_chunks.append(rows)
+    storage = np.concatenate(storage_chunks)
+    results['storage'] = storage[np.argsort(storage['time'], kind='stable')]
+    results['storage_buckets'] = storage_buckets
+
+    # every shard ticks, bills and samples costs at the same times
+    for name, summed in (('ticks', ('num_active_transfers', 'reaper_duration')),
+                         ('bills', ('storage_total', 'network_total')),
+                         ('costs', ('storage_total', 'network_total'))):
+        num_rows = min(len(shard_results[name]) for shard_results in results_list)
+        rows = results_list[0][name][:num_rows].copy()
+        for shard_results in results_list[1:]:
+            for column in summed:
+                rows[column] += shard_results[name][column][:num_rows]
+        results[name] = rows
+    results['ticks']['num_files'] = np.max([shard_results['ticks']['num_files'][:len(results['ticks'])]
+                                            for shard_results in results_list], axis=0)
+    return results
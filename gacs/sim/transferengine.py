@@ -0,0 +1,266 @@
+import heapq
+import math
+
+from gacs import abstractions
+
+
+class PollingTransferEngine:
+    def __init__(self, sim, update_delay):
+        self.sim = sim
+        self.update_delay = update_delay
+        self.new_transfers = []
+        self.active_transfers = []
+
+    def get_num_active(self):
+        return len(self.active_transfers)
+
+    def start(self, wakeup=None):
+        return self.sim.process(self.transfer_process(wakeup))
+
+    def get_pending_events(self):
+        # the process is restored by its owner
+        return []
+
+    def resume_event(self, key, event):
+        raise NotImplementedError()
+
+    def submit(self, transfers):
+        for transfer in transfers:
+            transfer.engine = self
+            self.new_transfers.append(transfer)
+
+    def settle(self, current_time):
+        pass
+
+    def on_transfer_deleted(self, transfer):
+        pass
+
+    def transfer_process(self, wakeup=None):
+        # wakeup is the pending timeout of a process restored from a checkpoint
+        while True:
+            if wakeup is None:
+                for transfer in self.new_transfers:
+                    transfer.begin(self.sim.now)
+                    self.active_transfers.append(transfer)
+                self.new_transfers.clear()
+                wakeup = self.sim.timeout(self.update_delay)
+            yield wakeup
+            wakeup = None
+            complete = []
+            for transfer in self.active_transfers:
+                if transfer.state != abstractions.Transfer.TRANSFER:
+                    complete.append(transfer)
+                else:
+                    transfer.update(self.sim.now)
+            for transfer in complete:
+                transfer.end(self.sim.now)
+                self.active_transfers.remove(transfer)
+
+
+class TableTransferEngine:
+    # Polling engine that keeps the active transfers in a TransferTable and
+    # advances all of them in one vectorized step per update.
+    def __init__(self, sim, update_delay):
+        self.sim = sim
+        self.update_delay = update_delay
+        self.table = abstractions.TransferTable()
+
+    def get_num_active(self):
+        return len(self.table)
+
+    def start(self, wakeup=None):
+        return self.sim.process(self.transfer_process(wakeup))
+
+    def get_pending_events(self):
+        # the process is restored by its owner
+        return []
+
+    def resume_event(self, key, event):
+        raise NotImplementedError()
+
+    def submit(self, transfers):
+        current_time = self.sim.now
+        for transfer in transfers:
+            transfer.engine = self
+            transfer.begin(current_time)
+            self.table.add(transfer)
+
+    def settle(self, current_time):
+        self.table.sync_replicas(current_time)
+
+    def on_transfer_deleted(self, transfer):
+        if transfer.table_index is None:
+            return
+        current_time = self.sim.now
+        self.table.remove(transfer, current_time)
+        transfer.end(current_time)
+
+    def transfer_process(self, wakeup=None):
+        while True:
+            yield wakeup or self.sim.timeout(self.update_delay)
+            wakeup = None
+            current_time = self.sim.now
+            for transfer in self.table.update(current_time):
+                self.table.remove(transfer, current_time)
+                transfer.state = abstractions.Transfer.COMPLETE
+                transfer.end(current_time)
+
+
+class LinkState:
+    def __init__(self, link, current_time):
+        self.link = link
+        # bytes every transfer on this link received since the link became busy
+        self.service = 0.0
+        # min-heap of (service at which the transfer finishes, transfer id, transfer)
+        self.finish_heap = []
+        # dict instead of set so the iteration order does not depend on object
+        # addresses, which keeps runs restored from a checkpoint identical
+        self.transfers = {}
+        self.last_update_time = current_time
+        self.generation = 0
+        # pending completion event, not part of checkpoints
+        self.completion_event = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['completion_event'] = None
+        return state
+
+
+class FluidTransferEngine:
+    # Every link shares its bandwidth equally between its transfers, so all transfers
+    # on a link receive the same amount of bytes (the link's service) over time.
+    # A transfer finishes once the service grew by its file size since it started,
+    # which keeps the transfers of a link ordered by completion in a heap. One simpy
+    # event is scheduled per link for its next completion. Replica sizes are only
+    # brought up to date on completion, deletion and settle(). With a tolerance > 0
+    # completion events are rounded up to multiples of the tolerance, which bounds
+    # the end time error and lets completions on the same link share one event.
+    def __init__(self, sim, tolerance=0):
+        self.sim = sim
+        self.tolerance = tolerance
+        self.link_states = {}
+        self.num_active = 0
+
+    def get_num_active(self):
+        return self.num_active
+
+    def start(self, wakeup=None):
+        return None
+
+    def get_pending_events(self):
+        # (event, link state) of every link waiting for its next completion
+        return [(link_state.completion_event, link_state)
+                for link_state in self.link_states.values()
+                if link_state.completion_event is not None]
+
+    def resume_event(self, link_state, event):
+        # continues a link restored from a checkpoint with a recreated event
+        self.watch_completion(link_state, event)
+
+    def submit(self, transfers):
+        current_time = self.sim.now
+        changed_links = {}
+        for transfer in transfers:
+            transfer.engine = self
+            transfer.begin(current_time)
+            link_state = self.link_states.get(transfer.link)
+            if link_state is None:
+                link_state = LinkState(transfer.link, current_time)
+                self.link_states[transfer.link] = link_state
+            if link_state.link not in changed_links:
+                self.update_link(link_state, current_time)
+                changed_links[link_state.link] = link_state
+
+            transfer.fluid_service_start = link_state.service - transfer.dst_replica.size
+            finish_service = transfer.fluid_service_start + transfer.file.size
+            heapq.heappush(link_state.finish_heap, (finish_service, transfer.id, transfer))
+            link_state.transfers[transfer] = None
+            self.num_active += 1
+        for link_state in changed_links.values():
+            self.schedule_completion(link_state, current_time)
+
+    def settle(self, current_time):
+        for link_state in self.link_states.values():
+            if link_state.transfers:
+                self.update_link(link_state, current_time)
+                for transfer in link_state.transfers:
+                    self.sync_transfer(link_state, transfer, current_time)
+                self.schedule_completion(link_state, current_time)
+
+    def on_transfer_deleted(self, transfer):
+        link_state = self.link_states.get(transfer.link)
+        if link_state is None or transfer not in link_state.transfers:
+            return
+        current_time = self.sim.now
+        self.update_link(link_state, current_time)
+        if transfer not in link_state.transfers:
+            # ended while the link was brought up to date
+            return
+        # account the traffic of the partial transfer; its replica is removed
+        # with the file, so it is not grown and the transfer never completes
+        done = min(transfer.file.size, math.floor(link_state.service - transfer.fluid_service_start))
+        if done > transfer.dst_replica.size:
+            transfer.linkselector.add_traffic(done - transfer.dst_replica.size)
+        # the heap entry is dropped lazily once it reaches the top
+        del link_state.transfers[transfer]
+        transfer.end(current_time)
+        self.num_active -= 1
+        self.schedule_completion(link_state, current_time)
+
+    def sync_transfer(self, link_state, transfer, current_time):
+        done = min(transfer.file.size, math.floor(link_state.service - transfer.fluid_service_start))
+        if done > transfer.dst_replica.size:
+            transfer.transfer_bytes(current_time, done - transfer.dst_replica.size)
+
+    def update_link(self, link_state, current_time):
+        time_passed = current_time - link_state.last_update_time
+        link_state.last_update_time = current_time
+        num_transfers = len(link_state.transfers)
+        if num_transfers == 0:
+            link_state.service = 0.0
+            link_state.finish_heap.clear()
+            return
+        if time_passed > 0:
+            link_state.service += link_state.link.bandwidth / num_transfers * time_passed
+
+        finish_heap = link_state.finish_heap
+        while finish_heap and finish_heap[0][0] <= link_state.service + 1:
+            transfer = heapq.heappop(finish_heap)[2]
+            if transfer not in link_state.transfers or transfer.state == abstractions.Transfer.DELETED:
+                # deleted transfers are ended by on_transfer_deleted()
+                continue
+            del link_state.transfers[transfer]
+            transfer.transfer_bytes(current_time, transfer.file.size - transfer.dst_replica.size)
+            transfer.end(current_time)
+            self.num_active -= 1
+
+    def schedule_completion(self, link_state, current_time):
+        link_state.generation += 1
+        finish_heap = link_state.finish_heap
+        while finish_heap and finish_heap[0][2] not in link_state.transfers:
+            heapq.heappop(finish_heap)
+        if not finish_heap:
+            link_state.completion_event = None
+            return
+
+        remaining = finish_heap[0][0] - link_state.service
+        finish_time = current_time + remaining * len(link_state.transfers) / link_state.link.bandwidth
+        if self.tolerance > 0:
+            finish_time = math.ceil(finish_time / self.tolerance) * self.tolerance
+        if finish_time <= current_time:
+            # make sure the event advances the clock so the transfer can make progress
+            finish_time = math.nextafter(current_time, math.inf)
+        self.watch_completion(link_state, self.sim.timeout(finish_time - current_time))
+
+    def watch_completion(self, link_state, event):
+        link_state.completion_event = event
+        generation = link_state.generation
+        event.callbacks.append(lambda event: self.on_completion_event(link_state, generation))
+
+    def on_completion_event(self, link_state, generation):
+        if generation != link_state.generation:
+            return
+        current_time = self.sim.now
+        self.update_link(link_state, current_time)
+        self.schedule_completion(link_state, current_time)
@@ -0,0 +1,3 @@
+from .arrivals import (ArrivalProcess, ArrivalStream, DiurnalProcess, EmpiricalProcess, EmpiricalSizes, MMPPProcess,
+                       PoissonProcess, UniformSizes)
+from .trace import TraceReplayer, convert_to_npy, read_trace
@@ -0,0 +1,188 @@
+import math
+
+import numpy as np
+
+
+# Arrival processes generate the arrival times of a whole horizon at once
+# from a numpy.random.Generator. They are consumed horizon after horizon by
+# an ArrivalStream; processes with memory (renewal, mmpp) carry their state
+# over to the next horizon. Rates are arrivals per sim second.
+
+class ArrivalProcess:
+    # non-homogeneous poisson process, generated by thinning a homogeneous
+    # one with max_rate; subclasses implement get_rates()
+    max_rate = 0.0
+
+    def get_rates(self, times):
+        raise NotImplementedError
+
+    def generate(self, rng, start, end):
+        # sorted arrival times in [start, end)
+        num_candidates = rng.poisson(self.max_rate * (end - start))
+        times = np.sort(rng.uniform(start, end, num_candidates))
+        if not num_candidates:
+            return times
+        accepted = rng.random(num_candidates) * self.max_rate < self.get_rates(times)
+        return times[accepted]
+
+    def generate_counts(self, rng, start, num_bins, interval):
+        # number of arrivals in each of num_bins intervals from start on
+        times = self.generate(rng, start, start + num_bins * interval)
+        bins = ((times - start) // interval).astype(np.int64)
+        return np.bincount(np.minimum(bins, num_bins - 1), minlength=num_bins)
+
+
+class PoissonProcess(ArrivalProcess):
+    def __init__(self, rate):
+        assert rate >= 0, rate
+        self.rate = rate
+        self.max_rate = rate
+
+    def get_rates(self, times):
+        return np.full(len(times), self.rate, dtype=np.float64)
+
+    def generate_counts(self, rng, start, num_bins, interval):
+        # no thinning needed, the counts of the bins are independent
+        return rng.poisson(self.rate * interval, num_bins)
+
+
+class DiurnalProcess(ArrivalProcess):
+    # rate oscillating with a cosine of the given period around mean_rate,
+    # amplitude is relative to the mean
+    def __init__(self, mean_rate, amplitude=0.5, period=24*3600, phase=0.0):
+        assert mean_rate >= 0 and 0 <= amplitude <= 1, (mean_rate, amplitude)
+        self.mean_rate = mean_rate
+        self.amplitude = amplitude
+        self.period = period
+        self.phase = phase
+        self.max_rate = mean_rate * (1 + amplitude)
+
+    def get_rates(self, times):
+        rates = np.cos((np.asarray(times, dtype=np.float64) - self.phase) * (2 * np.pi / self.period))
+        rates *= self.amplitude * self.mean_rate
+        rates += self.mean_rate
+        return rates
+
+
+class EmpiricalProcess(ArrivalProcess):
+    # renewal process whose interarrival times are resampled from observed ones
+    def __init__(self, interarrival_times):
+        self.interarrival_times = np.asarray(interarrival_times, dtype=np.float64)
+        assert len(self.interarrival_times) and self.interarrival_times.min() >= 0, 'invalid interarrival times'
+        self.mean_interarrival = self.interarrival_times.mean()
+        assert self.mean_interarrival > 0, self.mean_interarrival
+        self.next_time = None
+
+    def generate(self, rng, start, end):
+        if self.next_time is None or self.next_time < start:
+            self.next_time = start + rng.choice(self.interarrival_times)
+        chunks = []
+        last_time = self.next_time
+        while last_time < end:
+            # enough interarrival times for the rest of the horizon in most cases
+            num = int((end - last_time) / self.mean_interarrival * 1.1) + 16
+            times = last_time + np.cumsum(rng.choice(self.interarrival_times, num))
+            chunks.append(np.concatenate(([last_time], times[:-1])))
+            last_time = times[-1]
+        # the first arrival at or after end is carried over to the next horizon
+        times = np.concatenate(chunks + [[last_time]])
+        num_arrivals = np.searchsorted(times, end)
+        self.next_time = times[num_arrivals]
+        return times[:num_arrivals]
+
+
+class MMPPProcess(ArrivalProcess):
+    # markov modulated poisson process: arrivals with rates[state] while the
+    # state switches to state j with switch_rates[state][j] per second
+    def __init__(self, rates, switch_rates, state=0):
+        self.rates = np.asarray(rates, dtype=np.float64)
+        self.switch_rates = np.array(switch_rates, dtype=np.float64)
+        num_states = len(self.rates)
+        assert self.switch_rates.shape == (num_states, num_states), self.switch_rates.shape
+        np.fill_diagonal(self.switch_rates, 0)
+        self.leave_rates = self.switch_rates.sum(axis=1)
+        self.state = state
+        self.max_rate = self.rates.max()
+
+    def generate(self, rng, start, end):
+        # the state changes are simulated one by one, the arrivals within a
+        # sojourn are drawn at once
+        chunks = []
+        cur_time = start
+        while cur_time < end:
+            leave_rate = self.leave_rates[self.state]
+            sojourn_end = cur_time + rng.exponential(1 / leave_rate) if leave_rate > 0 else math.inf
+            seg_end = min(sojourn_end, end)
+            num = rng.poisson(self.rates[self.state] * (seg_end - cur_time))
+            if num:
+                chunks.append(np.sort(rng.uniform(cur_time, seg_end, num)))
+            if sojourn_end >= end:
+                # memoryless, the next horizon may draw a new sojourn
+                break
+            self.state = rng.choice(len(self.rates), p=self.switch_rates[self.state] / leave_rate)
+            cur_time = sojourn_end
+        if not chunks:
+            return np.empty(0)
+        return np.concatenate(chunks)
+
+
+class UniformSizes:
+    def __init__(self, size_min, size_max):
+        self.size_min = size_min
+        self.size_max = size_max
+
+    def sample(self, rng, num):
+        return rng.integers(self.size_min, self.size_max, num, dtype=np.int64, endpoint=True)
+
+
+class EmpiricalSizes:
+    def __init__(self, sizes):
+        self.sizes = np.asarray(sizes, dtype=np.int64)
+
+    def sample(self, rng, num):
+        return rng.choice(self.sizes, num)
+
+
+class ArrivalStream:
+    # Precomputed arrival counts per interval, and optionally the sizes of
+    # the arrivals, of a process. Whenever the simulator runs past the end of
+    # the current horizon, the next horizon_bins intervals are generated at once.
+    def __init__(self, process, rng, interval, horizon_bins=10000, sizes=None):
+        self.process = process
+        self.rng = rng
+        self.interval = interval
+        self.horizon_bins = horizon_bins
+        self.sizes = sizes
+
+        self.first_bin = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        # sizes of the horizon and the offset of the first size of every bin
+        self.size_values = None
+        self.size_offsets = None
+
+    def fill(self, first_bin):
+        self.first_bin = first_bin
+        self.counts = self.process.generate_counts(self.rng, first_bin * self.interval, self.horizon_bins, self.interval)
+        if self.sizes is not None:
+            self.size_offsets = np.concatenate(([0], np.cumsum(self.counts)))
+            self.size_values = self.sizes.sample(self.rng, self.size_offsets[-1])
+
+    def get_bin(self, cur_time):
+        idx = int(cur_time // self.interval) - self.first_bin
+        if idx < 0 or idx >= len(self.counts):
+            # a skipped horizon is not generated
+            first_bin = self.first_bin + len(self.counts)
+            if first_bin + self.horizon_bins <= int(cur_time // self.interval):
+                first_bin = int(cur_time // self.interval)
+            self.fill(first_bin)
+            idx = int(cur_time // self.interval) - self.first_bin
+        return idx
+
+    def get_count(self, cur_time):
+        idx = self.get_bin(cur_time)
+        return int(self.counts[idx])
+
+    def get_sizes(self, cur_time):
+        assert self.sizes is not None, 'stream without sizes'
+        idx = self.get_bin(cur_time)
+        return self.size_values[self.size_offsets[idx]:self.size_offsets[idx + 1]]
@@ -0,0 +1,221 @@
+import argparse
+import csv
+import gzip
+import heapq
+import itertools
+import math
+
+import numpy as np
+
+
+# A trace is a time sorted sequence of workload events:
+#   FILE      register file with size and die_time and a complete replica at dst_rse
+#   REPLICA   register a complete replica of an existing file at dst_rse
+#   TRANSFER  transfer an existing file from src_rse to dst_rse
+# CSV and parquet traces have the columns of TRACE_DTYPE with kind given as
+# 'file', 'replica' or 'transfer'; empty die_time uses the default lifetime.
+# time and die_time are in seconds on any time axis, e.g. unix epoch seconds
+# of rucio/fts logs; the replay maps the time origin of the trace to sim time 0.
+FILE = 1
+REPLICA = 2
+TRANSFER = 3
+KIND_BY_NAME = {'file': FILE, 'replica': REPLICA, 'transfer': TRANSFER}
+
+# file holds rucio dids, scope:name with up to 25 + 1 + 250 characters; values
+# that do not fit are rejected instead of being truncated into other names
+TRACE_DTYPE = np.dtype([('time', 'f8'), ('kind', 'i1'), ('file', 'U276'), ('size', 'i8'), ('die_time', 'f8'),
+                        ('src_rse', 'U64'), ('dst_rse', 'U64')])
+
+# about 26 MiB per chunk
+DEFAULT_CHUNK_ROWS = 2**14
+
+
+def set_strings(chunk, name, values):
+    max_len = TRACE_DTYPE[name].itemsize // np.dtype('U1').itemsize
+    for value in values:
+        if len(value) > max_len:
+            raise ValueError('trace {} has more than {} characters: {}'.format(name, max_len, value))
+    chunk[name] = values
+
+
+def make_chunk(columns):
+    # structured array from a dict of column name -> list of (string) values
+    num_rows = len(columns['time'])
+    chunk = np.zeros(num_rows, dtype=TRACE_DTYPE)
+    chunk['time'] = np.asarray(columns['time'], dtype=np.float64)
+    chunk['kind'] = [kind if isinstance(kind, int) else KIND_BY_NAME[kind.strip().lower()] for kind in columns['kind']]
+    set_strings(chunk, 'file', columns['file'])
+    for name, empty in (('size', 0), ('die_time', math.nan)):
+        values = columns.get(name)
+        if values is not None:
+            chunk[name] = [empty if value is None or value == '' else value for value in values]
+        else:
+            chunk[name] = empty
+    for name in ('src_rse', 'dst_rse'):
+        values = columns.get(name)
+        if values is not None:
+            set_strings(chunk, name, ['' if value is None else value for value in values])
+    return chunk
+
+
+def read_csv(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # gzip compressed if the file name ends with .gz
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', newline='') as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader)]
+        while True:
+            rows = list(itertools.islice(reader, chunk_rows))
+            if not rows:
+                break
+            yield make_chunk(dict(zip(header, zip(*rows))))
+
+
+def read_parquet(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # pyarrow is only needed for parquet traces
+    import pyarrow.parquet
+    for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+        yield make_chunk(batch.to_pydict())
+
+
+def read_npy(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # memory-mapped structured array of TRACE_DTYPE, e.g. written by convert_to_npy()
+    trace = np.load(path, mmap_mode='r')
+    if trace.dtype != TRACE_DTYPE:
+        raise ValueError('{} has dtype {}, expected {}'.format(path, trace.dtype, TRACE_DTYPE))
+    for start in range(0, len(trace), chunk_rows):
+        yield trace[start:start + chunk_rows]
+
+
+def read_trace(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # chunks of TRACE_DTYPE rows, the format is chosen by the file name
+    if path.endswith('.npy'):
+        return read_npy(path, chunk_rows)
+    if path.endswith('.parquet'):
+        return read_parquet(path, chunk_rows)
+    if path.endswith('.csv') or path.endswith('.csv.gz'):
+        return read_csv(path, chunk_rows)
+    raise ValueError('unknown trace format: {}'.format(path))
+
+
+def iter_rows(paths, chunk_rows=DEFAULT_CHUNK_ROWS, start_row=0):
+    # rows of all traces merged by time, each trace must be sorted by time
+    row_iters = []
+    for path in paths:
+        chunks = read_trace(path, chunk_rows)
+        row_iters.append(itertools.chain.from_iterable(chunk.tolist() for chunk in chunks))
+    rows = heapq.merge(*row_iters, key=lambda row: row[0]) if len(row_iters) > 1 else row_iters[0]
+    return itertools.islice(rows, start_row, None)
+
+
+def convert_to_npy(src_path, dst_path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # writes a trace as npy file that is memory-mapped by read_npy(); the
+    # trace is read twice, once to count its rows
+    num_rows = sum(len(chunk) for chunk in read_trace(src_path, chunk_rows))
+    trace = np.lib.format.open_memmap(dst_path, mode='w+', dtype=TRACE_DTYPE, shape=(num_rows,))
+    start = 0
+    for chunk in read_trace(src_path, chunk_rows):
+        trace[start:start + len(chunk)] = chunk
+        start += len(chunk)
+    trace.flush()
+    return num_rows
+
+
+class TraceReplayer:
+    # Injects the events of traces into rucio and the transfer engine at
+    # their timestamps. The traces are streamed chunk by chunk; only the
+    # number of replayed rows is kept, so a replay continued from a
+    # checkpoint reopens the traces and skips them. time_origin is the trace
+    # time replayed at sim time 0, None uses the time of the first row.
+    def __init__(self, sim, rucio, transfer_engine, rse_by_name, paths, chunk_rows=DEFAULT_CHUNK_ROWS,
+                 default_lifetime=7*24*3600, time_origin=None):
+        self.sim = sim
+        self.rucio = rucio
+        self.transfer_engine = transfer_engine
+        self.rse_by_name = rse_by_name
+        self.paths = list(paths)
+        self.chunk_rows = chunk_rows
+        self.default_lifetime = default_lifetime
+        self.time_origin = time_origin
+
+        self.num_rows_done = 0
+        # rows that could not be applied, e.g. of unknown files or rses
+        self.num_rows_skipped = 0
+        # rows older than the row before them, applied when they were read
+        self.num_rows_late = 0
+        self.new_transfers = []
+
+    def replay_process(self, wakeup=None):
+        for row in iter_rows(self.paths, self.chunk_rows, self.num_rows_done):
+            if self.time_origin is None:
+                self.time_origin = row[0]
+            row_time = row[0] - self.time_origin
+            if row_time > self.sim.now:
+                self.submit_transfers()
+                if wakeup is None:
+                    wakeup = self.sim.timeout(row_time - self.sim.now)
+                yield wakeup
+                wakeup = None
+            elif row_time < self.sim.now:
+                self.num_rows_late += 1
+            self.apply(row)
+            self.num_rows_done += 1
+        self.submit_transfers()
+
+    def submit_transfers(self):
+        # transfers of rows with the same time are submitted together
+        if self.new_transfers:
+            self.transfer_engine.submit(self.new_transfers)
+            self.new_transfers = []
+
+    def apply(self, row):
+        _, kind, file_name, size, die_time, src_rse_name, dst_rse_name = row
+        current_time = self.sim.now
+        dst_rse = self.rse_by_name.get(dst_rse_name)
+        if dst_rse is None:
+            self.num_rows_skipped += 1
+            return
+        if kind == FILE:
+            if file_name in self.rucio.file_by_name or size <= 0:
+                self.num_rows_skipped += 1
+                return
+            if math.isnan(die_time):
+                die_time = current_time + self.default_lifetime
+            else:
+                die_time -= self.time_origin
+            file_obj = self.rucio.create_file(file_name, size, die_time)
+            self.create_complete_replica(file_obj, dst_rse)
+            return
+
+        file_obj = self.rucio.file_by_name.get(file_name)
+        if file_obj is None or dst_rse.replica_by_name.get(file_name) is not None:
+            self.num_rows_skipped += 1
+        elif kind == REPLICA:
+            self.create_complete_replica(file_obj, dst_rse)
+        elif kind == TRANSFER:
+            src_rse = self.rse_by_name.get(src_rse_name)
+            if (src_rse is None or src_rse.replica_by_name.get(file_name) is None
+                    or src_rse.site_obj.linkselector_by_dst_name.get(dst_rse.site_obj.name) is None):
+                self.num_rows_skipped += 1
+                return
+            self.new_transfers.append(self.rucio.create_transfer(file_obj, src_rse, dst_rse))
+        else:
+            raise ValueError('unknown trace event kind {}'.format(kind))
+
+    def create_complete_replica(self, file_obj, rse_obj):
+        self.rucio.create_replica(file_obj, rse_obj)
+        rse_obj.increase_replica(file_obj, self.sim.now, file_obj.size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='gacs-trace-convert', description='Converts a csv or parquet trace into a memory-mappable npy trace.')
+    parser.add_argument('src', help='csv(.gz) or parquet trace')
+    parser.add_argument('dst', help='npy file to write')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='rows read at once')
+    args = parser.parse_args(argv)
+    num_rows = convert_to_npy(args.src, args.dst, args.chunk_rows)
+    print('Wrote {:,d} rows to {}'.format(num_rows, args.dst))
+
+
+if __name__ == '__main__':
+    main()
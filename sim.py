@@ -1,78 +1,79 @@
 #!/usr/bin/env python
+import argparse
+import copy
+import functools
+import json
 import logging
+import os
 import random
-import uuid
 import time
 
 import simpy
 
-from gacs import abstractions, grid, sim
+from gacs import grid, report, sim, workload
 from gacs.clouds import gcp
-from gacs.common import monitoring, utils
+from gacs.sim import checkpoint, jobscheduler, profiling, sharding, transferengine
+from gacs.common import monitoring
+from gacs.common.logging import setup_logging
 
 import numpy as np
 import numpy.random as npr
 
 class TransferDurationGeneratorJJ:
-    def __init__(self):
+    def __init__(self, rng=None):
         self.rate = 27 * (2**20)
         self.overhead = 18
+        self.rng = rng or np.random.default_rng()
 
     def get_duration(self, transfer):
         size = transfer.file.size
         trf_rate = size / ((size/self.rate)+self.overhead)
         return (size / trf_rate)
 
-    def get_finish_times(now, sizes):
+    def get_finish_times(self, now, sizes):
          mb_scaler = (2**20)
          overhead = 18.7
          rate = 27.38 * mb_scaler
          max_rw = 26.3 * mb_scaler
-         return [max(60, npr.normal(now + (size/min(max_rw, size/((size/rate)+overhead))), 2)) for size in sizes]
+         sizes = np.asarray(sizes, dtype=np.float64)
+         rates = np.minimum(max_rw, sizes / ((sizes / rate) + overhead))
+         return np.maximum(60, self.rng.normal(now + sizes / rates, 2))
 
 class TransferNumGenerator:
-    def __init__(self):
+    # tops the active transfers up to a noisy diurnal level; the levels and
+    # exponents of GEN_BUNCH_SIZE steps are drawn at once. An antithetic
+    # generator mirrors the normal deviates of the one with the same rng seed.
+    def __init__(self, rng, antithetic=False):
         self.DELAY_BASE = 30
         self.ALPHA = 1/self.DELAY_BASE * np.pi/180 * 0.075
         self.SCALE_OF_SOFTMAX = 15
         self.OFFSET_OF_SOFTMAX = 600
         self.GEN_BUNCH_SIZE = 10000
+        self.rng = rng
+        self.sign = -1 if antithetic else 1
+        self.level_process = workload.DiurnalProcess(self.OFFSET_OF_SOFTMAX, self.SCALE_OF_SOFTMAX / self.OFFSET_OF_SOFTMAX,
+                                                     2 * np.pi / self.ALPHA)
         self.idx_offset = 0
-        self.softmax_values = np.empty(self.GEN_BUNCH_SIZE)
         self.make_values(0)
 
-    def make_values(self, start_val):
+    def make_values(self, start_idx):
         step_size = float(self.DELAY_BASE)
-        end_val = start_val + self.GEN_BUNCH_SIZE * step_size
-        vals = np.arange(start_val, end_val, step_size)
-        vals *= self.ALPHA
-        np.cos(vals, out=self.softmax_values)
-        self.softmax_values *= self.SCALE_OF_SOFTMAX
-        self.softmax_values += self.OFFSET_OF_SOFTMAX
-        self.softmax_values += npr.normal(0, 1, len(vals)) * self.softmax_values * 0.02
+        self.idx_offset = start_idx
+        times = np.arange(start_idx, start_idx + self.GEN_BUNCH_SIZE) * step_size
+        self.softmax_values = self.level_process.get_rates(times)
+        deviates = self.rng.standard_normal((2, len(times))) * self.sign
+        self.softmax_values += deviates[0] * self.softmax_values * 0.02
+        self.exponents = np.abs(1.05 + 0.04 * deviates[1])
 
     def get_num_to_create(self, cur_time, num_active):
         idx = int(cur_time / self.DELAY_BASE)
+        if idx - self.idx_offset >= self.GEN_BUNCH_SIZE:
+            self.make_values(idx)
         idx -= self.idx_offset
-        if idx >= len(self.softmax_values):
-            self.make_values(cur_time)
-            self.idx_offset += self.GEN_BUNCH_SIZE
-            idx -= self.GEN_BUNCH_SIZE
         diff_softmax_active = self.softmax_values[idx] - num_active
         if diff_softmax_active <= 0:
             return 0
-        return int(diff_softmax_active ** abs(npr.normal(1.05, 0.04)))
-
-class ComputeInstance:
-    def __init__(self, bucket_obj):
-        self.bucket_obj = bucket_obj
-
-class Job:
-    def __init__(self, compute_instance, input_files):
-        self.id = utils.next_id()
-        self.compute_instance = compute_instance
-        self.input_files = input_files
-        self.output_files = []
+        return int(diff_softmax_active ** self.exponents[idx])
 
 class CloudSimulator(sim.BaseSim):
     def __init__(self, sim, cloud, rucio):
@@ -94,6 +95,15 @@ class CloudSimulator(sim.BaseSim):
         self.INIT_CLOUDLINKS_BW_EXPO_MAX = 29
 
         self.TRANSFER_UPDATE_DELAY = 20
+        self.TRANSFER_GEN_WAIT = 30
+        # workload arrival process of the grid -> cloud transfers, e.g. a
+        # workload.DiurnalProcess; None tops the active transfers up to the
+        # level of the TransferNumGenerator
+        self.TRANSFER_ARRIVALS = None
+        self.TRANSFER_ARRIVALS_HORIZON = 24 * 3600 # sim seconds of arrivals generated at once
+        self.WORKLOAD_ANTITHETIC = False # mirror the workload level noise, for antithetic replications
+        self.TRANSFER_ENGINE = 'fluid' # 'fluid', 'table' or 'polling'
+        self.TRANSFER_ENGINE_TOLERANCE = 0
 
         self.DATAGEN_WAIT = 3600
         self.DATAGEN_WAIT_MIN = 5 * 24 * 3600
@@ -105,313 +115,184 @@ class CloudSimulator(sim.BaseSim):
         self.DATAGEN_LIFETIME_MIN = 4 * 24 * 3600
         self.DATAGEN_LIFETIME_MAX = 7 * 24 * 3600
         self.DATAGEN_REPLICATION_PERCENT = [0.35, 0.60, 0.05]
+        # workload arrival process of new grid files per second; None creates
+        # DATAGEN_FILES_NUM_MIN to DATAGEN_FILES_NUM_MAX files every DATAGEN_WAIT
+        self.DATAGEN_ARRIVALS = None
 
+        self.JOBFAC_ENABLED = False
         self.JOBFAC_WAIT_MIN = 6 * 3600 #5 * 3600
         self.JOBFAC_WAIT_MAX = 18 * 3600 #24 * 3600
         self.JOBFAC_JOB_NUM_MIN = 100
         self.JOBFAC_JOB_NUM_MAX = 150
         self.JOBFAC_INFILES_NUM_MIN = 1
         self.JOBFAC_INFILES_NUM_MAX = 20
+        self.JOBFAC_RUNTIME_MIN = 600
+        self.JOBFAC_RUNTIME_MAX = 2 * 3600
+        self.JOB_SLOTS_PER_REGION = 1000
+        self.JOB_TIME_RESOLUTION = 60 # job end times are rounded up to multiples of this
+        self.REPLICA_SELECTION_TIME_VALUE = 1.0 # CHF per hour a stage-in takes, weighed against network prices
+        self.REPLICA_SELECTION_REFRESH = 60 # sim seconds the source cost matrix is reused
 
         self.REAPER_WAIT = 600
 
+        self.CATALOG_FILE = None # sqlite file the file catalogue is kept in instead of memory (recreated)
+        self.CATALOG_CACHE_FILES = 2**16 # files of the sqlite catalogue kept loaded
+
+        self.TRACE_FILES = None # csv(.gz), parquet or npy traces replayed instead of the synthetic grid data and transfers
+        self.TRACE_CHUNK_ROWS = 2**14
+        self.TRACE_DEFAULT_LIFETIME = 7 * 24 * 3600 # of trace files without die_time
+        self.TRACE_START = None # trace time in seconds (e.g. unix epoch) replayed at sim time 0, None for the first trace row
+
         self.MONITORING_WAIT = 15
+        self.STORAGE_SAMPLE_INTERVAL = 3600
+        self.COST_SAMPLE_INTERVAL = 24*3600 # costs to date for dashboards, None disables them
+        self.RESULTS_FILE = None # npz file the monitoring series are streamed to
+
+        self.CHECKPOINT_INTERVAL = None # sim seconds between checkpoints, None disables them
+        self.CHECKPOINT_FILE = 'checkpoint_{:.0f}.pkl.gz' # formatted with the sim time
+
+        self.NUM_SHARDS = 1 # worker processes the regions are partitioned into
+        self.SHARD_ID = 0
+        self.SHARD_LOOKAHEAD = 1 # sim seconds until messages of other shards take effect
 
         self.SIM_DURATION = (90*24*3600) + 1
-        self.new_transfers = []
-        self.active_transfers = []
+        self.SEED = 42
+        self.transfer_engine = None
+        self.workload_rng = None
+        self.g2c_arrivals = None
+        self.grid_arrivals = None
+        self.replica_candidates = None
+        self.job_scheduler = None
+        self.trace_replayer = None
+        # buckets simulated by this shard and their share of all buckets
+        self.local_buckets = []
+        self.shard_share = 1.0
+        self.shard_router = None
+        # grid data is generated identically in all shards of a sharded run
+        self.grid_rng = None
+        self.num_grid_files = 0
         self.last_reaper_duration = 0
+        self.billing_month = 1
 
-    def billing_process(self):
+        # running simpy processes by name and the pending events of a restored run
+        self.processes = {}
+        self.restored_wakeups = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['processes'] = {}
+        state['restored_wakeups'] = None
+        return state
+
+    def billing_process(self, wakeup=None):
         log = self.logger.getChild('billing_proc')
         log.info('Started Billing Proc!', self.sim.now)
-        billing_month = 1
         while True:
-            yield self.sim.timeout(30*24*3600) # calc bill every month
-            log.info('BILLING TIME FOR MONTH {}!'.format(billing_month), self.sim.now)
+            yield wakeup or self.sim.timeout(30*24*3600) # calc bill every month
+            wakeup = None
+            log.info('BILLING TIME FOR MONTH {}!', self.sim.now, self.billing_month)
 
+            self.transfer_engine.settle(self.sim.now)
             bill = self.cloud.process_billing(self.sim.now)
-            log.info('CHF {:,.2f} of storage costs'.format(bill['storage_total']), self.sim.now)
-            log.info('CHF {:,.2f} of network costs'.format(bill['network_total']), self.sim.now)
-            monitoring.OnBillingDone(bill, billing_month)
+            log.info('CHF {:,.2f} of storage costs', self.sim.now, bill['storage_total'])
+            log.info('CHF {:,.2f} of network costs', self.sim.now, bill['network_total'])
+            monitoring.OnBillingDone(bill, self.billing_month)
 
-            billing_month = (billing_month % 13) + 1
+            self.billing_month = (self.billing_month % 13) + 1
 
     def generate_grid_data(self, cur_time):
-        log = self.logger.getChild('datagen')
-        total_files_gen = random.randint(self.DATAGEN_FILES_NUM_MIN, self.DATAGEN_FILES_NUM_MAX)
-        total_replicas_gen = 0
-        total_bytes_gen = 0
+        rng = npr if self.grid_rng is None else self.grid_rng
+        if self.grid_arrivals is not None:
+            arrival_sizes = self.grid_arrivals.get_sizes(cur_time)
+            total_files_gen = len(arrival_sizes)
+        else:
+            total_files_gen = rng.randint(self.DATAGEN_FILES_NUM_MIN, self.DATAGEN_FILES_NUM_MAX + 1)
         max_num_replicas = len(self.DATAGEN_REPLICATION_PERCENT)
-        assert max_num_replicas <= len(self.grid_rses), (max_num_replicas, len(self.grid_rses))
-        for num_replicas_idx in range(max_num_replicas):
-            num_replicas = num_replicas_idx + 1
-            num_files_gen = int(total_files_gen * self.DATAGEN_REPLICATION_PERCENT[num_replicas_idx])
-            bytes_without_num_replicas = 0
-            for i in range(num_files_gen):
-                size = random.randint(self.DATAGEN_FILES_SIZE_MIN, self.DATAGEN_FILES_SIZE_MAX)
-                dietime = cur_time + random.randint(self.DATAGEN_LIFETIME_MIN, self.DATAGEN_LIFETIME_MAX)
-                f = self.rucio.create_file(str(uuid.uuid4()), size, dietime)
-
-                bytes_without_num_replicas += size
-                for rse_obj in random.sample(self.grid_rses, num_replicas):
-                    self.rucio.create_replica(f, rse_obj)
-                    rse_obj.increase_replica(f, 0, size)
-            total_bytes_gen += bytes_without_num_replicas * num_replicas
-            total_replicas_gen += num_files_gen * num_replicas
-
-        #log.info('Created {} files with {} replicas using {} of space'.format(total_files_gen,
-        #                                                                      total_replicas_gen,
-        #                                                                      utils.sizefmt(total_bytes_gen)), cur_time)
-
-    def transfer_process(self, transfer):
-        log = self.logger.getChild('transfer_proc')
-        #log.debug('Transfering {} from {} to {}'.format(transfer.file.name, transfer.linkselector.src_site.name, transfer.linkselector.dst_site.name), self.sim.now)
-
-        yield self.sim.timeout(1)
-
-        transfer.begin(self.sim.now)
-        self.g2c_num_transfers_active += 1
-        yield self.sim.timeout(self.TRANSFER_UPDATE_DELAY)
-
-        while transfer.state == abstractions.Transfer.TRANSFER:
-            transfer.update(self.sim.now)
-            yield self.sim.timeout(self.TRANSFER_UPDATE_DELAY)
-        self.g2c_num_transfers_active -= 1
-        transfer.end(self.sim.now)
-
-    def transfer_process2(self):
-        log = self.logger.getChild('transfer_proc2')
-        #log.debug('Transfering {} from {} to {}'.format(transfer.file.name, transfer.linkselector.src_site.name, transfer.linkselector.dst_site.name), self.sim.now)
-
-        while True:
-            for transfer in self.new_transfers:
-                transfer.begin(self.sim.now)
-                self.active_transfers.append(transfer)
-            self.new_transfers.clear()
-            yield self.sim.timeout(self.TRANSFER_UPDATE_DELAY)
-            complete = []
-            for transfer in self.active_transfers:
-                if transfer.state != abstractions.Transfer.TRANSFER:
-                    complete.append(transfer)
-                else:
-                    transfer.update(self.sim.now)
-            for transfer in complete:
-                transfer.end(self.sim.now)
-                self.active_transfers.remove(transfer)
-
-    def download_process(self, download):
-        log = self.logger.getChild('download_proc')
-        #log.debug('Transfering {} from {} to {}'.format(transfer.file.name, transfer.linkselector.src_site.name, transfer.linkselector.dst_site.name), self.sim.now)
-
-        download.begin(self.sim.now)
-        yield self.sim.timeout(self.DOWNLOAD_UPDATE_DELAY)
-
-        while download.state == abstractions.Download.TRANSFER:
-            download.update(self.sim.now)
-            yield self.sim.timeout(self.DOWNLOAD_UPDATE_DELAY)
-
-        download.end(self.sim.now)
-
-    def stagein_process(self, job):
-        log = self.logger
-        direct_copy = False
-
-        copy_procs = []
-        dst_rse_obj = job.compute_instance.bucket_obj
-        for file_obj in job.input_files:
-            if not direct_copy and dst_rse_obj.name in file_obj.rse_by_name:
-                # file already exists at dst
-                continue
-
-            available_src_replicas = []
-            for replica_obj in file_obj.replica_list:
-                if replica_obj.state == grid.Replica.AVAILABLE:
-                    available_src_replicas.append(replica_obj)
-            #TODO: replace shuffle with replica sorting
-            random.shuffle(available_src_replicas)
-            if len(available_src_replicas) == 0:
-                log.error('Failed to stagein file: No replicas available', self.sim.now)
-                return False
-
-            src_replica_obj = available_src_replicas[0]
-            if direct_copy:
-                # WIP code; need to add proper linkselectors
-                download = self.rucio.create_download(src_replica_obj, dst_rse_obj.site_obj)
-                copy_procs.append(self.sim.process(self.download_process(download)))
-            else:
-                transfer = self.rucio.create_transfer(file_obj, src_replica_obj.rse_obj, dst_rse_obj)
-                copy_procs.append(self.sim.process(self.transfer_process(transfer)))
-
-        if len(copy_procs) > 0:
-            yield self.sim.all_of(copy_procs)
-        return True
-
-    def runpayload_process(self, job):
-        job_runtime = random.randint(1800, 36000)
-        yield self.sim.timeout(job_runtime)
-        return True
-
-    def stageout_process(self, job):
-        dst_rse_obj = job.compute_instance.bucket_obj
-        dietime = self.sim.now + 3600*24*14
-
-        # create job output file
-        size = random.randint(2**26, 2**30)
-        file_obj = self.rucio.create_file('out_res_j{}'.format(job.id), size, dietime)
-        replica_obj = self.rucio.create_replica(file_obj, dst_rse_obj)
-        dst_rse_obj.increase_replica(file_obj, self.sim.now, size)
-        job.output_files.append(file_obj)
-
-        # create job log file
-        size = random.randint(2**21, 2**24)
-        file_obj = self.rucio.create_file('out_log_j{}'.format(job.id), size, dietime)
-        replica_obj = self.rucio.create_replica(file_obj, dst_rse_obj)
-        dst_rse_obj.increase_replica(file_obj, self.sim.now, size)
-        job.output_files.append(file_obj)
-
-        yield self.sim.timeout(300)
-        return True
-
-    def job_process(self, job):
-        log = self.logger.getChild('job_proc')
-        log.debug('Started job {}'.format(job.id), self.sim.now)
-
-        stagein_duration = self.sim.now
-        success = yield self.sim.process(self.stagein_process(job))
-        if not success:
-            log.error('Stagein failed', self.sim.now)
-            return False
-        stagein_duration = self.sim.now - stagein_duration
-
-        payload_duration = self.sim.now
-        success = yield self.sim.process(self.runpayload_process(job))
-        if not success:
-            log.error('Payload failed', self.sim.now)
-            return False
-        payload_duration = self.sim.now - payload_duration
-
-        stageout_duration = self.sim.now
-        success = yield self.sim.process(self.stageout_process(job))
-        if not success:
-            log.error('Stageout failed', self.sim.now)
-            return False
-        stageout_duration = self.sim.now - stageout_duration
-        return True
-
-    def job_process2(self, job):
-        log = self.logger.getChild('job_proc')
-        log.debug('Started job {}'.format(job.id), self.sim.now)
-
-        # STAGE-IN
-        stagein_duration = self.sim.now
-        direct_copy = False
-        copy_procs = []
-        dst_rse_obj = job.compute_instance.bucket_obj
-        for file_obj in job.input_files:
-            if not direct_copy and dst_rse_obj.name in file_obj.rse_by_name:
-                # file already exists at dst
-                continue
-
-            available_src_replicas = []
-            for replica_obj in file_obj.replica_list:
-                if replica_obj.state == grid.Replica.AVAILABLE:
-                    available_src_replicas.append(replica_obj)
-            #TODO: replace shuffle with replica sorting
-            random.shuffle(available_src_replicas)
-            if len(available_src_replicas) == 0:
-                log.error('Failed to stagein file: No replicas available', self.sim.now)
-                return False
-
-            src_replica_obj = available_src_replicas[0]
-            if direct_copy:
-                # WIP code; need to add proper linkselectors
-                download = self.rucio.create_download(src_replica_obj, dst_rse_obj.site_obj)
-                copy_procs.append(self.sim.process(self.download_process(download)))
-            else:
-                transfer = self.rucio.create_transfer(file_obj, src_replica_obj.rse_obj, dst_rse_obj)
-                copy_procs.append(self.sim.process(self.transfer_process(transfer)))
-
-        if len(copy_procs) > 0:
-            yield self.sim.all_of(copy_procs)
-        stagein_duration = self.sim.now - stagein_duration
-
-        # PAYLOAD
-        payload_duration = self.sim.now
-        job_runtime = random.randint(600, 2*3600)
-        yield self.sim.timeout(job_runtime)
-        payload_duration = self.sim.now - payload_duration
-
-        # STAGE-OUT
-        stageout_duration = self.sim.now
-        dst_rse_obj = job.compute_instance.bucket_obj
-        dietime = self.sim.now + 3600*24*7
-
-        # create job output file
-        size = random.randint(2**26, 2**30)
-        file_obj = self.rucio.create_file('out_res_j{}'.format(job.id), size, dietime)
-        replica_obj = self.rucio.create_replica(file_obj, dst_rse_obj)
-        dst_rse_obj.increase_replica(file_obj, self.sim.now, size)
-        job.output_files.append(file_obj)
-
-        # create job log file
-        size = random.randint(2**21, 2**24)
-        file_obj = self.rucio.create_file('out_log_j{}'.format(job.id), size, dietime)
-        replica_obj = self.rucio.create_replica(file_obj, dst_rse_obj)
-        dst_rse_obj.increase_replica(file_obj, self.sim.now, size)
-        job.output_files.append(file_obj)
-        yield self.sim.timeout(300)
-        stageout_duration = self.sim.now - stageout_duration
-
-        return True
-
-    def job_gen_process(self):
+        num_rses = len(self.grid_rses)
+        assert max_num_replicas <= num_rses, (max_num_replicas, num_rses)
+
+        files_per_num_replicas = [int(total_files_gen * percent) for percent in self.DATAGEN_REPLICATION_PERCENT]
+        num_replicas = np.repeat(np.arange(1, max_num_replicas + 1), files_per_num_replicas)
+        num_files = len(num_replicas)
+        if self.grid_arrivals is not None:
+            sizes = arrival_sizes[:num_files]
+        else:
+            sizes = rng.randint(self.DATAGEN_FILES_SIZE_MIN, self.DATAGEN_FILES_SIZE_MAX + 1, num_files, dtype=np.int64)
+        die_times = cur_time + rng.randint(self.DATAGEN_LIFETIME_MIN, self.DATAGEN_LIFETIME_MAX + 1, num_files)
+
+        # a random permutation of the grid rses per file; the first num_replicas get a replica
+        rse_ranks = rng.random_sample((num_files, num_rses)).argsort(axis=1).argsort(axis=1)
+        replica_masks = rse_ranks < num_replicas[:, np.newaxis]
+        names = None
+        if self.grid_rng is not None:
+            # the ids of the shards diverge, files are referred to by name in messages
+            names = ['grid{}'.format(self.num_grid_files + idx) for idx in range(num_files)]
+            self.num_grid_files += num_files
+        self.rucio.create_files_bulk(sizes, die_times, replica_masks, cur_time, names)
+
+        #log.info('Created {} files with {} replicas using {} of space'.format(num_files,
+        #                                                                      replica_masks.sum(),
+        #                                                                      utils.sizefmt((sizes * num_replicas).sum())), cur_time)
+
+    def job_gen_process(self, wakeup=None):
         log = self.logger.getChild('job_gen_process')
         log.info('Started job generation process!', self.sim.now)
 
         while True:
-            wait = random.randint(self.JOBFAC_WAIT_MIN, self.JOBFAC_WAIT_MAX)
-            yield self.sim.timeout(wait)
+            if wakeup is None:
+                wait = random.randint(self.JOBFAC_WAIT_MIN, self.JOBFAC_WAIT_MAX)
+                wakeup = self.sim.timeout(wait)
+            yield wakeup
+            wakeup = None
             total_file_count = len(self.rucio.file_list)
             total_region_count = len(self.cloud.region_list)
             assert total_file_count > 0, total_file_count
-            assert total_region_count > 0, total_file_count
+            assert total_region_count > 0, total_region_count
 
-            num_jobs = min(random.randint(self.JOBFAC_JOB_NUM_MIN, self.JOBFAC_JOB_NUM_MAX), total_file_count)
-            log.debug('{} new jobs, {} registered files, waited {}'.format(num_jobs, total_file_count, wait), self.sim.now)
+            num_jobs = round(random.randint(self.JOBFAC_JOB_NUM_MIN, self.JOBFAC_JOB_NUM_MAX) * self.shard_share)
+            log.debug('{} new jobs, {} registered files', self.sim.now, num_jobs, total_file_count)
+            jobs = []
             for job_nr in range(num_jobs):
-                num_input_files = random.randint(self.JOBFAC_INFILES_NUM_MIN, self.JOBFAC_INFILES_NUM_MAX)
-                input_files = random.sample(rucio.file_list, num_input_files)
-                bucket = random.choice(self.cloud.bucket_list)
-                compute_instance = ComputeInstance(bucket)
-                for file in input_files:
-                    self.sim.process(self.job_process2(Job(compute_instance, input_files)))
-
-    def transfer_gen_process(self):
+                num_input_files = min(random.randint(self.JOBFAC_INFILES_NUM_MIN, self.JOBFAC_INFILES_NUM_MAX), total_file_count)
+                input_files = random.sample(self.rucio.file_list, num_input_files)
+                bucket = random.choice(self.local_buckets)
+                runtime = random.randint(self.JOBFAC_RUNTIME_MIN, self.JOBFAC_RUNTIME_MAX)
+                jobs.append(jobscheduler.Job(bucket, input_files, runtime))
+            self.job_scheduler.submit(jobs)
+
+    def transfer_gen_process(self, wakeup=None):
         log = self.logger.getChild('transfer_gen_process')
         log.info('Started transfer generation process!', self.sim.now)
 
         while True:
-            yield self.sim.timeout(30)
+            yield wakeup or self.sim.timeout(self.TRANSFER_GEN_WAIT)
+            wakeup = None
             # generate grid -> cloud
-            num_active = len(self.active_transfers)
-            num_to_create = self.g2c_num_generator.get_num_to_create(self.sim.now, num_active)
+            if self.g2c_arrivals is not None:
+                num_to_create = self.g2c_arrivals.get_count(self.sim.now)
+                if self.shard_share < 1:
+                    num_to_create = self.workload_rng.binomial(num_to_create, self.shard_share)
+            else:
+                num_active = self.transfer_engine.get_num_active()
+                # a shard creates its share of the transfers of the whole cloud
+                num_to_create = int(self.g2c_num_generator.get_num_to_create(self.sim.now, num_active / self.shard_share) * self.shard_share)
             num_to_create_per_rse = max(1, int(num_to_create / len(self.grid_rses)))  # assuming uniform distribution
             total_transfers_created = 0
+            new_transfers = []
             for grid_rse_obj in self.grid_rses:
-                num_files = min(len(grid_rse_obj.replica_list), num_to_create_per_rse)
+                cloud_rse_obj = npr.choice(self.local_buckets)
+                num_candidates = self.replica_candidates.get_num_candidates(grid_rse_obj, cloud_rse_obj)
+                num_files = min(num_candidates, num_to_create_per_rse)
                 if (num_files + total_transfers_created) > num_to_create:
                     num_files = num_to_create - total_transfers_created
                 if num_files <= 0:
                     continue
                 total_transfers_created += num_files
-                replicas = random.sample(grid_rse_obj.replica_list, num_files)
-                cloud_rse_obj = npr.choice(self.cloud.bucket_list)
+                # only replicas whose file is not at cloud_rse_obj yet are drawn
+                replicas = self.replica_candidates.sample(grid_rse_obj, cloud_rse_obj, num_files)
                 for replica in replicas:
-                    if cloud_rse_obj.name in replica.file.rse_by_name:
-                        #log.warning('{} to {}'.format(grid_rse_obj.name, cloud_rse_obj.name))
-                        continue
-                    self.new_transfers.append(self.rucio.create_transfer(replica.file, grid_rse_obj, cloud_rse_obj))
+                    new_transfers.append(self.rucio.create_transfer(replica.file, grid_rse_obj, cloud_rse_obj))
+            self.transfer_engine.submit(new_transfers)
             #log.debug('active: {}, to_create: {}, created: 0'.format(num_active, num_to_create), self.sim.now)
 
             # generate cloud -> cloud
@@ -419,61 +300,101 @@ class CloudSimulator(sim.BaseSim):
                 # 2. between multi regional locations
             # generate cloud -> else
 
-    def grid_data_gen_process(self):
+    def grid_data_gen_process(self, wakeup=None):
         log = self.logger.getChild('grid_data_gen_process')
         log.info('Started grid data generation process!', self.sim.now)
 
         while True:
-            self.generate_grid_data(self.sim.now)
-            #wait = random.randint(self.DATAGEN_WAIT_MIN, self.DATAGEN_WAIT_MAX)
-            yield self.sim.timeout(self.DATAGEN_WAIT)
-
-    def reaper_process(self):
+            if wakeup is None:
+                self.generate_grid_data(self.sim.now)
+                #wait = random.randint(self.DATAGEN_WAIT_MIN, self.DATAGEN_WAIT_MAX)
+                wakeup = self.sim.timeout(self.DATAGEN_WAIT)
+            yield wakeup
+            wakeup = None
+
+    def reaper_process(self, wakeup=None):
         log = self.logger.getChild('reaper_process')
         log.info('Started Reaper process!', self.sim.now)
         while True:
-            #monitoring.OnPreReaper(self.sim.now)
-            t1 = time.time()
-            num_deleted = self.rucio.run_reaper_random2(self.sim.now)
-            self.last_reaper_duration = time.time() - t1
-            #print('{:>10} - {:2.f}'.format(self.sim.now, self.last_reaper_duration))
-            #monitoring.OnPostReaper(self.sim.now, num_deleted)
-            #if num_deleted:
-                #log.info('Reapered {}'.format(num_deleted), self.sim.now)
-            yield self.sim.timeout(self.REAPER_WAIT)
-
-    def monitoring_process(self):
+            if wakeup is None:
+                #monitoring.OnPreReaper(self.sim.now)
+                t1 = time.time()
+                num_deleted = self.rucio.run_reaper(self.sim.now)
+                self.last_reaper_duration = time.time() - t1
+                #print('{:>10} - {:2.f}'.format(self.sim.now, self.last_reaper_duration))
+                #monitoring.OnPostReaper(self.sim.now, num_deleted)
+                #if num_deleted:
+                    #log.info('Reapered {}'.format(num_deleted), self.sim.now)
+                wakeup = self.sim.timeout(self.REAPER_WAIT)
+            yield wakeup
+            wakeup = None
+
+    def monitoring_process(self, wakeup=None):
         log = self.logger.getChild('monitoring_transfer_process')
         log.info('Started Monitoring-Transfer process!', self.sim.now)
         while True:
-            monitoring.OnMonitorTick(self.sim.now, len(self.active_transfers), self.last_reaper_duration, len(self.rucio.file_list))
-            yield self.sim.timeout(self.MONITORING_WAIT)
+            if wakeup is None:
+                monitoring.OnMonitorTick(self.sim.now, self.transfer_engine.get_num_active(), self.last_reaper_duration, len(self.rucio.file_list))
+                wakeup = self.sim.timeout(self.MONITORING_WAIT)
+            yield wakeup
+            wakeup = None
+
+    def seed_rngs(self):
+        npr.seed(self.SEED)
+        random.seed(self.SEED)
+
+    def cost_monitoring_process(self, wakeup=None):
+        log = self.logger.getChild('cost_monitoring_process')
+        log.info('Started cost monitoring process!', self.sim.now)
+        while True:
+            yield wakeup or self.sim.timeout(self.COST_SAMPLE_INTERVAL)
+            wakeup = None
+            self.transfer_engine.settle(self.sim.now)
+            storage_costs, network_costs = self.cloud.get_costs_to_date(self.sim.now)
+            monitoring.OnCostSample(self.sim.now, storage_costs, network_costs)
 
     def init_simulation(self):
         log = self.logger.getChild('sim_init')
-        npr.seed(42)
-        random.seed(42)
+        self.seed_rngs()
 
         log.info('Initialising transfer generators')
-        self.g2c_num_generator = TransferNumGenerator()
-        #self.g2c_num_generator.duration_generator = TransferDurationGeneratorJJ()
+        # the workload streams of the shards are independent
+        self.workload_rng = np.random.default_rng([self.SEED, self.SHARD_ID])
+        self.g2c_num_generator = TransferNumGenerator(self.workload_rng, self.WORKLOAD_ANTITHETIC)
+        #self.g2c_num_generator.duration_generator = TransferDurationGeneratorJJ(self.workload_rng)
         #self.c2g_num_generator = TransferNumGenerator()
         #self.c2g_num_generator.duration_generator = TransferDurationGeneratorJJ()
         #self.c2c_num_generator = TransferNumGenerator()
         #self.c2c_num_generator.duration_generator = TransferDurationGeneratorJJ()
 
+        log.info('Initialising {} transfer engine'.format(self.TRANSFER_ENGINE))
+        if self.TRANSFER_ENGINE == 'fluid':
+            self.transfer_engine = transferengine.FluidTransferEngine(self.sim, self.TRANSFER_ENGINE_TOLERANCE)
+        elif self.TRANSFER_ENGINE == 'polling':
+            self.transfer_engine = transferengine.PollingTransferEngine(self.sim, self.TRANSFER_UPDATE_DELAY)
+        elif self.TRANSFER_ENGINE == 'table':
+            self.transfer_engine = transferengine.TableTransferEngine(self.sim, self.TRANSFER_UPDATE_DELAY)
+        else:
+            raise ValueError('unknown transfer engine {}'.format(self.TRANSFER_ENGINE))
+
+        if self.CATALOG_FILE:
+            log.info('Keeping the file catalogue in {}'.format(self.CATALOG_FILE))
+            self.rucio = grid.SQLiteRucio(self.CATALOG_FILE, self.CATALOG_CACHE_FILES)
+
         self.grid_rses = []
         asia_site = grid.Site('ASGC', ['asia'])
-        self.grid_rses.append(asia_site.create_rse('TAIWAN_DATADISK'))
+        self.grid_rses.append(self.rucio.create_rse(asia_site, 'TAIWAN_DATADISK'))
         cern_site = grid.Site('CERN', ['europe'])
-        self.grid_rses.append(cern_site.create_rse('CERN_DATADISK'))
+        self.grid_rses.append(self.rucio.create_rse(cern_site, 'CERN_DATADISK'))
         us_site = grid.Site('BNL', ['us'])
-        self.grid_rses.append(us_site.create_rse('BNL_DATADISK'))
+        self.grid_rses.append(self.rucio.create_rse(us_site, 'BNL_DATADISK'))
 
+        self.cloud.storage_sample_interval = self.STORAGE_SAMPLE_INTERVAL
         self.cloud.setup_default()
 
         for region in self.cloud.region_list:
             ls = asia_site.create_linkselector(region)
+            self.cloud.traffic_ledger.add_linkselector(ls)
             num_links = random.randint(self.INIT_GRIDLINKS_NUM_MIN, self.INIT_GRIDLINKS_NUM_MAX)
             for i in range(num_links):
                 min_bw = 2**self.INIT_GRIDLINKS_BW_EXPO_MIN
@@ -481,6 +402,7 @@ class CloudSimulator(sim.BaseSim):
                 ls.create_link(random.randint(min_bw, max(min_bw, max_bw)))
 
             ls = cern_site.create_linkselector(region)
+            self.cloud.traffic_ledger.add_linkselector(ls)
             num_links = random.randint(self.INIT_GRIDLINKS_NUM_MIN, self.INIT_GRIDLINKS_NUM_MAX)
             for i in range(num_links):
                 min_bw = 2**self.INIT_GRIDLINKS_BW_EXPO_MIN
@@ -488,6 +410,7 @@ class CloudSimulator(sim.BaseSim):
                 ls.create_link(random.randint(min_bw, max(min_bw, max_bw)))
 
             ls = us_site.create_linkselector(region)
+            self.cloud.traffic_ledger.add_linkselector(ls)
             num_links = random.randint(self.INIT_GRIDLINKS_NUM_MIN, self.INIT_GRIDLINKS_NUM_MAX)
             for i in range(num_links):
                 min_bw = 2**self.INIT_GRIDLINKS_BW_EXPO_MIN
@@ -496,32 +419,289 @@ class CloudSimulator(sim.BaseSim):
             self.cloud.create_bucket(region, 'bucket01_{}'.format(region.name), gcp.Bucket.TYPE_REGIONAL)
             #self.cloud.create_bucket(region, 'bucket02_{}'.format(region.name), gcp.Bucket.TYPE_REGIONAL)
 
+        self.local_buckets = list(self.cloud.bucket_list)
+        if self.NUM_SHARDS > 1:
+            self.setup_shard()
+        self.replica_candidates = self.rucio.create_candidate_index(self.grid_rses, self.local_buckets)
+
         for ls in self.cloud.linkselector_list:
             num_links = random.randint(self.INIT_CLOUDLINKS_NUM_MIN, self.INIT_CLOUDLINKS_NUM_MAX)
             for i in range(num_links):
                 min_bw = 2**self.INIT_CLOUDLINKS_BW_EXPO_MIN
                 max_bw = 2**(self.INIT_CLOUDLINKS_BW_EXPO_MAX - i)
                 ls.create_link(random.randint(min_bw, max(min_bw, max_bw)))
+        self.cloud.build_matrices()
+
+        # stage-in sources are ranked once all links exist
+        replica_selector = grid.ReplicaSelector(self.grid_rses + self.cloud.bucket_list, self.local_buckets,
+                                                self.REPLICA_SELECTION_TIME_VALUE, self.REPLICA_SELECTION_REFRESH)
+        # job ids are drawn per shard, the outputs of different shards must not share names
+        output_prefix = 'shard{}_'.format(self.SHARD_ID) if self.NUM_SHARDS > 1 else ''
+        self.job_scheduler = jobscheduler.JobScheduler(self.sim, self.rucio, self.shard_router or self.transfer_engine,
+                                                       replica_selector, self.JOB_SLOTS_PER_REGION, self.JOB_TIME_RESOLUTION,
+                                                       output_prefix=output_prefix)
+
+        if self.TRANSFER_ARRIVALS is not None:
+            log.info('Generating grid -> cloud transfers with {}'.format(type(self.TRANSFER_ARRIVALS).__name__))
+            # processes with state must not be shared by the runs of a sweep
+            self.g2c_arrivals = workload.ArrivalStream(copy.deepcopy(self.TRANSFER_ARRIVALS), self.workload_rng, self.TRANSFER_GEN_WAIT,
+                                                       max(1, self.TRANSFER_ARRIVALS_HORIZON // self.TRANSFER_GEN_WAIT))
+
+        if self.DATAGEN_ARRIVALS is not None:
+            # the grid is replicated in every shard, its stream must be too
+            sizes = workload.UniformSizes(self.DATAGEN_FILES_SIZE_MIN, self.DATAGEN_FILES_SIZE_MAX)
+            self.grid_arrivals = workload.ArrivalStream(copy.deepcopy(self.DATAGEN_ARRIVALS), np.random.default_rng(self.SEED),
+                                                        self.DATAGEN_WAIT, max(1, 24 * 3600 // self.DATAGEN_WAIT), sizes)
+
+        if self.TRACE_FILES:
+            if self.NUM_SHARDS > 1:
+                raise ValueError('traces cannot be replayed in sharded runs')
+            log.info('Replaying {}'.format(', '.join(self.TRACE_FILES)))
+            rse_by_name = dict(self.rucio.rse_by_name)
+            rse_by_name.update(self.cloud.bucket_by_name)
+            self.trace_replayer = workload.TraceReplayer(self.sim, self.rucio, self.transfer_engine, rse_by_name,
+                                                         self.TRACE_FILES, self.TRACE_CHUNK_ROWS, self.TRACE_DEFAULT_LIFETIME,
+                                                         self.TRACE_START)
+
+        if self.NUM_SHARDS > 1:
+            # the topology is the same in all shards, the workload is not
+            npr.seed([self.SEED, self.SHARD_ID])
+            random.seed('{}/{}'.format(self.SEED, self.SHARD_ID))
+
+    def setup_shard(self):
+        log = self.logger.getChild('sim_init')
+        shard_by_region_name = sharding.partition_regions(self.cloud.region_list, self.NUM_SHARDS)
+        self.local_buckets = []
+        for bucket in self.cloud.bucket_list:
+            if shard_by_region_name[bucket.site_obj.name] == self.SHARD_ID:
+                self.local_buckets.append(bucket)
+            else:
+                bucket.billed = False
+                bucket.sample_interval = None
+        assert self.local_buckets, (self.SHARD_ID, self.NUM_SHARDS)
+        self.shard_share = len(self.local_buckets) / len(self.cloud.bucket_list)
+        self.grid_rng = npr.RandomState(self.SEED)
+
+        rse_by_name = dict(self.rucio.rse_by_name)
+        rse_by_name.update(self.cloud.bucket_by_name)
+        self.shard_router = sharding.ShardRouter(self.sim, self.rucio, self.transfer_engine, rse_by_name, self.SHARD_ID,
+                                                 shard_by_region_name, self.SHARD_LOOKAHEAD)
+        if self.JOBFAC_ENABLED:
+            # mirrored replicas are only read as stage-in sources of jobs; mirroring
+            # every replica of every other shard is the largest replicated cost
+            for bucket in self.local_buckets:
+                bucket.replica_indexes.append(self.shard_router)
+        log.info('Shard {} of {} simulates {} buckets'.format(self.SHARD_ID, self.NUM_SHARDS, len(self.local_buckets)))
+
+    def start_processes(self, wakeups=None):
+        # wakeups maps process names to the pending event a restored process resumes with
+        wakeups = wakeups or {}
+        self.processes = {}
+        self.processes['billing_process'] = self.sim.process(self.billing_process(wakeups.get('billing_process')))
+        if self.trace_replayer:
+            self.processes['trace_replay_process'] = self.sim.process(self.trace_replayer.replay_process(wakeups.get('trace_replay_process')))
+        else:
+            self.processes['grid_data_gen_process'] = self.sim.process(self.grid_data_gen_process(wakeups.get('grid_data_gen_process')))
+        if self.JOBFAC_ENABLED:
+            self.processes['job_gen_process'] = self.sim.process(self.job_gen_process(wakeups.get('job_gen_process')))
+        if not self.trace_replayer:
+            self.processes['transfer_gen_process'] = self.sim.process(self.transfer_gen_process(wakeups.get('transfer_gen_process')))
+        engine_process = self.transfer_engine.start(wakeups.get('transfer_engine'))
+        if engine_process:
+            self.processes['transfer_engine'] = engine_process
+        self.processes['reaper_process'] = self.sim.process(self.reaper_process(wakeups.get('reaper_process')))
+        self.processes['monitoring_process'] = self.sim.process(self.monitoring_process(wakeups.get('monitoring_process')))
+        if self.COST_SAMPLE_INTERVAL:
+            self.processes['cost_monitoring_process'] = self.sim.process(self.cost_monitoring_process(wakeups.get('cost_monitoring_process')))
+
+    def resume_processes(self, restored_wakeups):
+        process_wakeups = {}
+        for event, (kind, key) in restored_wakeups:
+            if kind == 'process':
+                process_wakeups[key] = event
+            elif kind == 'jobs':
+                self.job_scheduler.resume_event(key, event)
+            else:
+                self.transfer_engine.resume_event(key, event)
+        self.start_processes(process_wakeups)
+
+    def save_checkpoint(self, path):
+        if self.shard_router:
+            raise NotImplementedError('sharded runs cannot be checkpointed')
+        # must be called between sim.run() calls, when every process waits on its next event
+        wakeups = [(process.target, ('process', name)) for name, process in self.processes.items()]
+        for event, key in self.transfer_engine.get_pending_events():
+            wakeups.append((event, ('engine', key)))
+        for event, key in self.job_scheduler.get_pending_events():
+            wakeups.append((event, ('jobs', key)))
+        checkpoint.save(path, self.sim, self, wakeups)
 
     def simulate(self):
-        self.sim.process(self.billing_process())
-        self.sim.process(self.grid_data_gen_process())
-        #self.sim.process(self.job_gen_process())
-        self.sim.process(self.transfer_gen_process())
-        self.sim.process(self.transfer_process2())
-        self.sim.process(self.reaper_process())
-        self.sim.process(self.monitoring_process())
-        self.sim.run(until=self.SIM_DURATION)
-try:
-    sim = simpy.Environment()
-    cloud = gcp.Cloud()
-    rucio = grid.Rucio()
-    cloud_sim = CloudSimulator(sim, cloud, rucio)
-    cloud_sim.init_simulation()
-    cloud_sim.simulate()
-except (KeyboardInterrupt, SystemExit):
-    pass
-except Exception as err:
-    print(err)
-
-monitoring.plotIt()
+        # sharded runs are driven by sharding.run_sharded() instead
+        assert self.NUM_SHARDS == 1, self.NUM_SHARDS
+        if self.restored_wakeups is None:
+            self.start_processes()
+        else:
+            self.resume_processes(self.restored_wakeups)
+            self.restored_wakeups = None
+        if self.RESULTS_FILE:
+            monitoring.open_results(self.RESULTS_FILE)
+        try:
+            if self.CHECKPOINT_INTERVAL:
+                checkpoint_time = (self.sim.now // self.CHECKPOINT_INTERVAL + 1) * self.CHECKPOINT_INTERVAL
+                while checkpoint_time < self.SIM_DURATION:
+                    self.sim.run(until=checkpoint_time)
+                    self.save_checkpoint(self.CHECKPOINT_FILE.format(checkpoint_time))
+                    checkpoint_time += self.CHECKPOINT_INTERVAL
+            self.sim.run(until=self.SIM_DURATION)
+        finally:
+            if isinstance(self.sim, profiling.ProfilingEnvironment):
+                profiling.export(self.sim)
+            if self.RESULTS_FILE:
+                monitoring.close_results()
+
+def apply_overrides(cloud_sim, overrides):
+    for name, value in (overrides or {}).items():
+        if not hasattr(cloud_sim, name):
+            raise AttributeError('CloudSimulator has no parameter {}'.format(name))
+        setattr(cloud_sim, name, value)
+
+
+def get_env_class(profile):
+    return profiling.ProfilingEnvironment if profile else simpy.Environment
+
+
+def create_simulator(overrides=None, log_level=logging.INFO, profile=False):
+    # profile=True records wall time, resumptions and scheduled events per simpy process
+    monitoring.init()
+    cloud_sim = CloudSimulator(get_env_class(profile)(), gcp.Cloud(), grid.Rucio())
+    cloud_sim.logger.logger.setLevel(log_level)
+    apply_overrides(cloud_sim, overrides)
+    return cloud_sim
+
+
+def create_shard_simulator(overrides, log_level, shard_id, num_shards):
+    # simulator of one shard of a sharded run; the shards do not write results
+    overrides = dict(overrides or {}, SHARD_ID=shard_id, NUM_SHARDS=num_shards, RESULTS_FILE=None)
+    return create_simulator(overrides, log_level)
+
+
+def run_sharded_simulation(num_shards, overrides=None, log_level=logging.INFO):
+    # returns the merged results of all shards
+    factory = functools.partial(create_shard_simulator, overrides, log_level)
+    results = sharding.run_sharded(factory, num_shards)
+    results_path = (overrides or {}).get('RESULTS_FILE')
+    if results_path:
+        monitoring.save_results(results_path, results)
+    return results
+
+
+def restore_simulator(path, overrides=None, log_level=logging.INFO, profile=False):
+    # continues a run from a checkpoint; init_simulation() must not be called again
+    # and only plain parameters (durations, files, ...) can be overridden
+    setup_logging()
+    env, cloud_sim, restored_wakeups = checkpoint.load(path, get_env_class(profile))
+    cloud_sim.restored_wakeups = restored_wakeups
+    cloud_sim.logger.logger.setLevel(log_level)
+    # output files of the checkpointed run are not inherited
+    cloud_sim.CHECKPOINT_INTERVAL = None
+    cloud_sim.RESULTS_FILE = None
+    apply_overrides(cloud_sim, overrides)
+    # the chunks streamed before the checkpoint are copied into the new results file
+    streamed_path = monitoring.data.results_path
+    if streamed_path and any(series.num_flushed_chunks for series in monitoring.data.get_series()):
+        if not cloud_sim.RESULTS_FILE:
+            raise ValueError('{} continues a run that streamed its results to {}, a new results file is required'.format(path, streamed_path))
+        if os.path.abspath(cloud_sim.RESULTS_FILE) == os.path.abspath(streamed_path):
+            raise ValueError('the results file of a restored run must differ from {}'.format(streamed_path))
+    return cloud_sim
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulates grid to cloud transfers and the resulting cloud costs.')
+    parser.add_argument('--no-plot', action='store_true', help='do not show figures after the simulation (headless mode)')
+    parser.add_argument('--results', help='npz file the monitoring series are streamed to')
+    parser.add_argument('--summary', help='json file the run summary is written to (default: --results with .json suffix)')
+    parser.add_argument('--sim-days', type=float, help='simulated days (default: 90)')
+    parser.add_argument('--jobs', action='store_true', help='generate jobs that stage in grid files and run in the cloud regions')
+    parser.add_argument('--log-async', action='store_true', help='format and write log records in a background thread')
+    parser.add_argument('--checkpoint-interval', type=float, help='simulated hours between checkpoints')
+    parser.add_argument('--checkpoint-file', help='checkpoint file name, formatted with the sim time (default: checkpoint_{:.0f}.pkl.gz)')
+    parser.add_argument('--restore', help='checkpoint file the simulation is continued from')
+    parser.add_argument('--profile', action='store_true', help='print the wall time spent per simpy process at the end')
+    parser.add_argument('--trace', action='append', help='replay a csv(.gz), parquet or npy trace instead of the synthetic workload (repeatable)')
+    parser.add_argument('--trace-start', type=float, help='trace time in seconds, e.g. unix epoch, replayed at sim time 0 (default: time of the first trace row)')
+    parser.add_argument('--catalog', help='sqlite file the file catalogue is kept in instead of memory (recreated, no checkpoints)')
+    parser.add_argument('--shards', type=int, default=1, help='worker processes the cloud regions are partitioned into')
+    args = parser.parse_args()
+
+    if args.log_async:
+        setup_logging(async_sink=True)
+
+    summary_path = args.summary
+    if not summary_path and args.results:
+        summary_path = os.path.splitext(args.results)[0] + '.json'
+
+    overrides = {'RESULTS_FILE': args.results}
+    if args.sim_days:
+        overrides['SIM_DURATION'] = int(args.sim_days * 24 * 3600) + 1
+    if args.trace:
+        overrides['TRACE_FILES'] = args.trace
+    if args.trace_start is not None:
+        overrides['TRACE_START'] = args.trace_start
+    if args.catalog:
+        overrides['CATALOG_FILE'] = args.catalog
+    if args.jobs:
+        overrides['JOBFAC_ENABLED'] = True
+    if args.checkpoint_interval:
+        overrides['CHECKPOINT_INTERVAL'] = args.checkpoint_interval * 3600
+    if args.checkpoint_file:
+        overrides['CHECKPOINT_FILE'] = args.checkpoint_file
+
+    restored_sim = None
+    if args.restore and args.shards <= 1:
+        # checked before the run, a restored run cannot return its results without them
+        try:
+            restored_sim = restore_simulator(args.restore, overrides, profile=args.profile)
+        except ValueError as err:
+            parser.error(str(err))
+
+    sharded_results = None
+    try:
+        if args.shards > 1:
+            if args.restore or args.checkpoint_interval or args.profile:
+                raise ValueError('sharded runs do not support --restore, --checkpoint-interval and --profile')
+            sharded_results = run_sharded_simulation(args.shards, overrides)
+        elif restored_sim is not None:
+            restored_sim.simulate()
+        else:
+            cloud_sim = create_simulator(overrides, profile=args.profile)
+            cloud_sim.init_simulation()
+            cloud_sim.simulate()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    except Exception as err:
+        print(err)
+
+    if sharded_results is not None:
+        results = sharded_results
+    elif args.results:
+        results = monitoring.load_results(args.results)
+    else:
+        results = monitoring.data.get_results()
+    summary = monitoring.summarize(results)
+    if summary_path:
+        with open(summary_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    report.print_summary(summary)
+    if args.profile and 'profile' in results:
+        report.print_profile(results['profile']['processes'], summary.get('sim_time', 0))
+    if not args.no_plot:
+        report.show_results(results)
+
+
+if __name__ == '__main__':
+    # run from the importable module so pickled checkpoints refer to sim.CloudSimulator
+    import sim as cloudsim
+    cloudsim.main()
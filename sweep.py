@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+import argparse
+import ast
+import csv
+import itertools
+import json
+import logging
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import sim as cloudsim
+from gacs.common import monitoring
+
+
+def parse_param(text):
+    # NAME=V1,V2,... where every value is a python literal
+    name, sep, values = text.partition('=')
+    if not sep or not name:
+        raise argparse.ArgumentTypeError('parameter must be given as NAME=V1,V2,...: {}'.format(text))
+    try:
+        values = ast.literal_eval('[{}]'.format(values))
+    except (ValueError, SyntaxError):
+        raise argparse.ArgumentTypeError('cannot parse values of {}: {}'.format(name, values))
+    return name.strip(), values
+
+
+def expand_grid(params):
+    names = [name for name, _ in params]
+    for values in itertools.product(*[values for _, values in params]):
+        yield dict(zip(names, values))
+
+
+def make_tasks(override_list, seeds, sim_days, results_dir, restore=None):
+    tasks = []
+    for overrides in override_list:
+        for seed in seeds:
+            run_overrides = dict(overrides)
+            run_overrides['SEED'] = seed
+            if sim_days:
+                run_overrides['SIM_DURATION'] = int(sim_days * 24 * 3600) + 1
+            run_id = len(tasks)
+            if results_dir:
+                run_overrides['RESULTS_FILE'] = os.path.join(results_dir, 'run{:04d}.npz'.format(run_id))
+            tasks.append((run_id, overrides, run_overrides, restore))
+    return tasks
+
+
+def run_task(task):
+    run_id, overrides, run_overrides, restore = task
+    wall_time = time.time()
+    if restore:
+        # all runs share the warm-up of the checkpoint and continue with their own seed
+        cloud_sim = cloudsim.restore_simulator(restore, run_overrides, log_level=logging.WARNING)
+        cloud_sim.seed_rngs()
+    else:
+        cloud_sim = cloudsim.create_simulator(run_overrides, log_level=logging.WARNING)
+        cloud_sim.init_simulation()
+    cloud_sim.simulate()
+    wall_time = time.time() - wall_time
+    # costs since the last bill, runs shorter than a billing month have no bill at all
+    cloud_sim.transfer_engine.settle(cloud_sim.sim.now)
+    storage_unbilled, network_unbilled = cloud_sim.cloud.get_costs_to_date(cloud_sim.sim.now)
+
+    if cloud_sim.RESULTS_FILE:
+        results = monitoring.load_results(cloud_sim.RESULTS_FILE)
+    else:
+        results = monitoring.data.get_results()
+    summary = monitoring.summarize(results)
+
+    row = {'run': run_id, 'seed': run_overrides['SEED']}
+    row.update(overrides)
+    row['wall_time'] = wall_time
+    row['transfers_num'] = summary['transfers']['num']
+    row['transfers_duration_mean'] = summary['transfers'].get('duration_mean')
+    row['storage_total'] = sum(bill['storage_total'] for bill in summary['bills']) + storage_unbilled
+    row['network_total'] = sum(bill['network_total'] for bill in summary['bills']) + network_unbilled
+    row['storage_unbilled'] = storage_unbilled
+    row['network_unbilled'] = network_unbilled
+    for nr, bill in enumerate(summary['bills'], 1):
+        row['storage_month{}'.format(nr)] = bill['storage_total']
+        row['network_month{}'.format(nr)] = bill['network_total']
+    return row
+
+
+def run_sweep(tasks, num_workers=None):
+    # rows are returned in task order regardless of the completion order
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        return list(executor.map(run_task, tasks))
+
+
+def write_table(rows, path):
+    fieldnames = []
+    for row in rows:
+        for name in row:
+            if name not in fieldnames:
+                fieldnames.append(name)
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs a parameter sweep of sim.py over a process pool.')
+    parser.add_argument('-p', '--param', action='append', type=parse_param, default=[],
+                        help='CloudSimulator parameter and its values, e.g. TRANSFER_UPDATE_DELAY=10,20 (grid over all given parameters)')
+    parser.add_argument('--runs', help='json file with a list of parameter override dicts (used instead of the grid)')
+    parser.add_argument('-s', '--seeds', default='42', help='comma separated list of seeds every configuration is run with')
+    parser.add_argument('-j', '--workers', type=int, help='number of worker processes (default: number of cpus)')
+    parser.add_argument('--sim-days', type=float, help='simulated days per run (default: 90)')
+    parser.add_argument('--results-dir', help='directory the results file of each run is written to')
+    parser.add_argument('--restore', help='checkpoint every run is continued from instead of starting at t=0')
+    parser.add_argument('-o', '--output', default='sweep.csv', help='csv file the result table is written to')
+    args = parser.parse_args()
+
+    if args.runs:
+        with open(args.runs) as f:
+            override_list = json.load(f)
+    else:
+        override_list = list(expand_grid(args.param))
+    seeds = [int(seed) for seed in args.seeds.split(',')]
+    if args.results_dir:
+        os.makedirs(args.results_dir, exist_ok=True)
+
+    tasks = make_tasks(override_list, seeds, args.sim_days, args.results_dir, args.restore)
+    print('Running {} simulations'.format(len(tasks)))
+    rows = run_sweep(tasks, args.workers)
+    write_table(rows, args.output)
+    print('Wrote {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from gacs import workload
+
+
+def get_stream_rate(process, interval, horizon_bins, duration):
+    stream = workload.ArrivalStream(process, np.random.default_rng(42), interval, horizon_bins)
+    num_arrivals = sum(stream.get_count(cur_time) for cur_time in range(0, duration, interval))
+    return num_arrivals / duration
+
+
+@pytest.mark.parametrize('horizon_bins', [1, 7, 1000])
+def test_empirical_rate_across_horizons(horizon_bins):
+    # mean interarrival time of 2s, no arrivals may be lost between horizons
+    rate = get_stream_rate(workload.EmpiricalProcess([1, 2, 3]), 30, horizon_bins, 10*24*3600)
+    assert rate == pytest.approx(0.5, rel=0.01)
+
+
+def test_poisson_rate():
+    rate = get_stream_rate(workload.PoissonProcess(0.5), 30, 1000, 10*24*3600)
+    assert rate == pytest.approx(0.5, rel=0.01)
+
+
+def test_diurnal_rate():
+    rate = get_stream_rate(workload.DiurnalProcess(0.5), 30, 1000, 10*24*3600)
+    assert rate == pytest.approx(0.5, rel=0.01)
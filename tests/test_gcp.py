@@ -0,0 +1,60 @@
+import pytest
+
+from gacs.clouds import gcp
+from gacs.common import monitoring, utils
+
+
+def make_cloud():
+    utils.setup_utils()
+    monitoring.init()
+    cloud = gcp.Cloud()
+    cloud.setup_default()
+    for region in cloud.region_list:
+        cloud.create_bucket(region, 'bucket_' + region.name, gcp.Bucket.TYPE_REGIONAL)
+    return cloud
+
+
+def test_location_matrices():
+    cloud = make_cloud()
+    us = cloud.region_by_name['us']
+    us_east1 = cloud.region_by_name['us-east1']
+    northamerica = cloud.region_by_name['northamerica-northeast1']
+    europe_west1 = cloud.region_by_name['europe-west1']
+    assert cloud.is_same_location(us, us)
+    assert not cloud.is_same_multi_location(us, us)
+    assert cloud.is_same_multi_location(us_east1, us)
+    assert cloud.is_same_multi_location(northamerica, us_east1)
+    assert not cloud.is_same_multi_location(us_east1, europe_west1)
+
+
+def test_graph_matches_linkselectors():
+    cloud = make_cloud()
+    for idx, linkselector in enumerate(cloud.linkselector_list):
+        linkselector.create_link(100 + idx)
+    graph = cloud.get_as_graph()
+    buckets = cloud.bucket_list
+    for linkselector in cloud.linkselector_list:
+        src_idx = [bucket.site_obj for bucket in buckets].index(linkselector.src_site)
+        dst_idx = [bucket.site_obj for bucket in buckets].index(linkselector.dst_site)
+        assert cloud.linkselector_list[graph['linkselector_index'][src_idx, dst_idx]] is linkselector
+        assert graph['bandwidth'][src_idx, dst_idx] == linkselector.calc_full_bandwidth()
+        schedule = cloud.network_price_schedules[graph['price_tier_id'][src_idx, dst_idx]]
+        assert schedule is linkselector.network_price_chf
+        assert graph['weight'][src_idx, dst_idx] == linkselector.get_weight()
+
+
+def test_storage_samples_add_up_to_bills():
+    # billing falls between two samples
+    utils.setup_utils()
+    monitoring.init()
+    region = gcp.Region('region', 'Region', ['region'], 0.02, 'SKU')
+    bucket = region.create_rse('bucket', gcp.Bucket.TYPE_REGIONAL)
+    bucket.sample_interval = 3600
+    bill = 0
+    for hour in range(10):
+        bucket.increase_storage(hour * 3600 + 600, 2**30)
+        if hour % 3 == 2:
+            bill += bucket.process_storage_billing(hour * 3600 + 1800)
+    bill += bucket.process_storage_billing(10 * 3600)
+    samples = monitoring.data.get_results()['storage']
+    assert samples['cost'].sum() == pytest.approx(bill)
@@ -0,0 +1,29 @@
+import io
+import logging
+import logging.handlers
+import queue
+
+from gacs.common.logging import SimFormatter, SimQueueHandler
+
+
+def test_async_sink_keeps_tracebacks():
+    stream = io.StringIO()
+    sink = logging.StreamHandler(stream)
+    sink.setFormatter(SimFormatter())
+    record_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(record_queue, sink)
+    logger = logging.getLogger('gacs_test_async_sink')
+    logger.propagate = False
+    logger.addHandler(SimQueueHandler(record_queue))
+    listener.start()
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.exception('failed at step %d', 3)
+    listener.stop()
+
+    output = stream.getvalue()
+    assert 'failed at step 3' in output
+    assert 'Traceback (most recent call last)' in output
+    assert 'ZeroDivisionError' in output
+    assert output.count('ZeroDivisionError') == 1
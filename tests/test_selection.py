@@ -0,0 +1,39 @@
+from gacs import grid
+from gacs.common import monitoring, utils
+
+
+def make_sources(num_sources, bandwidth):
+    utils.setup_utils()
+    monitoring.init()
+    rucio = grid.Rucio()
+    dst_site = grid.Site('dst', 'dst')
+    dst_rse = rucio.create_rse(dst_site, 'DST')
+    src_rses = []
+    for i in range(num_sources):
+        src_site = grid.Site('src{}'.format(i), 'src')
+        src_rses.append(rucio.create_rse(src_site, 'SRC{}'.format(i)))
+        src_site.create_linkselector(dst_site).create_link(bandwidth)
+    return rucio, src_rses, dst_rse
+
+
+def test_batch_is_spread_over_equal_sources():
+    # every selection counts as a transfer on its link until the next refresh
+    rucio, src_rses, dst_rse = make_sources(2, 2**20)
+    selector = grid.ReplicaSelector(src_rses, [dst_rse], refresh_interval=3600)
+    num_selected = {src_rse.name: 0 for src_rse in src_rses}
+    for i in range(10):
+        file_obj = rucio.create_file('file{}'.format(i), 100, 10**9)
+        for src_rse in src_rses:
+            src_rse.create_replicas_bulk([file_obj], 0)
+        num_selected[selector.select_source(file_obj, dst_rse, 0).rse_obj.name] += 1
+    assert num_selected == {'SRC0': 5, 'SRC1': 5}
+
+
+def test_unavailable_replicas_are_skipped():
+    rucio, src_rses, dst_rse = make_sources(2, 2**20)
+    selector = grid.ReplicaSelector(src_rses, [dst_rse])
+    file_obj = rucio.create_file('file', 100, 10**9)
+    rucio.create_replica(file_obj, src_rses[0])
+    assert selector.select_source(file_obj, dst_rse, 0) is None
+    src_rses[1].create_replicas_bulk([file_obj], 0)
+    assert selector.select_source(file_obj, dst_rse, 0).rse_obj is src_rses[1]
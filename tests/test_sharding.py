@@ -0,0 +1,26 @@
+import logging
+
+import sim
+
+
+def test_two_shards_exchange_transfers():
+    # jobs stage in from buckets of the other shard, which has to simulate
+    # the transfers and report their end back
+    overrides = {'SEED': 42, 'SHARD_LOOKAHEAD': 30, 'SIM_DURATION': 2 * 3600,
+                 'JOBFAC_ENABLED': True, 'JOBFAC_WAIT_MIN': 600, 'JOBFAC_WAIT_MAX': 1200,
+                 'JOBFAC_JOB_NUM_MIN': 10, 'JOBFAC_JOB_NUM_MAX': 20}
+    results = sim.run_sharded_simulation(2, overrides, logging.WARNING)
+
+    routers = results['sharding']['routers']
+    assert len(routers) == 2
+    for router_stats in routers:
+        assert router_stats['num_remote_submitted'] > 0
+        assert router_stats['num_remote_completed'] > 0
+    num_remote_completed = sum(router_stats['num_remote_completed'] for router_stats in routers)
+    assert num_remote_completed <= sum(router_stats['num_remote_submitted'] for router_stats in routers)
+
+    shard_counters = results['sharding']['counters']
+    assert results['counters']['job_num_done'] > 0
+    for name, value in results['counters'].items():
+        assert value == sum(counters[name] for counters in shard_counters), name
+    assert len(results['transfers']) >= results['counters']['transfer_num_completed']
@@ -0,0 +1,25 @@
+import pytest
+
+from gacs.workload import trace
+
+
+def make_columns(file_name, rse_name='RSE'):
+    return {'time': ['0'], 'kind': ['file'], 'file': [file_name], 'size': ['1'], 'die_time': [''],
+            'src_rse': [''], 'dst_rse': [rse_name]}
+
+
+def test_long_dids_are_kept():
+    # dids of the same scope with a common prefix must stay distinct
+    names = ['data18_13TeV:' + 'x' * 200 + suffix for suffix in ('.1', '.2')]
+    columns = {name: values * 2 for name, values in make_columns(names[0]).items()}
+    columns['file'] = names
+    chunk = trace.make_chunk(columns)
+    assert chunk['file'].tolist() == names
+
+
+@pytest.mark.parametrize('column', ['file', 'dst_rse'])
+def test_too_long_values_are_rejected(column):
+    columns = make_columns('scope:name')
+    columns[column] = ['x' * 300]
+    with pytest.raises(ValueError):
+        trace.make_chunk(columns)
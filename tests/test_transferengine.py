@@ -0,0 +1,102 @@
+import pytest
+import simpy
+
+from gacs import abstractions, grid
+from gacs.common import monitoring, utils
+from gacs.sim.transferengine import FluidTransferEngine, PollingTransferEngine
+
+
+def make_transfer(bandwidth, file_size):
+    utils.setup_utils()
+    monitoring.init()
+    rucio = grid.Rucio()
+    src_site = grid.Site('src', 'src')
+    dst_site = grid.Site('dst', 'dst')
+    src_rse = rucio.create_rse(src_site, 'SRC')
+    dst_rse = rucio.create_rse(dst_site, 'DST')
+    src_site.create_linkselector(dst_site).create_link(bandwidth)
+    file_obj = rucio.create_file('file', file_size, 10**9)
+    rucio.create_replica(file_obj, src_rse)
+    src_rse.increase_replica(file_obj, 0, file_size)
+    return rucio, rucio.create_transfer(file_obj, src_rse, dst_rse)
+
+
+@pytest.mark.parametrize('tolerance, delete_time', [(0, 10), (600, 600)])
+def test_fluid_delete_at_completion_time(tolerance, delete_time):
+    # the file is deleted at the time of the transfer's completion event but
+    # before the event is processed, so the engine sees a finished transfer
+    rucio, transfer = make_transfer(100, 1000)
+    env = simpy.Environment()
+    engine = FluidTransferEngine(env, tolerance)
+    deletion = env.timeout(delete_time)
+    deletion.callbacks.append(lambda event: rucio.remove_file(transfer.file, env.now))
+    engine.submit([transfer])
+    env.run()
+
+    assert transfer.state == abstractions.Transfer.DELETED
+    assert transfer.end_time == delete_time
+    assert engine.get_num_active() == 0
+    assert transfer.link.active_transfers == 0
+    assert transfer.linkselector.total_transferred == 1000
+    assert transfer.dst_rse.used_storage == 0
+    assert monitoring.data.transfer_num_deleted == 1
+    assert monitoring.data.transfer_num_completed == 0
+
+
+def test_fluid_delete_before_completion():
+    rucio, transfer = make_transfer(100, 1000)
+    env = simpy.Environment()
+    engine = FluidTransferEngine(env)
+    deletion = env.timeout(4)
+    deletion.callbacks.append(lambda event: rucio.remove_file(transfer.file, env.now))
+    engine.submit([transfer])
+    env.run()
+
+    assert transfer.state == abstractions.Transfer.DELETED
+    assert transfer.linkselector.total_transferred == 400
+    assert engine.get_num_active() == 0
+
+
+UPDATE_DELAY = 20
+# (link bandwidths, file sizes) of every linkselector; the transfers of a
+# linkselector start together
+LINK_SETUPS = [([100], [2000]), ([1000], [3 * 10**6]), ([100], [4000, 4000]), ([300, 100], [3000, 3000])]
+
+
+def run_engine(create_engine):
+    utils.setup_utils()
+    monitoring.init()
+    rucio = grid.Rucio()
+    dst_site = grid.Site('dst', 'dst')
+    dst_rse = rucio.create_rse(dst_site, 'DST')
+    env = simpy.Environment()
+    engine = create_engine(env)
+    transfers = []
+    for ls_nr, (bandwidths, file_sizes) in enumerate(LINK_SETUPS):
+        src_site = grid.Site('src{}'.format(ls_nr), 'src')
+        src_rse = rucio.create_rse(src_site, 'SRC{}'.format(ls_nr))
+        linkselector = src_site.create_linkselector(dst_site)
+        for bandwidth in bandwidths:
+            linkselector.create_link(bandwidth)
+        for file_nr, file_size in enumerate(file_sizes):
+            file_obj = rucio.create_file('file{}_{}'.format(ls_nr, file_nr), file_size, 10**9)
+            src_rse.create_replicas_bulk([file_obj], 0)
+            transfers.append(rucio.create_transfer(file_obj, src_rse, dst_rse))
+    # the polling model cannot update transfers that began at time 0, both
+    # engines begin them at the first tick
+    engine.start()
+    env.run(until=UPDATE_DELAY)
+    engine.submit(transfers)
+    env.run(until=10**4)
+    return transfers
+
+
+@pytest.mark.parametrize('tolerance', [0, UPDATE_DELAY, 600])
+def test_fluid_matches_polling(tolerance):
+    polling_transfers = run_engine(lambda env: PollingTransferEngine(env, UPDATE_DELAY))
+    fluid_transfers = run_engine(lambda env: FluidTransferEngine(env, tolerance))
+    for polling_transfer, fluid_transfer in zip(polling_transfers, fluid_transfers):
+        assert polling_transfer.state == fluid_transfer.state == abstractions.Transfer.COMPLETE
+        assert abs(polling_transfer.end_time - fluid_transfer.end_time) <= UPDATE_DELAY + tolerance
+        assert polling_transfer.dst_replica.size == fluid_transfer.dst_replica.size == fluid_transfer.file.size
+        assert polling_transfer.linkselector.total_transferred == fluid_transfer.linkselector.total_transferred